@@ -1,10 +1,87 @@
 # Author: Aditi Jha, November 4, 2024
 
-from flask import Flask, jsonify, request
+import base64
+import hmac
+import json
+import os
+import threading
+from flask import Flask, Response, jsonify, make_response, request, stream_with_context
+import bulk
+import cache
+import events
+import metrics
 import movies
 import books  
+import profiler
+import storage
+import summary
 import tv_shows
+import unified
+from json_provider import FastJSONProvider, json_array
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+metrics.init_app(app)
+
+# Serve all three categories from the unified database (see unified.py)
+# instead of their own files when UNIFIED_DATABASE names its path
+UNIFIED = bool(os.environ.get("UNIFIED_DATABASE"))
+if UNIFIED:
+    unified.DATABASE = os.environ["UNIFIED_DATABASE"]
+    movies, tv_shows, books = unified.movies, unified.tv_shows, unified.books
+
+# Every call from the routes into the domain modules is timed for /metrics
+movies, tv_shows, books = (metrics.instrument(movies, "movies"), metrics.instrument(tv_shows, "tv_shows"),
+                           metrics.instrument(books, "books"))
+unified = metrics.instrument(unified, "unified")
+# Exports stream after the handler returns, so only the imports are timed
+bulk = metrics.instrument(bulk, "bulk", only=("import_titles", "import_reviews"))
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Shared handling for the list endpoints (GET /movies, /tv_shows, /books):
+#   no paging args      -> the full list, as before
+#   ?limit=N&after=ID   -> {"items": [...], "next": ID or null}, keyset paged on id
+#   ?format=ndjson      -> one JSON object per line, streamed from the DB cursor
+# `view_rows(limit, after)` and `iter_rows(after)` return (id, JSON text) rows
+# that SQLite has already encoded; they go into the response as they are.
+def list_response(view_rows, iter_rows):
+    args = request.args
+    try:
+        after = int(args.get("after", 0))
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "limit and after must be integers"}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+
+    if args.get("format") == "ndjson":
+        lines = (text + "\n" for _, text in iter_rows(after))
+        return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+    if "limit" not in args and "after" not in args:
+        return jsonify(json_array(view_rows()))
+    rows = view_rows(limit, after)
+    next_cursor = rows[-1][0] if len(rows) == limit else None
+    return jsonify({"items": json_array(rows), "next": next_cursor})
+
+# Conditional GET for the catalog and review endpoints: the ETag is the
+# database's change counter token, read before the body is built, so a client
+# polling with If-None-Match gets an empty 304 until something is written.
+def conditional_response(data_version, build):
+    etag = data_version()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = make_response(build())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag)
+    # Clients may keep the body but must revalidate before reusing it
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# The home page document, rebuilt in the background and served from memory
+home = summary.Summary({"movies": movies, "tv_shows": tv_shows, "books": books})
 
 # Implementing REST API for my movie tab for our review app, author: Aditi, updated december 2, 2024
 
@@ -43,11 +120,12 @@ def delete_movie(movie_id):
 
 @app.route('/movies', methods=['GET'])
 def view_reviews():
-    return jsonify(movies.view_reviews())
+    return conditional_response(movies.data_version, lambda: list_response(
+        movies.view_reviews_json, movies.iter_reviews_json))
 
 @app.route('/movies/<int:movie_id>/reviews', methods=['GET'])
 def search_reviews(movie_id):
-    return jsonify(movies.search_reviews(movie_id))
+    return conditional_response(movies.data_version, lambda: jsonify(movies.search_reviews(movie_id)))
 
 
 @app.route('/movies/genre', methods=['GET'])
@@ -72,19 +150,21 @@ def search_by_genre():
 @app.route('/books', methods=['GET'])
 def get_books():
     try:
-        data = books.view_books()  # Correct function from books.py
-        return jsonify(data), 200
+        return conditional_response(books.data_version, lambda: list_response(
+            books.view_books_json, books.iter_books_json))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # Get a single book by ID
 @app.route('/books/<int:book_id>', methods=['GET'])
 def get_single_book(book_id):
-    try:
+    def build():
         book = books.search_reviews(book_id)  # Retrieves book and its reviews
         if book:
             return jsonify(book), 200
         return jsonify({"error": "Book not found"}), 404
+    try:
+        return conditional_response(books.data_version, build)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -204,11 +284,12 @@ def delete_tv_show(tv_show_id):
 
 @app.route('/tv_shows', methods=['GET'])
 def view_tv_reviews():
-    return jsonify(tv_shows.view_reviews())
+    return conditional_response(tv_shows.data_version, lambda: list_response(
+        tv_shows.view_reviews_json, tv_shows.iter_reviews_json))
 
 @app.route('/tv_shows/<int:tv_show_id>/reviews', methods=['GET'])
 def search_tv_reviews(tv_show_id):
-    return jsonify(tv_shows.search_reviews(tv_show_id))
+    return conditional_response(tv_shows.data_version, lambda: jsonify(tv_shows.search_reviews(tv_show_id)))
 
 @app.route('/tv_shows/genre', methods=['GET'])
 def search_tv_by_genre():
@@ -223,5 +304,326 @@ def search_tv_by_genre():
         return jsonify({"error": "An error occurred while searching by genre."}), 500
 
 
+# Bulk import and export, shared by all three categories
+CATEGORY_RULE = "<any(movies, tv_shows, books):category>"
+
+def bulk_unavailable():
+    return jsonify({"error": "Bulk import and export need the per-category databases"}), 501
+
+def bulk_import(category, import_rows):
+    if UNIFIED:
+        return bulk_unavailable()
+    fmt = bulk.request_format(request.content_type, request.args.get("format"))
+    if fmt is None:
+        return jsonify({"error": "Send NDJSON (application/x-ndjson) or CSV (text/csv)"}), 415
+    lines = (line.decode("utf-8") for line in request.stream)
+    return jsonify(import_rows(category, bulk.parse_records(lines, fmt))), 200
+
+def bulk_export(category, export_rows):
+    if UNIFIED:
+        return bulk_unavailable()
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in bulk.FORMATS:
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+    return Response(stream_with_context(export_rows(category, fmt)), mimetype=bulk.FORMATS[fmt])
+
+@app.route(f'/{CATEGORY_RULE}/bulk', methods=['POST'])
+def import_titles(category):
+    return bulk_import(category, bulk.import_titles)
+
+@app.route(f'/{CATEGORY_RULE}/reviews/bulk', methods=['POST'])
+def import_reviews(category):
+    return bulk_import(category, bulk.import_reviews)
+
+@app.route(f'/{CATEGORY_RULE}/export', methods=['GET'])
+def export_titles(category):
+    return bulk_export(category, bulk.export_titles)
+
+@app.route(f'/{CATEGORY_RULE}/reviews/export', methods=['GET'])
+def export_reviews(category):
+    return bulk_export(category, bulk.export_reviews)
+
+
+# Reviews for many titles in one request: POST /<category>/reviews:batchGet
+# with {"ids": [1, 2, ...]} returns {"items": [...]}, one search_reviews
+# result per id in the order given (an "error" entry for unknown ids).
+MAX_BATCH_IDS = 1000
+
+@app.route(f'/{CATEGORY_RULE}/reviews:batchGet', methods=['POST'])
+def batch_get_reviews(category):
+    ids = (request.get_json(silent=True) or {}).get("ids")
+    if not isinstance(ids, list) or not all(type(item_id) is int for item_id in ids):
+        return jsonify({"error": "ids must be a list of integers"}), 400
+    if not 1 <= len(ids) <= MAX_BATCH_IDS:
+        return jsonify({"error": f"ids must hold between 1 and {MAX_BATCH_IDS} ids"}), 400
+    module = {"movies": movies, "tv_shows": tv_shows, "books": books}[category]
+    return jsonify({"items": module.search_reviews_many(ids)})
+
+# Sorted catalog pages for the frontend's tables: GET /<category>/catalog
+# ?sort=id|title|genre|rating&order=asc|desc&limit=N&after=CURSOR returns
+# {"items": [...], "next": CURSOR or null}. Titles carry their review count and
+# average rating instead of their reviews. Pages are keyset paged, so each one
+# costs the same however deep it is; the cursor is opaque to clients.
+def encode_cursor(after):
+    return base64.urlsafe_b64encode(json.dumps(after, separators=(",", ":")).encode()).decode()
+
+def decode_cursor(cursor):
+    """Returns the (sort value, id) in a cursor from encode_cursor, or None if it isn't one."""
+    try:
+        after = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        return None
+    if not (isinstance(after, list) and len(after) == 2 and type(after[1]) is int
+            and (after[0] is None or type(after[0]) in (str, int, float))):
+        return None
+    return tuple(after)
+
+@app.route(f'/{CATEGORY_RULE}/catalog', methods=['GET'])
+def catalog_page(category):
+    module = {"movies": movies, "tv_shows": tv_shows, "books": books}[category]
+    args = request.args
+    sort, order = args.get("sort", "id"), args.get("order", "asc")
+    if sort not in storage.CATALOG_SORTS or order not in ("asc", "desc"):
+        return jsonify({"error": f"sort must be one of {', '.join(storage.CATALOG_SORTS)} "
+                                 "and order asc or desc"}), 400
+    try:
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+    after = None
+    if "after" in args:
+        after = decode_cursor(args["after"])
+        if after is None:
+            return jsonify({"error": "after must be a cursor from a previous page"}), 400
+
+    def build():
+        items, next_after = module.view_catalog_page(sort, order == "desc", limit, after)
+        return jsonify({"items": items, "next": encode_cursor(next_after) if next_after else None})
+    return conditional_response(module.data_version, build)
+
+
+# Delta sync for indexers: GET /<category>/changes?since=VERSION&limit=N
+# returns {"items": [...], "next": VERSION, "more": bool}, the titles and
+# reviews inserted, updated ("op": "upsert", with their current values) or
+# deleted ("op": "delete") after `since`, oldest first. Start from since=0
+# and pass `next` back each time; while `more` is true there are more changes
+# waiting. Each row carries the version of its last change, so a call costs
+# as much as there are changes to return, whatever the size of the catalog.
+@app.route(f'/{CATEGORY_RULE}/changes', methods=['GET'])
+def changes(category):
+    module = {"movies": movies, "tv_shows": tv_shows, "books": books}[category]
+    try:
+        since = int(request.args.get("since", 0))
+        limit = int(request.args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "since and limit must be integers"}), 400
+    if since < 0:
+        return jsonify({"error": "since must be a version from a previous response, or 0"}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+
+    def build():
+        rows = module.view_changes_json(since, limit)
+        return jsonify({"items": json_array(rows), "next": rows[-1][0] if rows else since,
+                        "more": len(rows) == limit})
+    return conditional_response(module.data_version, build)
+
+# Full-text search across all three categories
+SEARCH_CATEGORIES = {"movies": movies.search, "tv_shows": tv_shows.search, "books": books.search}
+
+@app.route('/search', methods=['GET'])
+def search():
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "Query is required"}), 400
+    category = request.args.get("category")
+    if category and category not in SEARCH_CATEGORIES:
+        return jsonify({"error": f"Unknown category '{category}'"}), 400
+    try:
+        limit = int(request.args.get("limit", 20))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+
+    results = []
+    for name, search_category in SEARCH_CATEGORIES.items():
+        if category in (None, name):
+            results.extend(dict(hit, category=name) for hit in search_category(query, limit))
+    # bm25 scores are negative; the lowest score is the best match
+    results.sort(key=lambda hit: hit["score"])
+    return jsonify(results[:limit])
+
+
+# Cross-category queries, answered by single queries on the unified database
+def unified_only(query, default_limit=10):
+    if not UNIFIED:
+        return jsonify({"error": "Cross-category queries need the unified database (set UNIFIED_DATABASE)"}), 501
+    try:
+        limit = int(request.args.get("limit", default_limit))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+    return jsonify(query(limit))
+
+@app.route('/top_rated', methods=['GET'])
+def top_rated():
+    min_reviews = request.args.get("min_reviews", 1, type=int)
+    return unified_only(lambda limit: unified.top_rated(limit, min_reviews))
+
+@app.route('/genres', methods=['GET'])
+def genre_summary():
+    return unified_only(unified.genre_summary, MAX_PAGE_SIZE)
+
+@app.route('/genres/<genre>/reviews', methods=['GET'])
+def reviews_by_genre(genre):
+    return unified_only(lambda limit: unified.reviews_by_genre(genre, limit))
+
+
+# Health checks for the load balancer. /health answers as long as the process
+# is serving; /ready only once warm_up() has run in this process and every
+# database answers, so traffic is routed only to warm workers.
+ready = threading.Event()
+
+def warm_up():
+    """Opens each database (applying pending schema migrations), fills the
+    read cache with the first catalog pages, and marks the process ready."""
+    # data_version() opens each database and records the version the cache is filled at
+    for module in (movies, tv_shows, books):
+        module.data_version()
+    # Called as list_response() calls them, so the cache keys match
+    movies.view_reviews_json(DEFAULT_PAGE_SIZE, 0)
+    tv_shows.view_reviews_json(DEFAULT_PAGE_SIZE, 0)
+    books.view_books_json(DEFAULT_PAGE_SIZE, 0)
+    home.start()
+    ready.set()
+
+@app.route('/home', methods=['GET'])
+def home_summary():
+    """Counts, genres and best-rated titles of every category in one document,
+    at most summary.MAX_STALENESS seconds old (the Age header says how old)."""
+    # Started by warm_up(); this only covers processes that skipped it, and
+    # costs an attribute check once the thread runs
+    home.start()
+    body, etag, age = home.get()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Age"] = str(int(age))
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# Change events as server-sent events: GET /events?category=movies,books
+# streams movie_added, review_edited, show_deleted, ... as the domain writes
+# succeed (in every worker when server.py shares the event log). A reconnecting client sends Last-Event-ID and gets
+# what it missed, if it is still in the broker's history. A client that falls
+# more than events.BUFFER events behind gets a final "dropped" event and should
+# reload what it shows before subscribing again. Served by this WSGI app (the
+# Flask development server), each stream holds a server thread until a
+# heartbeat fails to reach a gone client; server.py and asgi.py serve the
+# same stream on their event loop instead.
+EVENTS_HEARTBEAT = 15.0
+
+@app.route('/events', methods=['GET'])
+def event_stream():
+    try:
+        categories, last_id = events.parse_request(request.args.get("category"),
+                                                   request.headers.get("Last-Event-ID"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    subscription = events.broker.subscribe(categories, last_id=last_id)
+
+    def stream():
+        try:
+            # Sent at once, so clients and proxies see the stream open
+            yield ": connected\n\n"
+            while True:
+                try:
+                    batch = subscription.wait(EVENTS_HEARTBEAT)
+                except events.Dropped as e:
+                    yield events.format_dropped(e)
+                    return
+                if batch:
+                    yield "".join(events.format_event(event) for event in batch)
+                else:
+                    yield ": heartbeat\n\n"
+        finally:
+            subscription.close()
+    response = Response(stream(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({"status": "ok"})
+
+@app.route('/ready', methods=['GET'])
+def readiness():
+    if not ready.is_set():
+        return jsonify({"status": "starting"}), 503
+    try:
+        for module in (movies, tv_shows, books):
+            module.data_version()
+    except Exception as e:
+        return jsonify({"status": "unavailable", "error": str(e)}), 503
+    return jsonify({"status": "ready"})
+
+
+# Read cache counters (hits, misses, evictions, expirations, invalidations)
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(cache.stats())
+
+# Admin endpoints. When ADMIN_TOKEN is set they need a matching X-Admin-Token
+# header; they only affect the worker process that answers the request.
+def admin_denied():
+    token = os.environ.get("ADMIN_TOKEN")
+    if token and not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), token):
+        return jsonify({"error": "Admin token required"}), 403
+    return None
+
+PROFILER_ORDERS = ("total_ms", "calls", "mean_ms", "max_ms", "rows")
+
+# SQL profiler (see profiler.py): GET reports the top statements by total time
+# and the slow-query log; POST {"enabled": true, "threshold_ms": 50,
+# "duration": 300} starts a fresh profile, {"enabled": false} stops it.
+@app.route('/admin/profiler', methods=['GET', 'POST'])
+def sql_profiler():
+    denied = admin_denied()
+    if denied:
+        return denied
+    limit = request.args.get("limit", 20, type=int)
+    order = request.args.get("order", "total_ms")
+    if order not in PROFILER_ORDERS:
+        return jsonify({"error": f"order must be one of {', '.join(PROFILER_ORDERS)}"}), 400
+    if request.method == 'GET':
+        return jsonify(profiler.report(limit, order))
+    data = request.get_json(silent=True) or {}
+    if data.get("enabled", True):
+        try:
+            threshold_ms = float(data.get("threshold_ms", profiler.DEFAULT_THRESHOLD_MS))
+            duration = float(data["duration"]) if data.get("duration") is not None else None
+        except (TypeError, ValueError):
+            return jsonify({"error": "threshold_ms and duration must be numbers"}), 400
+        profiler.enable(threshold_ms, duration)
+        return jsonify(profiler.report(limit, order))
+    finished = profiler.disable()
+    report = finished.report(limit, order) if finished else {}
+    return jsonify(dict(report, enabled=False))
+
+# Request counts, latency and database time histograms for Prometheus
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 if __name__ == '__main__':
+    # Development server; see server.py for production
+    warm_up()
     app.run(debug=True)
\ No newline at end of file
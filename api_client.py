@@ -0,0 +1,307 @@
+# HTTP client layer used by the Gradio frontend to talk to the Flask API
+# Client keeps one requests.Session whose connection pool holds keep-alive
+# connections across calls, with timeouts and retry with exponential backoff.
+# AsyncClient does the same on asyncio streams, so async Gradio handlers wait
+# on the API without holding a worker thread. InProcessClient has the same
+# interface but serves the requests from api.app inside the frontend's own
+# process, for single-box deployments; connect() picks one of the two.
+
+import asyncio
+import json
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_BASE_URL = "http://127.0.0.1:5000"
+# Seconds to connect, and to wait for the response
+TIMEOUT = (3.05, 10)
+RETRIES = 3
+BACKOFF = 0.2
+POOL_SIZE = 10
+# Only methods that are safe to repeat are retried after the request was sent;
+# failures to connect are retried for every method.
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "PUT", "DELETE", "OPTIONS"])
+RETRY_STATUSES = (502, 503, 504)
+# Threads running in-process requests, i.e. the most SQLite calls in flight at once
+IN_PROCESS_WORKERS = 32
+# Frontend backends for connect()
+BACKENDS = ("http", "inprocess")
+
+# AsyncClient.request takes a `json` argument like requests does
+_json_dumps = json.dumps
+
+
+class Client:
+    """Blocking API client sharing one pooled keep-alive session between threads."""
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, timeout=TIMEOUT, retries=RETRIES,
+                 backoff=BACKOFF, pool_size=POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=IDEMPOTENT_METHODS, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        # The urllib3 pool behind the session is thread-safe; the session's
+        # cookie jar isn't, but the API doesn't set cookies.
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, self.base_url + path, **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncResponse:
+    """The parts of requests.Response the frontend handlers use."""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def json(self):
+        # Raised as requests' JSONDecodeError, a RequestException, like Response.json()
+        try:
+            return json.loads(self.text)
+        except ValueError as e:
+            raise requests.exceptions.JSONDecodeError(e.msg, e.doc, e.pos)
+
+
+class AsyncClient:
+    """asyncio API client with a bounded pool of keep-alive HTTP/1.1 connections.
+
+    Errors are raised as requests exceptions (ConnectionError, Timeout) so
+    handlers can share their error handling with the blocking client.
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, timeout=TIMEOUT, retries=RETRIES,
+                 backoff=BACKOFF, pool_size=POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        url = urllib.parse.urlsplit(self.base_url)
+        self._ssl = url.scheme == "https"
+        self._host = url.hostname
+        self._port = url.port or (443 if self._ssl else 80)
+        self._prefix = url.path
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.connections_opened = 0
+        self._loop = None
+        self._idle = []
+        self._slots = None
+
+    def _bind(self):
+        # Connections and the semaphore belong to one event loop; start over
+        # if the client is used from a new one (e.g. a second asyncio.run).
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._idle = []
+            self._slots = asyncio.Semaphore(self.pool_size)
+
+    async def request(self, method, path, params=None, json=None, headers=None):
+        self._bind()
+        # Percent-encoded as UTF-8 like requests does for Client; the head
+        # itself must stay latin-1.
+        target = requests.utils.requote_uri(self._prefix + path)
+        if params:
+            target += "?" + urllib.parse.urlencode(params)
+        body = b"" if json is None else _json_dumps(json).encode("utf-8")
+        head = (f"{method} {target} HTTP/1.1\r\nHost: {self._host}:{self._port}\r\n"
+                f"Accept: application/json\r\nContent-Length: {len(body)}\r\n")
+        if json is not None:
+            head += "Content-Type: application/json\r\n"
+        for name, value in (headers or {}).items():
+            head += f"{name}: {value}\r\n"
+        message = (head + "\r\n").encode("latin-1") + body
+
+        connect_timeout, read_timeout = self.timeout
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._slots:
+                    response = await self._send(method, message, connect_timeout, read_timeout)
+            except _Unsent as e:
+                error = e.__cause__
+            except asyncio.TimeoutError:
+                raise requests.exceptions.Timeout(f"{method} {target} timed out")
+            except (OSError, asyncio.IncompleteReadError) as e:
+                if method not in IDEMPOTENT_METHODS:
+                    raise requests.exceptions.ConnectionError(str(e))
+                error = e
+            else:
+                if response.status_code not in RETRY_STATUSES or method not in IDEMPOTENT_METHODS \
+                        or attempt == self.retries:
+                    return response
+                error = None
+            if attempt < self.retries:
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+        raise requests.exceptions.ConnectionError(f"{method} {target} failed: {error}")
+
+    async def _send(self, method, message, connect_timeout, read_timeout):
+        reused = bool(self._idle)
+        if reused:
+            reader, writer = self._idle.pop()
+        else:
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self._host, self._port, ssl=self._ssl or None), connect_timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                raise _Unsent() from e
+            self.connections_opened += 1
+        try:
+            writer.write(message)
+            await writer.drain()
+            status, headers, content, keep_alive = await asyncio.wait_for(
+                _read_response(reader, method), read_timeout)
+        except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError) as e:
+            writer.close()
+            # The server may close an idle connection just as we reuse it;
+            # nothing was answered, so the request can be sent again.
+            if reused and not getattr(e, "partial", b""):
+                raise _Unsent() from e
+            raise
+        except BaseException:
+            writer.close()
+            raise
+        if keep_alive:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        return AsyncResponse(status, headers, content)
+
+    async def get(self, path, **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request("POST", path, **kwargs)
+
+    async def put(self, path, **kwargs):
+        return await self.request("PUT", path, **kwargs)
+
+    async def delete(self, path, **kwargs):
+        return await self.request("DELETE", path, **kwargs)
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+
+
+class InProcessClient:
+    """AsyncClient's interface served by api.app in this process.
+
+    Each request is dispatched straight to its route function, and through it
+    to the movies, tv_shows and books modules on this process's connection
+    pool, on a bounded thread pool so the event loop never waits on SQLite.
+    There is no socket, HTTP parsing or retrying. The routes, validation and
+    status codes are api.py's own, so handlers format the same output as
+    over HTTP.
+    """
+
+    def __init__(self, app=None, max_workers=IN_PROCESS_WORKERS):
+        if app is None:
+            import api
+            api.warm_up()
+            app = api.app
+        self.app = app
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="in-process")
+
+    def dispatch(self, method, path, params=None, json=None, headers=None):
+        """Runs one request through the app's routing and handlers (blocking)."""
+        with self.app.test_request_context(path, method=method, query_string=params, json=json, headers=headers):
+            response = self.app.full_dispatch_request()
+            content = response.get_data()
+        headers = {name.lower(): value for name, value in response.headers.items()}
+        return AsyncResponse(response.status_code, headers, content)
+
+    async def request(self, method, path, params=None, json=None, headers=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.dispatch, method, path, params, json, headers)
+
+    async def get(self, path, **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request("POST", path, **kwargs)
+
+    async def put(self, path, **kwargs):
+        return await self.request("PUT", path, **kwargs)
+
+    async def delete(self, path, **kwargs):
+        return await self.request("DELETE", path, **kwargs)
+
+    async def close(self):
+        pass
+
+
+def connect(backend="http", base_url=DEFAULT_BASE_URL, **kwargs):
+    """Returns the frontend's client: an AsyncClient for the API at `base_url`
+    ("http"), or an InProcessClient serving the routes itself ("inprocess")."""
+    if backend == "http":
+        return AsyncClient(base_url, **kwargs)
+    if backend == "inprocess":
+        return InProcessClient(**kwargs)
+    raise ValueError(f"backend must be one of {', '.join(BACKENDS)}, not {backend!r}")
+
+
+class _Unsent(Exception):
+    """The request never reached the server, so it is safe to retry."""
+
+
+
+async def _read_response(reader, method):
+    """Reads one response; returns (status, headers, body, whether the connection can be reused)."""
+    version, status, _ = (await reader.readuntil(b"\r\n")).decode("latin-1").split(" ", 2)
+    status = int(status)
+    headers = {}
+    while True:
+        line = await reader.readuntil(b"\r\n")
+        if line == b"\r\n":
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection != "close" and (version == "HTTP/1.1" or connection == "keep-alive")
+
+    if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+        return status, headers, b"", keep_alive
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        chunks = []
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            if size == 0:
+                # Skip trailers up to the blank line
+                while await reader.readuntil(b"\r\n") != b"\r\n":
+                    pass
+                break
+            chunks.append((await reader.readexactly(size + 2))[:-2])
+        return status, headers, b"".join(chunks), keep_alive
+    if "content-length" in headers:
+        return status, headers, await reader.readexactly(int(headers["content-length"])), keep_alive
+    # No framing: the body runs until the server closes the connection
+    return status, headers, await reader.read(), False
+
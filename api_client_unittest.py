@@ -0,0 +1,206 @@
+# Unit Tests for the pooled HTTP client layer used by the Gradio frontend
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from werkzeug.serving import make_server
+import api_client
+import cache
+import movies
+import storage
+from api import app
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Keep-alive HTTP/1.1 server answering 503 to the first `failures` requests."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.respond()
+
+    def respond(self):
+        server = self.server
+        server.requests += 1
+        status = 503 if server.requests <= server.failures else 200
+        body = json.dumps({"requests": server.requests, "path": self.path}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_stub(failures=0):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.requests = 0
+    server.failures = failures
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class TestApiClient(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Serving the Flask app on a free port for the whole class."""
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        cls.server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        """Pointing the movies module at a fresh database."""
+        self.saved = movies.DATABASE
+        movies.DATABASE = "test_client_movies.db"
+
+    def tearDown(self):
+        storage.close_all()
+        if os.path.exists(movies.DATABASE):
+            os.remove(movies.DATABASE)
+        movies.DATABASE = self.saved
+
+    def test_client_round_trip(self):
+        """Testing that the blocking client posts and reads through one session."""
+        client = api_client.Client(self.base_url)
+        response = client.post("/movies", json={"name": "Inception", "genre": "Sci-Fi"})
+        self.assertEqual(response.status_code, 201)
+        response = client.get("/movies", params={"limit": 10})
+        self.assertEqual([m["name"] for m in response.json()["items"]], ["Inception"])
+        client.close()
+
+    def test_client_retries_unavailable(self):
+        """Testing that GETs are retried on 503 with backoff."""
+        stub = start_stub(failures=2)
+        try:
+            client = api_client.Client(f"http://127.0.0.1:{stub.server_port}", backoff=0)
+            response = client.get("/movies")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(stub.requests, 3)
+        finally:
+            stub.shutdown()
+
+    def test_async_client_round_trip(self):
+        """Testing that concurrent async requests all succeed against the API."""
+        client = api_client.AsyncClient(self.base_url)
+
+        async def run():
+            response = await client.post("/movies", json={"name": "Inception", "genre": "Sci-Fi"})
+            self.assertEqual(response.status_code, 201)
+            responses = await asyncio.gather(*[client.get("/movies/1/reviews") for _ in range(20)])
+            self.assertTrue(all(r.json()["name"] == "Inception" for r in responses))
+            await client.close()
+        asyncio.run(run())
+
+    def test_async_client_encodes_non_ascii_paths(self):
+        """Testing that non-ASCII paths and params are sent percent-encoded, as the blocking client sends them."""
+        stub = start_stub()
+        try:
+            base_url = f"http://127.0.0.1:{stub.server_port}"
+            client = api_client.AsyncClient(base_url)
+
+            async def run():
+                response = await client.get("/genres/Comédie/reviews", params={"q": "Amélie"})
+                await client.close()
+                return response
+            response = asyncio.run(run())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["path"], "/genres/Com%C3%A9die/reviews?q=Am%C3%A9lie")
+            blocking = api_client.Client(base_url)
+            self.assertEqual(blocking.get("/genres/Comédie/reviews", params={"q": "Amélie"}).json()["path"],
+                             response.json()["path"])
+            blocking.close()
+        finally:
+            stub.shutdown()
+
+    def test_async_client_reuses_connections(self):
+        """Testing that sequential requests share one keep-alive connection."""
+        stub = start_stub()
+        try:
+            client = api_client.AsyncClient(f"http://127.0.0.1:{stub.server_port}")
+
+            async def run():
+                for _ in range(5):
+                    self.assertEqual((await client.get("/movies")).status_code, 200)
+                await client.close()
+            asyncio.run(run())
+            self.assertEqual(client.connections_opened, 1)
+        finally:
+            stub.shutdown()
+
+    def test_async_client_retries_only_idempotent_methods(self):
+        """Testing that a 503 is retried for GET but returned as-is for POST."""
+        stub = start_stub(failures=1)
+        try:
+            client = api_client.AsyncClient(f"http://127.0.0.1:{stub.server_port}", backoff=0)
+
+            async def run():
+                self.assertEqual((await client.post("/movies", json={})).status_code, 503)
+                stub.requests = 0
+                response = await client.get("/movies")
+                self.assertEqual((response.status_code, response.json()["requests"]), (200, 2))
+                await client.close()
+            asyncio.run(run())
+        finally:
+            stub.shutdown()
+
+    def test_async_client_connection_errors(self):
+        """Testing that an unreachable API raises requests' ConnectionError."""
+        stub = start_stub()
+        port = stub.server_port
+        stub.shutdown()
+        stub.server_close()
+        client = api_client.AsyncClient(f"http://127.0.0.1:{port}", retries=1, backoff=0)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            asyncio.run(client.get("/movies"))
+
+    def test_in_process_client_matches_http(self):
+        """Testing that the frontend's requests get the same status and body in process as over HTTP."""
+        calls = [("POST", "/movies", {"json": {"name": "Inception", "genre": "Sci-Fi"}}),
+                 ("POST", "/movies", {"json": {"name": "No genre"}}),
+                 ("POST", "/movies/1/reviews", {"json": {"rating": 4.5, "note": "Dreamy"}}),
+                 ("POST", "/movies/1/reviews", {"json": {"rating": 3.0, "note": "Long"}}),
+                 ("PUT", "/movies/1/reviews/2", {"json": {"rating": 3.5, "note": "Still long"}}),
+                 ("GET", "/movies", {}),
+                 ("GET", "/movies/genre", {"params": {"genre": "Sci-Fi"}}),
+                 ("GET", "/movies/1/reviews", {}),
+                 ("GET", "/movies/99/reviews", {}),
+                 ("DELETE", "/movies/1/reviews/1", {}),
+                 ("DELETE", "/movies/1", {}),
+                 ("GET", "/nowhere", {})]
+
+        async def run(client):
+            results = []
+            for method, path, kwargs in calls:
+                response = await client.request(method, path, **kwargs)
+                results.append((method, path, response.status_code, response.content))
+            await client.close()
+            return results
+
+        over_http = asyncio.run(run(api_client.connect("http", self.base_url)))
+        storage.close_all()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(movies.DATABASE + suffix):
+                os.remove(movies.DATABASE + suffix)
+        cache.clear()
+        in_process = asyncio.run(run(api_client.InProcessClient(app)))
+        self.assertEqual(in_process, over_http)
+        self.assertEqual(over_http[7][2], 200)
+        self.assertEqual(json.loads(in_process[7][3])["reviews"][1]["note"], "Still long")
+        with self.assertRaises(ValueError):
+            api_client.connect("carrier-pigeon")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,23 @@
+import os
 import gradio as gr
 import requests
+import api_client
+import catalog_view
 import movies
 import tv_shows
 import books
 
 # Base URL of the Flask API
 BASE_URL = "http://127.0.0.1:5000"
+# "http" calls the API at BASE_URL; "inprocess" serves the same routes inside
+# this process, so a single-box deployment doesn't need api.py running
+BACKEND = os.environ.get("FRONTEND_BACKEND", "http")
+# One client shared by every handler: pooled keep-alive connections, or the
+# in-process app. The handlers are async, so waiting on it doesn't hold one of
+# Gradio's worker threads.
+api = api_client.connect(BACKEND, BASE_URL)
+# Handlers per event that Gradio's queue may run at once
+CONCURRENCY_LIMIT = 32
  
 # Functions to interact with the API
 
@@ -13,14 +25,14 @@ BASE_URL = "http://127.0.0.1:5000"
 # First: Movie Tab functions, Aditi, Dec 2
 
 # Adding a movie
-def add_movie_frontend(movie_name, genre):
+async def add_movie_frontend(movie_name, genre):
     # Aditi, dec 2, 2024
     if not movie_name.strip():
         return "❌ Error: Movie name cannot be empty!"
     if not genre.strip():
         return "❌ Error: Genre cannot be empty!"
     try:
-        response = requests.post(f"{BASE_URL}/movies", json={"name": movie_name, "genre": genre})
+        response = await api.post("/movies", json={"name": movie_name, "genre": genre})
         if response.status_code == 201:
             return response.json().get("message", "✅ Movie added successfully!")
         return f"❌ Error: {response.json().get('error', 'Unexpected error')}"
@@ -28,7 +40,7 @@ def add_movie_frontend(movie_name, genre):
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
 # Adding a review to a movie
-def add_review_frontend(movie_id, rating, note):
+async def add_review_frontend(movie_id, rating, note):
     # Aditi, Dec 2, 2024
     if not movie_id.isdigit():
         return "❌ Error: Movie ID must be an integer!"
@@ -37,8 +49,8 @@ def add_review_frontend(movie_id, rating, note):
     if not note.strip():
         return "❌ Error: Review note cannot be empty!"
     try:
-        response = requests.post(
-            f"{BASE_URL}/movies/{movie_id}/reviews",
+        response = await api.post(
+            f"/movies/{movie_id}/reviews",
             json={"rating": float(rating), "note": note},
         )
         if response.status_code == 201:
@@ -48,13 +60,13 @@ def add_review_frontend(movie_id, rating, note):
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
 # Editing a review
-def edit_review_frontend(movie_id, review_id, rating, note):
+async def edit_review_frontend(movie_id, review_id, rating, note):
     # Aditi, Dec 2, 2024
     if not movie_id.isdigit() or not review_id.isdigit():
         return "❌ Error: Both Movie ID and Review ID must be integers!"
     try:
-        response = requests.put(
-            f"{BASE_URL}/movies/{movie_id}/reviews/{review_id}",
+        response = await api.put(
+            f"/movies/{movie_id}/reviews/{review_id}",
             json={"rating": float(rating), "note": note},
         )
         return response.json().get("message", "✅ Review updated successfully!")
@@ -62,35 +74,35 @@ def edit_review_frontend(movie_id, review_id, rating, note):
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
 # Deleting a review
-def delete_review_frontend(movie_id, review_id):
+async def delete_review_frontend(movie_id, review_id):
     # Aditi, Dec 2, 2024
     if not movie_id.isdigit() or not review_id.isdigit():
         return "❌ Error: Both Movie ID and Review ID must be integers!"
     try:
-        response = requests.delete(f"{BASE_URL}/movies/{movie_id}/reviews/{review_id}")
+        response = await api.delete(f"/movies/{movie_id}/reviews/{review_id}")
         return response.json().get("message", "✅ Review deleted successfully!")
     except requests.exceptions.RequestException as e:
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
 # Deleting a movie
-def delete_movie_frontend(movie_id):
+async def delete_movie_frontend(movie_id):
     # Aditi, Dec 2, 2024
     if not movie_id.isdigit():
         return "❌ Error: Movie ID must be an integer!"
     try:
-        response = requests.delete(f"{BASE_URL}/movies/{movie_id}")
+        response = await api.delete(f"/movies/{movie_id}")
         return response.json().get("message", "✅ Movie deleted successfully!")
     except requests.exceptions.RequestException as e:
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
 
 # Searching by genre
-def search_by_genre_frontend(genre):
+async def search_by_genre_frontend(genre):
     # Aditi, Dec 2, 2024
     if not genre.strip():
         return "❌ Error: Genre cannot be empty!"
     try:
-        response = requests.get(f"{BASE_URL}/movies/genre", params={"genre": genre})
+        response = await api.get("/movies/genre", params={"genre": genre})
         if response.status_code == 200:
             movies = response.json()
             if not movies:
@@ -104,37 +116,13 @@ def search_by_genre_frontend(genre):
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
 
-# Viewing all movies
-def view_movies_frontend():
-    # Aditi, Dec 2, 2024
-    try:
-        response = requests.get(f"{BASE_URL}/movies")
-        if response.status_code == 200:
-            movies = response.json()
-            if not movies:
-                return "🎥 No movies found. Add some to get started!"
-            output = ["🎥 Movie List:"]
-            for movie in movies:
-                output.append(f"Movie #{movie['id']}: {movie['name']} (Genre: {movie['genre']})")
-                if not movie["reviews"]:
-                    output.append("   No reviews yet.")
-                else:
-                    for review in movie["reviews"]:
-                        output.append(
-                            f"   Review #{review['review_id']} | Rating: {review['rating']}/5 | {review['note']}"
-                        )
-            return "\n".join(output)
-        return f"❌ Error: {response.json().get('error', 'Unexpected error')}"
-    except requests.exceptions.RequestException as e:
-        return f"❌ Error: Failed to connect to the API - {str(e)}"
-
 # Searching reviews by movie ID
-def search_reviews_frontend(movie_id):
+async def search_reviews_frontend(movie_id):
     # Aditi, Dec 2, 2024
     if not movie_id.isdigit():
         return "❌ Error: Movie ID must be an integer!"
     try:
-        response = requests.get(f"{BASE_URL}/movies/{movie_id}/reviews")
+        response = await api.get(f"/movies/{movie_id}/reviews")
         if response.status_code == 200:
             movie = response.json()
             output = [f"🎥 Movie: {movie['name']} (Genre: {movie['genre']})"]
@@ -156,13 +144,13 @@ def search_reviews_frontend(movie_id):
 
 # tv_show 
 
-def add_tv_show_frontend(title, genre):
+async def add_tv_show_frontend(title, genre):
     if not title.strip():
         return "❌ Error: TV Show title cannot be empty!"
     if not genre.strip():
         return "❌ Error: Genre cannot be empty!"
     try:
-        response = requests.post(f"{BASE_URL}/tv_shows", json={"title": title, "genre": genre})
+        response = await api.post("/tv_shows", json={"title": title, "genre": genre})
         if response.status_code == 201:
             return response.json().get("message", "✅ TV Show added successfully!")
         return f"❌ Error: {response.json().get('error', 'Unexpected error')}"
@@ -170,7 +158,7 @@ def add_tv_show_frontend(title, genre):
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
 # Adding a review to a TV show
-def add_tv_review_frontend(tv_show_id, rating, note):
+async def add_tv_review_frontend(tv_show_id, rating, note):
     if not tv_show_id.isdigit():
         return "❌ Error: TV Show ID must be an integer!"
     if not (0 <= float(rating) <= 5):
@@ -178,8 +166,8 @@ def add_tv_review_frontend(tv_show_id, rating, note):
     if not note.strip():
         return "❌ Error: Review note cannot be empty!"
     try:
-        response = requests.post(
-            f"{BASE_URL}/tv_shows/{tv_show_id}/reviews",
+        response = await api.post(
+            f"/tv_shows/{tv_show_id}/reviews",
             json={"rating": float(rating), "note": note},
         )
         if response.status_code == 201:
@@ -189,12 +177,12 @@ def add_tv_review_frontend(tv_show_id, rating, note):
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
 # Editing a review
-def edit_tv_review_frontend(tv_show_id, review_id, rating, note):
+async def edit_tv_review_frontend(tv_show_id, review_id, rating, note):
     if not tv_show_id.isdigit() or not review_id.isdigit():
         return "❌ Error: Both TV Show ID and Review ID must be integers!"
     try:
-        response = requests.put(
-            f"{BASE_URL}/tv_shows/{tv_show_id}/reviews/{review_id}",
+        response = await api.put(
+            f"/tv_shows/{tv_show_id}/reviews/{review_id}",
             json={"rating": float(rating), "note": note},
         )
         return response.json().get("message", "✅ Review updated successfully!")
@@ -202,31 +190,31 @@ def edit_tv_review_frontend(tv_show_id, review_id, rating, note):
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
 # Deleting a review
-def delete_tv_review_frontend(tv_show_id, review_id):
+async def delete_tv_review_frontend(tv_show_id, review_id):
     if not tv_show_id.isdigit() or not review_id.isdigit():
         return "❌ Error: Both TV Show ID and Review ID must be integers!"
     try:
-        response = requests.delete(f"{BASE_URL}/tv_shows/{tv_show_id}/reviews/{review_id}")
+        response = await api.delete(f"/tv_shows/{tv_show_id}/reviews/{review_id}")
         return response.json().get("message", "✅ Review deleted successfully!")
     except requests.exceptions.RequestException as e:
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
 # Deleting a TV show
-def delete_tv_show_frontend(tv_show_id):
+async def delete_tv_show_frontend(tv_show_id):
     if not tv_show_id.isdigit():
         return "❌ Error: TV Show ID must be an integer!"
     try:
-        response = requests.delete(f"{BASE_URL}/tv_shows/{tv_show_id}")
+        response = await api.delete(f"/tv_shows/{tv_show_id}")
         return response.json().get("message", "✅ TV Show deleted successfully!")
     except requests.exceptions.RequestException as e:
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
 # Searching by genre
-def search_tv_by_genre_frontend(genre):
+async def search_tv_by_genre_frontend(genre):
     if not genre.strip():
         return "❌ Error: Genre cannot be empty!"
     try:
-        response = requests.get(f"{BASE_URL}/tv_shows/genre", params={"genre": genre})
+        response = await api.get("/tv_shows/genre", params={"genre": genre})
         if response.status_code == 200:
             tv_shows = response.json()
             if not tv_shows:
@@ -239,35 +227,12 @@ def search_tv_by_genre_frontend(genre):
     except requests.exceptions.RequestException as e:
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
-# Viewing all TV shows
-def view_tv_shows_frontend():
-    try:
-        response = requests.get(f"{BASE_URL}/tv_shows")
-        if response.status_code == 200:
-            tv_shows = response.json()
-            if not tv_shows:
-                return "📺 No TV Shows found. Add some to get started!"
-            output = ["📺 TV Show List:"]
-            for tv_show in tv_shows:
-                output.append(f"TV Show #{tv_show['id']}: {tv_show['title']} (Genre: {tv_show['genre']})")
-                if not tv_show["reviews"]:
-                    output.append("   No reviews yet.")
-                else:
-                    for review in tv_show["reviews"]:
-                        output.append(
-                            f"   Review #{review['review_id']} | Rating: {review['rating']}/5 | {review['note']}"
-                        )
-            return "\n".join(output)
-        return f"❌ Error: {response.json().get('error', 'Unexpected error')}"
-    except requests.exceptions.RequestException as e:
-        return f"❌ Error: Failed to connect to the API - {str(e)}"
-
 # Searching reviews by TV show ID
-def search_tv_reviews_frontend(tv_show_id):
+async def search_tv_reviews_frontend(tv_show_id):
     if not tv_show_id.isdigit():
         return "❌ Error: TV Show ID must be an integer!"
     try:
-        response = requests.get(f"{BASE_URL}/tv_shows/{tv_show_id}/reviews")
+        response = await api.get(f"/tv_shows/{tv_show_id}/reviews")
         if response.status_code == 200:
             tv_show = response.json()
             output = [f"📺 TV Show: {tv_show['title']} (Genre: {tv_show['genre']})"]
@@ -284,13 +249,13 @@ def search_tv_reviews_frontend(tv_show_id):
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
 # Adding a new book
-def add_book(book_title, genre):
+async def add_book(book_title, genre):
     if not book_title.strip():
         return "❌ Error: Book title cannot be empty!"
     if not genre.strip():
         return "❌ Error: Genre cannot be empty!"
     try:
-        response = requests.post(f"{BASE_URL}/books", json={"title": book_title, "genre": genre})
+        response = await api.post("/books", json={"title": book_title, "genre": genre})
         if response.status_code == 201:
             return response.json().get("message", "✅ Book added successfully!")
         return f"❌ Error: {response.json().get('error', 'Unexpected error')}"
@@ -298,7 +263,7 @@ def add_book(book_title, genre):
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
 # Adding a review to a book
-def add_review(book_id, rating, note):
+async def add_review(book_id, rating, note):
     if not book_id.isdigit():
         return "❌ Error: Book ID must be an integer!"
     if not (0 <= float(rating) <= 5):
@@ -306,8 +271,8 @@ def add_review(book_id, rating, note):
     if not note.strip():
         return "❌ Error: Review note cannot be empty!"
     try:
-        response = requests.post(
-            f"{BASE_URL}/books/{book_id}/reviews",
+        response = await api.post(
+            f"/books/{book_id}/reviews",
             json={"rating": float(rating), "note": note},
         )
         if response.status_code == 201:
@@ -317,7 +282,7 @@ def add_review(book_id, rating, note):
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
 # Editing a review
-def edit_review(book_id, review_id, rating=None, note=None):
+async def edit_review(book_id, review_id, rating=None, note=None):
     if not book_id.isdigit() or not review_id.isdigit():
         return "❌ Error: Both Book ID and Review ID must be integers!"
     payload = {}
@@ -330,7 +295,7 @@ def edit_review(book_id, review_id, rating=None, note=None):
     if not payload:
         return "❌ Error: No data provided for update!"
     try:
-        response = requests.put(f"{BASE_URL}/books/{book_id}/reviews/{review_id}", json=payload)
+        response = await api.put(f"/books/{book_id}/reviews/{review_id}", json=payload)
         if response.status_code == 200:
             return response.json().get("message", "✅ Review updated successfully!")
         return f"❌ Error: {response.json().get('error', 'Unexpected error')}"
@@ -338,11 +303,11 @@ def edit_review(book_id, review_id, rating=None, note=None):
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
 # Deleting a book
-def delete_book(book_id):
+async def delete_book(book_id):
     if not book_id.isdigit():
         return "❌ Error: Book ID must be an integer!"
     try:
-        response = requests.delete(f"{BASE_URL}/books/{book_id}")
+        response = await api.delete(f"/books/{book_id}")
         if response.status_code == 200:
             return response.json().get("message", "✅ Book deleted successfully!")
         return f"❌ Error: {response.json().get('error', 'Unexpected error')}"
@@ -350,11 +315,11 @@ def delete_book(book_id):
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
 # Deleting a review
-def delete_review(book_id, review_id):
+async def delete_review(book_id, review_id):
     if not book_id.isdigit() or not review_id.isdigit():
         return "❌ Error: Both Book ID and Review ID must be integers!"
     try:
-        response = requests.delete(f"{BASE_URL}/books/{book_id}/reviews/{review_id}")
+        response = await api.delete(f"/books/{book_id}/reviews/{review_id}")
         if response.status_code == 200:
             return response.json().get("message", "✅ Review deleted successfully!")
         return f"❌ Error: {response.json().get('error', 'Unexpected error')}"
@@ -362,11 +327,11 @@ def delete_review(book_id, review_id):
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
 # Searching books by genre
-def search_books_by_genre(genre):
+async def search_books_by_genre(genre):
     if not genre.strip():
         return "❌ Error: Genre cannot be empty!"
     try:
-        response = requests.get(f"{BASE_URL}/books/genre", params={"genre": genre})
+        response = await api.get("/books/genre", params={"genre": genre})
         if response.status_code == 200:
             books = response.json()
             if not books:
@@ -379,34 +344,11 @@ def search_books_by_genre(genre):
     except requests.exceptions.RequestException as e:
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
-# Viewing all books
-def view_books():
-    try:
-        response = requests.get(f"{BASE_URL}/books")
-        if response.status_code == 200:
-            books = response.json()
-            if not books:
-                return "📚 No books found. Add some to get started!"
-            output = ["📚 Book List:"]
-            for book in books:
-                output.append(f"Book #{book['id']}: {book['title']} (Genre: {book['genre']})")
-                if not book["reviews"]:
-                    output.append("   No reviews yet.")
-                else:
-                    for review in book["reviews"]:
-                        output.append(
-                            f"   Review #{review['review_id']} | Rating: {review['rating']}/5 | {review['note']}"
-                        )
-            return "\n".join(output)
-        return f"❌ Error: {response.json().get('error', 'Unexpected error')}"
-    except requests.exceptions.RequestException as e:
-        return f"❌ Error: Failed to connect to the API - {str(e)}"
-
-def search_book_reviews(book_id):
+async def search_book_reviews(book_id):
     if not book_id.strip().isdigit():
         return "❌ Error: Book ID must be a valid integer!"
     try:
-        response = requests.get(f"{BASE_URL}/books/{book_id}/reviews")
+        response = await api.get(f"/books/{book_id}/reviews")
         if response.status_code == 200:
             reviews = response.json()
             if not reviews:
@@ -419,6 +361,34 @@ def search_book_reviews(book_id):
     except requests.exceptions.RequestException as e:
         return f"❌ Error: Failed to connect to the API - {str(e)}"
 
+# Catalog tables: a page at a time, sorted by the API (see catalog_view.py).
+# One pager per category caches rendered pages for every session.
+movie_pages = catalog_view.CatalogPager(api, "movies", "name")
+tv_show_pages = catalog_view.CatalogPager(api, "tv_shows", "title")
+book_pages = catalog_view.CatalogPager(api, "books", "title")
+
+def catalog_table(pager, empty):
+    """Adds a paged, sortable table of `pager`'s catalog to the current layout."""
+    state = gr.State(None)
+    with gr.Row():
+        sort = gr.Dropdown(list(catalog_view.SORTS), value="ID", label="Sort by")
+        order = gr.Radio(list(catalog_view.ORDERS), value="Ascending", label="Order")
+    table = gr.Dataframe(headers=catalog_view.COLUMNS, interactive=False)
+    with gr.Row():
+        first_btn = gr.Button("⏮ First")
+        prev_btn = gr.Button("◀ Previous")
+        next_btn = gr.Button("Next ▶")
+        status = gr.Markdown()
+
+    def handler(move):
+        async def handle(state_value, sort_label, order_label):
+            return await catalog_view.show(pager, state_value, sort_label, order_label, move, empty)
+        return handle
+
+    for event, move in ((first_btn.click, "first"), (prev_btn.click, "prev"), (next_btn.click, "next"),
+                        (sort.change, "first"), (order.change, "first"), (demo.load, "first")):
+        event(handler(move), inputs=[state, sort, order], outputs=[table, status, state])
+
 # Gradio Interface
 # Rebecca Rogovich
 
@@ -494,11 +464,8 @@ with gr.Blocks() as demo:
             search_reviews_output = gr.Textbox(label="Reviews", interactive=False)
             search_reviews_btn.click(search_reviews_frontend, inputs=search_movie_id_input, outputs=search_reviews_output)
 
-        with gr.Row():
-            gr.Markdown("## View Movies")
-            view_movies_btn = gr.Button("View All Movies")
-            movies_display = gr.Textbox(label="Movie List", interactive=False)
-            view_movies_btn.click(view_movies_frontend, inputs=[], outputs=movies_display)
+        gr.Markdown("## View Movies")
+        catalog_table(movie_pages, "🎥 No movies found. Add some to get started!")
 
 #TV Shows Tab
 
@@ -574,11 +541,8 @@ with gr.Blocks() as demo:
             search_tv_reviews_output = gr.Textbox(label="Reviews", interactive=False)
             search_tv_reviews_btn.click(search_tv_reviews_frontend, inputs=search_tv_show_id_input, outputs=search_tv_reviews_output)
 
-        with gr.Row():
-            gr.Markdown("## View TV Shows")
-            view_tv_shows_btn = gr.Button("View All TV Shows")
-            tv_shows_display = gr.Textbox(label="TV Show List", interactive=False)
-            view_tv_shows_btn.click(view_tv_shows_frontend, inputs=[], outputs=tv_shows_display)
+        gr.Markdown("## View TV Shows")
+        catalog_table(tv_show_pages, "📺 No TV Shows found. Add some to get started!")
 
 
 # Books Tab
@@ -652,11 +616,8 @@ with gr.Blocks() as demo:
             search_reviews_output = gr.Textbox(label="Reviews", interactive=False)
             search_reviews_btn.click(search_book_reviews, inputs=search_book_id_input, outputs=search_reviews_output)
 
-        with gr.Row():
-            gr.Markdown("## View Books")
-            view_books_btn = gr.Button("View All Books")
-            books_display = gr.Textbox(label="Book List", interactive=False)
-            view_books_btn.click(view_books, inputs=[], outputs=books_display)
+        gr.Markdown("## View Books")
+        catalog_table(book_pages, "📚 No books found. Add some to get started!")
 
 
 
@@ -664,7 +625,7 @@ with gr.Blocks() as demo:
 
 
 if __name__ == "__main__":
-    demo.launch( debug=True)
+    demo.queue(default_concurrency_limit=CONCURRENCY_LIMIT).launch(debug=True)
 
 
 
@@ -0,0 +1,201 @@
+# ASGI entry point for the review API
+# Serves api.app -- the same routes and JSON as `python api.py` -- from an
+# asyncio event loop. a2wsgi's WSGIMiddleware runs each request's handler,
+# and with it every blocking movies/tv_shows/books call, on a bounded thread
+# pool, streaming request and response bodies between the loop and the pool
+# thread, so a slow SQLite call holds one pool thread while the loop keeps
+# accepting connections, and bulk imports and NDJSON exports never sit in
+# memory whole. AsgiApp adds what the adapter leaves out:
+#   * requests beyond the pool wait in a bounded queue; past that they get 503;
+#   * a response whose client has disconnected stops being produced, so an
+#     abandoned export does not keep its pool thread busy to the end;
+#   * GET /events streams are served on the loop itself, so an idle SSE
+#     client holds no thread, and a client that disconnects is noticed at
+#     once and unsubscribed;
+#   * lifespan startup warms the process up, and in each process of
+#     `uvicorn --workers N` switches events to the shared event log, so every
+#     worker's clients see every write.
+# Usage: uvicorn asgi:app --port 5000 [--workers N]   (or python asgi.py)
+
+import asyncio
+import json
+import multiprocessing
+import threading
+import urllib.parse
+from a2wsgi import WSGIMiddleware
+import api
+import events
+
+# Threads running handlers, i.e. the most SQLite calls in flight at once
+MAX_WORKERS = 32
+# Requests allowed to wait for a free thread before new ones get 503
+MAX_PENDING = 1024
+# Scope key of the threading.Event set once a request's client has disconnected
+DISCONNECTED = "api.disconnected"
+
+
+class Interruptible:
+    """A WSGI response iterable that stops once its client has disconnected,
+    closing the app's iterable (and with it a streamed cursor)."""
+
+    def __init__(self, result, disconnected):
+        self.result = result
+        self.disconnected = disconnected
+
+    def __iter__(self):
+        for chunk in self.result:
+            if self.disconnected.is_set():
+                return
+            yield chunk
+
+    def close(self):
+        if hasattr(self.result, "close"):
+            self.result.close()
+
+
+def interruptible(wsgi_app):
+    """Wraps a WSGI app run by WSGIMiddleware so its responses stop on disconnect."""
+    def application(environ, start_response):
+        # The body stream ends where the request does, even without Content-Length
+        environ["wsgi.input_terminated"] = True
+        result = wsgi_app(environ, start_response)
+        return Interruptible(result, environ["asgi.scope"][DISCONNECTED])
+    return application
+
+
+class AsgiApp:
+    """Runs a WSGI app under ASGI, one pool thread per request in flight."""
+
+    def __init__(self, wsgi_app, max_workers=MAX_WORKERS, max_pending=MAX_PENDING):
+        self.wsgi_app = wsgi_app
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.middleware = WSGIMiddleware(interruptible(wsgi_app), workers=max_workers)
+        self.executor = self.middleware.executor
+        self.active = 0  # requests running or queued; only touched on the loop
+        self.rejected = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+    async def lifespan(self, receive, send):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # uvicorn starts each of its --workers (and a --reload server) in
+                # a child process; the in-process Broker would only see its own writes
+                if multiprocessing.parent_process() is not None:
+                    events.configure(database=events.shared_database())
+                await loop.run_in_executor(self.executor, api.warm_up)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def http(self, scope, receive, send):
+        if scope["method"] == "GET" and route_path(scope) == "/events":
+            if await self.event_stream(scope, receive, send):
+                return
+        if self.active >= self.max_workers + self.max_pending:
+            self.rejected += 1
+            await reject(send)
+            return
+        # The request's messages all go through one listener, which keeps
+        # receiving after the body to notice the client leaving; the bounded
+        # queue keeps an upload from being read ahead of the app.
+        disconnected = threading.Event()
+        messages = asyncio.Queue(1)
+        listener = asyncio.ensure_future(listen(receive, messages, disconnected))
+        self.active += 1
+        try:
+            await self.middleware({**scope, DISCONNECTED: disconnected}, messages.get, send)
+        finally:
+            self.active -= 1
+            listener.cancel()
+
+    async def event_stream(self, scope, receive, send):
+        """Streams GET /events from the loop; returns False, leaving the request
+        to the WSGI app and its error response, if the request is invalid."""
+        query = urllib.parse.parse_qs(scope["query_string"].decode("latin-1"))
+        headers = dict(scope["headers"])
+        try:
+            categories, last_id = events.parse_request(
+                query.get("category", [None])[0],
+                headers[b"last-event-id"].decode("latin-1") if b"last-event-id" in headers else None)
+        except ValueError:
+            return False
+        loop = asyncio.get_running_loop()
+        # A SharedBroker reads its log on subscribe, which is no work for the loop
+        subscription = await loop.run_in_executor(
+            self.executor, lambda: events.broker.subscribe(categories, last_id=last_id))
+        disconnected = asyncio.ensure_future(until_disconnect(receive))
+        try:
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type", b"text/event-stream; charset=utf-8"),
+                                    (b"cache-control", b"no-cache"),
+                                    (b"x-accel-buffering", b"no")]})
+            await send({"type": "http.response.body", "body": b": connected\n\n", "more_body": True})
+            while True:
+                waiting = asyncio.ensure_future(subscription.wait_async(api.EVENTS_HEARTBEAT))
+                await asyncio.wait((waiting, disconnected), return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    waiting.cancel()
+                    return True
+                try:
+                    batch = waiting.result()
+                except events.Dropped as e:
+                    await send({"type": "http.response.body", "body": events.format_dropped(e).encode(),
+                                "more_body": False})
+                    return True
+                text = "".join(events.format_event(event) for event in batch) if batch else ": heartbeat\n\n"
+                await send({"type": "http.response.body", "body": text.encode(), "more_body": True})
+        finally:
+            disconnected.cancel()
+            subscription.close()
+
+
+def route_path(scope):
+    """The request path the app routes on, without the root_path it is mounted at."""
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    return path[len(root_path):] if root_path and path.startswith(root_path) else path
+
+
+async def listen(receive, messages, disconnected):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            disconnected.set()
+        await messages.put(message)
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def until_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def reject(send):
+    body = json.dumps({"error": "Server is busy, try again shortly"}).encode()
+    await send({"type": "http.response.start", "status": 503,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode()),
+                            (b"retry-after", b"1")]})
+    await send({"type": "http.response.body", "body": body})
+
+
+app = AsgiApp(api.app)
+
+
+if __name__ == "__main__":
+    # The ASGI server is only needed to run this file directly
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=5000)
@@ -0,0 +1,272 @@
+# Unit Tests for the ASGI entry point, driving the ASGI callable directly
+# and, for the /events streams, over real connections to uvicorn
+
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import unittest
+from unittest import mock
+import uvicorn
+import api
+import asgi
+import events
+import movies
+import storage
+from api import app as flask_app
+
+def call(application, method, path, body=b"", query=b"", chunks=None, root_path="", leave_after=None):
+    """Sends one request through `application`; returns (status, headers, body messages).
+    Like a server, it reports the disconnect once the response is complete, or
+    once `leave_after` body messages have arrived."""
+    incoming = [{"type": "http.request", "body": chunk, "more_body": True} for chunk in (chunks or [])]
+    incoming.append({"type": "http.request", "body": body, "more_body": False})
+    sent = []
+
+    async def run():
+        complete = asyncio.Event()
+
+        async def receive():
+            if incoming:
+                return incoming.pop(0)
+            await complete.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                complete.set()
+            if leave_after is not None and len(sent) > leave_after:
+                complete.set()
+
+        scope = {"type": "http", "http_version": "1.1", "method": method, "path": root_path + path,
+                 "root_path": root_path, "query_string": query,
+                 "headers": [(b"content-type", b"application/json")],
+                 "server": ("127.0.0.1", 5000), "client": ("127.0.0.1", 40000)}
+        await application(scope, receive, send)
+    asyncio.run(run())
+    start = sent[0]
+    return start["status"], dict(start["headers"]), [m["body"] for m in sent[1:]]
+
+def not_found(environ, start_response):
+    start_response("404 Not Found", [("Content-Type", "text/plain")])
+    return [b"not found"]
+
+def start_and_stop(application):
+    """Runs `application`'s lifespan startup and shutdown."""
+    async def run():
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            pass
+        await application({"type": "lifespan"}, receive, send)
+    asyncio.run(run())
+
+def report_broker(queue):
+    """Child process, like each of `uvicorn asgi:app --workers N`: starts asgi.app
+    and reports the broker it publishes to."""
+    api.warm_up = lambda: None
+    start_and_stop(asgi.app)
+    queue.put((type(events.broker).__name__, getattr(events.broker, "database", None)))
+    events.broker.close()
+
+class TestAsgi(unittest.TestCase):
+
+    def setUp(self):
+        """Pointing the movies module at a fresh database."""
+        self.saved = movies.DATABASE
+        movies.DATABASE = "test_asgi_movies.db"
+        self.app = asgi.AsgiApp(flask_app, max_workers=4)
+
+    def tearDown(self):
+        self.app.executor.shutdown()
+        storage.close_all()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(movies.DATABASE + suffix):
+                os.remove(movies.DATABASE + suffix)
+        movies.DATABASE = self.saved
+
+    def test_same_responses_as_flask(self):
+        """Testing that routes answer with the same status and JSON as the Flask app."""
+        status, _, _ = call(self.app, "POST", "/movies", json.dumps({"name": "Heat", "genre": "Crime"}).encode())
+        self.assertEqual(status, 201)
+        status, headers, body = call(self.app, "GET", "/movies/1/reviews")
+        expected = flask_app.test_client().get("/movies/1/reviews")
+        self.assertEqual((status, json.loads(b"".join(body))), (200, expected.get_json()))
+        self.assertEqual(headers[b"etag"], expected.headers["ETag"].encode())
+        self.assertEqual(call(self.app, "GET", "/nowhere")[0], 404)
+
+    def test_request_body_arrives_in_chunks(self):
+        """Testing that a body split across ASGI messages is read whole."""
+        body = json.dumps({"name": "Heat", "genre": "Crime"}).encode()
+        status, _, _ = call(self.app, "POST", "/movies", body[8:], chunks=[body[:3], b"", body[3:8]])
+        self.assertEqual(status, 201)
+
+    def test_ndjson_export_streams(self):
+        """Testing that a streamed response is sent as several body messages."""
+        for n in range(3):
+            call(self.app, "POST", "/movies", json.dumps({"name": f"Movie {n}", "genre": "Drama"}).encode())
+        status, _, body = call(self.app, "GET", "/movies", query=b"format=ndjson")
+        self.assertEqual(status, 200)
+        self.assertGreater(len(body), 3)
+        self.assertEqual([json.loads(line)["name"] for line in b"".join(body).splitlines()],
+                         ["Movie 0", "Movie 1", "Movie 2"])
+
+    def test_streamed_response_stops_when_client_disconnects(self):
+        """Testing that a streamed response stops being produced, and is closed,
+        once its client has gone, leaving its pool thread free."""
+        produced = []
+        closed = threading.Event()
+
+        def export(environ, start_response):
+            start_response("200 OK", [("Content-Type", "application/x-ndjson")])
+
+            def rows():
+                try:
+                    for n in range(10000):
+                        produced.append(n)
+                        yield b"{}\n"
+                finally:
+                    closed.set()
+            return rows()
+        app = asgi.AsgiApp(export, max_workers=1)
+        status, _, _ = call(app, "GET", "/movies/export", leave_after=3)
+        self.assertEqual(status, 200)
+        self.assertTrue(closed.is_set())
+        self.assertLess(len(produced), 100)
+        app.executor.shutdown()
+
+    def test_event_streams_under_a_root_path(self):
+        """Testing that /events is streamed from the loop when the app is mounted under a root_path."""
+        app = asgi.AsgiApp(not_found, max_workers=1)
+        status, headers, body = call(app, "GET", "/events", query=b"category=movies", root_path="/api",
+                                     leave_after=1)
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b"content-type"], b"text/event-stream; charset=utf-8")
+        self.assertEqual(body[0], b": connected\n\n")
+        self.assertEqual(call(app, "GET", "/movies", root_path="/api")[0], 404)
+        app.executor.shutdown()
+
+    def test_uvicorn_workers_share_the_event_log(self):
+        """Testing that each process uvicorn starts switches to the shared event log,
+        while a single-process server keeps events in memory."""
+        saved_broker = events.broker
+        try:
+            with mock.patch.object(api, "warm_up"):
+                start_and_stop(asgi.AsgiApp(not_found))
+            self.assertIs(events.broker, saved_broker)
+        finally:
+            events.broker = saved_broker
+        context = multiprocessing.get_context("spawn")
+        queue = context.Queue()
+        with mock.patch.dict(os.environ, {"EVENTS_DATABASE": "test_asgi_events.db"}):
+            worker = context.Process(target=report_broker, args=(queue,))
+            worker.start()
+        try:
+            self.assertEqual(queue.get(timeout=30), ("SharedBroker", "test_asgi_events.db"))
+        finally:
+            worker.join(10)
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists("test_asgi_events.db" + suffix):
+                    os.remove("test_asgi_events.db" + suffix)
+        self.assertEqual(worker.exitcode, 0)
+
+    def test_full_queue_gets_503(self):
+        """Testing that requests past the pool and queue are rejected, not queued."""
+        release = threading.Event()
+
+        def slow_app(environ, start_response):
+            release.wait(5)
+            start_response("200 OK", [("Content-Type", "text/plain")])
+            return [b"done"]
+        app = asgi.AsgiApp(slow_app, max_workers=1, max_pending=1)
+
+        async def run():
+            async def one():
+                sent = []
+                async def receive():
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                async def send(message):
+                    sent.append(message)
+                    if message["type"] == "http.response.start" and message["status"] == 503:
+                        release.set()
+                scope = {"type": "http", "http_version": "1.1", "method": "GET", "path": "/",
+                         "query_string": b"", "headers": []}
+                await app(scope, receive, send)
+                return sent[0]["status"]
+            return await asyncio.gather(one(), one(), one())
+        self.assertEqual(sorted(asyncio.run(run())), [200, 200, 503])
+        self.assertEqual(app.rejected, 1)
+        app.executor.shutdown()
+
+    def test_event_streams_hold_no_threads(self):
+        """Testing over real connections that /events streams take no pool threads,
+        get their events, and are unsubscribed as soon as the client disconnects."""
+        saved_broker, saved_heartbeat = events.broker, api.EVENTS_HEARTBEAT
+        events.broker = events.Broker(coalesce=0.001)
+        api.EVENTS_HEARTBEAT = 0.1
+        app = asgi.AsgiApp(flask_app, max_workers=2)
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, lifespan="off", log_level="error",
+                                               timeout_graceful_shutdown=1))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        streams = []
+        try:
+            while not server.started:
+                time.sleep(0.01)
+            address = server.servers[0].sockets[0].getsockname()
+
+            def request(method, path, body=b""):
+                connection = socket.create_connection(address, timeout=5)
+                connection.sendall(f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Type: application/json\r\n"
+                                   f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+                return connection
+
+            def read_until(connection, marker):
+                data = b""
+                while marker not in data:
+                    chunk = connection.recv(65536)
+                    self.assertTrue(chunk, f"connection closed before {marker!r}")
+                    data += chunk
+                return data
+
+            events.broker.subscribe().close()  # starts the dispatcher thread
+            threads = threading.active_count() + app.max_workers
+            # Five times the pool, all subscribed at once
+            for _ in range(10):
+                streams.append(request("GET", "/events?category=movies"))
+                read_until(streams[-1], b": connected")
+            self.assertEqual(events.broker.subscribers, 10)
+            self.assertEqual(app.active, 0)
+            self.assertLessEqual(threading.active_count(), threads)
+            self.assertIn(b"201 Created", read_until(request("POST", "/movies", b'{"name": "Heat", "genre": "Crime"}'),
+                                                     b"successfully"))
+            for stream in streams:
+                read_until(stream, b"event: movie_added")
+            for stream in streams:
+                stream.close()
+            streams = []
+            for _ in range(500):
+                if events.broker.subscribers == 0:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(events.broker.subscribers, 0)
+            self.assertLessEqual(threading.active_count(), threads)
+            self.assertIn(b"400 Bad Request", read_until(request("GET", "/events?category=games"), b"Unknown"))
+        finally:
+            for stream in streams:
+                stream.close()
+            server.should_exit = True
+            thread.join(5)
+            app.executor.shutdown()
+            events.broker.close()
+            events.broker, api.EVENTS_HEARTBEAT = saved_broker, saved_heartbeat
+
+if __name__ == '__main__':
+    unittest.main()
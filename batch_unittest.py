@@ -0,0 +1,81 @@
+# Unit Tests for the batch review lookup (search_reviews_many and POST /<category>/reviews:batchGet)
+
+import os
+import unittest
+from unittest import mock
+import api
+import books
+import cache
+import movies
+import storage
+import tv_shows
+import unified
+
+TEST_DATABASES = {movies: 'test_batch_movies.db', tv_shows: 'test_batch_tv_shows.db',
+                  books: 'test_batch_books.db', unified: 'test_batch_unified.db'}
+
+class TestBatchGet(unittest.TestCase):
+
+    def setUp(self):
+        """Adding five titles per category; the first has two reviews and the last none."""
+        self.saved = {module: module.DATABASE for module in TEST_DATABASES}
+        for module, path in TEST_DATABASES.items():
+            module.DATABASE = path
+        cache.configure()
+        for add_title, module in ((movies.add_movie, movies), (tv_shows.add_show, tv_shows),
+                                  (books.add_book, books), (unified.movies.add_movie, unified.movies)):
+            for number in range(1, 6):
+                add_title(f"Title {number}", "Drama")
+            module.add_review(1, 4, "First")
+            module.add_review(3, 2, "Third")
+            module.add_review(1, 5, "Again")
+        self.client = api.app.test_client()
+
+    def tearDown(self):
+        storage.close_all()
+        for module, path in TEST_DATABASES.items():
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            module.DATABASE = self.saved[module]
+        cache.configure()
+
+    def test_matches_search_reviews(self):
+        """Testing that each result equals search_reviews for that id, in request order, unknown ids included."""
+        ids = [5, 1, 42, 3, 1]
+        for module in (movies, tv_shows, books, unified.movies):
+            cache.clear()
+            self.assertEqual(module.search_reviews_many(ids), [module.search_reviews(item_id) for item_id in ids])
+
+    def test_one_query_per_chunk(self):
+        """Testing that the ids are fetched with one statement per chunk of storage.IN_CHUNK."""
+        cache.configure(backend=cache.NullCache())
+        statements = []
+        movies.get_connection().set_trace_callback(statements.append)
+        with mock.patch.object(storage, "IN_CHUNK", 2):
+            results = movies.search_reviews_many([1, 2, 3, 4, 5])
+        movies.get_connection().set_trace_callback(None)
+        self.assertEqual([movie["id"] for movie in results], [1, 2, 3, 4, 5])
+        self.assertEqual(len([sql for sql in statements if "IN (" in sql]), 3)
+
+    def test_shares_the_search_reviews_cache(self):
+        """Testing that batch results fill the per-title cache, cached titles skip the query, and writes invalidate."""
+        movies.search_reviews_many([1, 2])
+        hits = cache.stats()["hits"]
+        movies.search_reviews(1)
+        self.assertEqual(cache.stats()["hits"], hits + 1)
+        movies.add_review(1, 3, "Later")
+        self.assertEqual(len(movies.search_reviews_many([1, 2])[0]["reviews"]), 3)
+
+    def test_endpoint(self):
+        """Testing the batchGet route for every category and its validation."""
+        for category, module in (("movies", movies), ("tv_shows", tv_shows), ("books", books)):
+            response = self.client.post(f"/{category}/reviews:batchGet", json={"ids": [3, 9, 1]})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()["items"], [module.search_reviews(item_id) for item_id in (3, 9, 1)])
+        for body in ({}, {"ids": []}, {"ids": ["1"]}, {"ids": [True]}, {"ids": list(range(api.MAX_BATCH_IDS + 1))}):
+            self.assertEqual(self.client.post("/movies/reviews:batchGet", json=body).status_code, 400)
+        self.assertEqual(self.client.post("/games/reviews:batchGet", json={"ids": [1]}).status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
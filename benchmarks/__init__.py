@@ -0,0 +1,2 @@
+# Performance benchmarks for the review app backends.
+# Run a benchmark module directly, e.g. `python -m benchmarks.storage_bench`.
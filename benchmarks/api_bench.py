@@ -0,0 +1,354 @@
+# Scenario benchmarks for every route in api.py, with JSON results for comparing commits
+# Usage: python -m benchmarks.api_bench [--titles N] [--reviews M] [--requests R]
+#            [--transport test_client http] [--output results.json] [--compare baseline.json]
+#
+# Each run generates the same databases (benchmarks.datagen) and sends the same
+# requests: ids, genres and search words are drawn from per-scenario seeded
+# streams, and title ids follow the data's Zipf popularity. Every transport
+# starts from its own copy of the databases. "test_client" calls the Flask app
+# in-process; "http" goes through werkzeug's threaded server in a child process,
+# as `python api.py` runs it. Requests are sent one at a time, so the numbers
+# are per-route latencies; see asgi_bench and client_bench for concurrency.
+#
+# Reads run first, then writes in a fixed order (add titles and reviews, edit
+# and delete those reviews, delete those titles, bulk imports). New rows get
+# predictable ids, so the writes touch rows the run created itself.
+#
+# --output writes a JSON file of per-scenario latency percentiles plus the
+# commit, Python and SQLite versions; --compare prints p50 and p95 changes
+# against an earlier file and exits with status 1 if any scenario got slower
+# than --tolerance.
+
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+import requests
+from werkzeug.serving import make_server
+
+import books
+import bulk
+import cache
+import movies
+import storage
+import tv_shows
+from benchmarks import datagen
+
+MODULES = {"movies": movies, "tv_shows": tv_shows, "books": books}
+# Route of a single title's reviews
+REVIEWS_ROUTE = {"movies": "/movies/{}/reviews", "tv_shows": "/tv_shows/{}/reviews", "books": "/books/{}"}
+# Title field of the POST bodies
+TITLE_FIELD = {category: spec["columns"][0] for category, spec in bulk.CATEGORIES.items()}
+SEARCH_WORDS = ["river", "empire", "brilliant", "ending", "silent storm", "director", "finale", "prose"]
+WRITES_PER_SCENARIO = 50
+BULK_ROWS = 200
+
+
+class Scenario:
+    """One route under test. `make(rng, n)` returns the n-th request as
+    (path, json body or None, raw body or None, headers or None).
+
+    `share` scales the request count for expensive routes (full lists,
+    exports); writes run a fixed WRITES_PER_SCENARIO times.
+    """
+
+    def __init__(self, name, method, route, make, share=1.0, write=False):
+        self.name = name
+        self.method = method
+        self.route = route
+        self.make = make
+        self.share = share
+        self.write = write
+
+    def count(self, requests_per_scenario):
+        if self.write:
+            return WRITES_PER_SCENARIO
+        return max(3, int(requests_per_scenario * self.share))
+
+
+def get(path, headers=None):
+    return path, None, None, headers
+
+
+def scenarios(n_titles, m_reviews, seed):
+    """Every benchmarked request, reads first. Ids rely on the generated data."""
+    reads, writes = [], []
+    for category in MODULES:
+        # Title ids drawn with the same skew as the generated reviews
+        hot = datagen.ZipfSampler(datagen.ranking(category, n_titles, seed))
+        base = f"/{category}"
+        reads += [
+            Scenario(f"{category}.list_page", "GET", base,
+                     lambda rng, n, base=base: get(f"{base}?limit=100&after={rng.randrange(n_titles)}")),
+            Scenario(f"{category}.list_first_page", "GET", base, lambda rng, n, base=base: get(f"{base}?limit=100")),
+            Scenario(f"{category}.list_full", "GET", base, lambda rng, n, base=base: get(base), share=0.02),
+            Scenario(f"{category}.list_ndjson", "GET", base,
+                     lambda rng, n, base=base: get(f"{base}?format=ndjson"), share=0.02),
+            Scenario(f"{category}.title_reviews", "GET", REVIEWS_ROUTE[category].format("<id>"),
+                     lambda rng, n, category=category, hot=hot: get(REVIEWS_ROUTE[category].format(hot(rng)))),
+            Scenario(f"{category}.batch_get_100", "POST", f"{base}/reviews:batchGet",
+                     lambda rng, n, base=base: (f"{base}/reviews:batchGet",
+                                                {"ids": rng.sample(range(1, n_titles + 1), 100)}, None, None)),
+            Scenario(f"{category}.genre", "GET", f"{base}/genre",
+                     lambda rng, n, base=base: get(f"{base}/genre?genre={rng.choice(datagen.GENRES)}"), share=0.1),
+            Scenario(f"{category}.export", "GET", f"{base}/export", lambda rng, n, base=base: get(f"{base}/export"),
+                     share=0.02),
+            Scenario(f"{category}.reviews_export", "GET", f"{base}/reviews/export",
+                     lambda rng, n, base=base: get(f"{base}/reviews/export"), share=0.02),
+        ]
+
+        # Writes: titles n_titles+1.., reviews m_reviews+1.. in the order they are added
+        new_title = lambda rng, n, category=category: (
+            f"/{category}", {TITLE_FIELD[category]: f"Bench title {n}", "genre": rng.choice(datagen.GENRES)}, None, None)
+        new_review = lambda rng, n, category=category, hot=hot: (
+            f"/{category}/{hot(rng)}/reviews", {"rating": rng.randint(1, 5), "note": datagen.note(rng)}, None, None)
+        review_path = lambda n, category=category: (
+            f"/{category}/{REVIEW_OWNERS[category][n]}/reviews/{m_reviews + n + 1}")
+        edit_review = lambda rng, n, review_path=review_path: (
+            review_path(n), {"rating": rng.randint(1, 5), "note": "Edited"}, None, None)
+        delete_review = lambda rng, n, review_path=review_path: (review_path(n), None, None, None)
+        delete_title = lambda rng, n, category=category: get(f"/{category}/{n_titles + n + 1}")
+        bulk_titles = lambda rng, n, category=category: (
+            f"/{category}/bulk", None,
+            ndjson({TITLE_FIELD[category]: f"Bulk {n}.{i}", "genre": rng.choice(datagen.GENRES)}
+                   for i in range(BULK_ROWS)), {"Content-Type": "application/x-ndjson"})
+        bulk_reviews = lambda rng, n, category=category, hot=hot: (
+            f"/{category}/reviews/bulk", None,
+            ndjson({bulk.CATEGORIES[category]["item_column"]: hot(rng), "rating": rng.randint(1, 5),
+                    "note": datagen.note(rng)} for _ in range(BULK_ROWS)), {"Content-Type": "application/x-ndjson"})
+        writes += [
+            Scenario(f"{category}.add_title", "POST", base, new_title, write=True),
+            Scenario(f"{category}.add_review", "POST", f"{base}/<id>/reviews", new_review, write=True),
+            Scenario(f"{category}.edit_review", "PUT", f"{base}/<id>/reviews/<review_id>", edit_review, write=True),
+            Scenario(f"{category}.delete_review", "DELETE", f"{base}/<id>/reviews/<review_id>", delete_review,
+                     write=True),
+            Scenario(f"{category}.delete_title", "DELETE", f"{base}/<id>", delete_title, write=True),
+            Scenario(f"{category}.bulk_titles", "POST", f"{base}/bulk", bulk_titles, write=True),
+            Scenario(f"{category}.bulk_reviews", "POST", f"{base}/reviews/bulk", bulk_reviews, write=True),
+        ]
+    reads += [
+        Scenario("search", "GET", "/search", lambda rng, n: get(f"/search?q={rng.choice(SEARCH_WORDS)}")),
+        Scenario("search.category", "GET", "/search",
+                 lambda rng, n: get(f"/search?q={rng.choice(SEARCH_WORDS)}&category={rng.choice(list(MODULES))}")),
+        Scenario("health", "GET", "/health", lambda rng, n: get("/health")),
+        Scenario("ready", "GET", "/ready", lambda rng, n: get("/ready")),
+        Scenario("cache_stats", "GET", "/cache/stats", lambda rng, n: get("/cache/stats")),
+        Scenario("metrics", "GET", "/metrics", lambda rng, n: get("/metrics"), share=0.2),
+    ]
+    return reads + writes
+
+
+# category -> the title each benchmark review was added to, by review number;
+# filled in by the add_review scenario so edits and deletes can address them
+REVIEW_OWNERS = {}
+
+
+def ndjson(records):
+    return "".join(json.dumps(record) + "\n" for record in records).encode()
+
+
+def scenario_rng(seed, name):
+    return random.Random(zlib.crc32(f"{seed}:{name}".encode()))
+
+
+class TestClientTransport:
+    name = "test_client"
+
+    def __init__(self, paths):
+        import api
+        for category, path in paths.items():
+            MODULES[category].DATABASE = path
+        api.warm_up()
+        self.client = api.app.test_client()
+
+    def request(self, method, path, json_body, data, headers):
+        response = self.client.open(path, method=method, json=json_body, data=data, headers=headers)
+        response.get_data()
+        return response.status_code
+
+    def close(self):
+        storage.close_all()
+
+
+def serve(paths, ports):
+    """Child process: serves the API on a free port and reports the port."""
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    import api
+    for category, path in paths.items():
+        MODULES[category].DATABASE = path
+    api.warm_up()
+    server = make_server("127.0.0.1", 0, api.app, threaded=True)
+    ports.put(server.port)
+    server.serve_forever()
+
+
+class HttpTransport:
+    name = "http"
+
+    def __init__(self, paths):
+        ports = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=serve, args=(paths, ports), daemon=True)
+        self.process.start()
+        self.base_url = f"http://127.0.0.1:{ports.get(timeout=60)}"
+        self.session = requests.Session()
+
+    def request(self, method, path, json_body, data, headers):
+        response = self.session.request(method, self.base_url + path, json=json_body, data=data, headers=headers)
+        return response.status_code
+
+    def close(self):
+        self.session.close()
+        self.process.terminate()
+        self.process.join()
+
+
+TRANSPORTS = {"test_client": TestClientTransport, "http": HttpTransport}
+
+
+def summarize(scenario, latencies, errors):
+    latencies_ms = sorted(latency * 1e3 for latency in latencies)
+    cuts = statistics.quantiles(latencies_ms, n=100, method="inclusive")
+    return {"method": scenario.method, "route": scenario.route, "requests": len(latencies_ms),
+            "errors": errors, "mean_ms": round(statistics.fmean(latencies_ms), 4),
+            "p50_ms": round(cuts[49], 4), "p95_ms": round(cuts[94], 4), "p99_ms": round(cuts[98], 4),
+            "max_ms": round(latencies_ms[-1], 4), "per_s": round(len(latencies_ms) / (sum(latencies_ms) / 1e3), 1)}
+
+
+def run_scenario(transport, scenario, count, seed, warmup):
+    if not scenario.write:
+        rng = scenario_rng(seed, scenario.name + ":warmup")
+        for n in range(min(warmup, count)):
+            transport.request(scenario.method, *scenario.make(rng, n))
+    rng = scenario_rng(seed, scenario.name)
+    latencies, errors = [], 0
+    for n in range(count):
+        path, json_body, data, headers = scenario.make(rng, n)
+        start = time.perf_counter()
+        status = transport.request(scenario.method, path, json_body, data, headers)
+        latencies.append(time.perf_counter() - start)
+        if status >= 400:
+            errors += 1
+    return summarize(scenario, latencies, errors)
+
+
+def record_review_owners(scenario_list, seed):
+    """Replays the add_review scenarios' draws to learn which title each new review went to."""
+    for scenario in scenario_list:
+        if scenario.name.endswith(".add_review"):
+            rng = scenario_rng(seed, scenario.name)
+            category = scenario.name.split(".")[0]
+            REVIEW_OWNERS[category] = [int(scenario.make(rng, n)[0].split("/")[2]) for n in range(WRITES_PER_SCENARIO)]
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def compare(results, baseline, tolerance):
+    """Prints p50/p95 ratios against `baseline`; returns the scenarios slower than tolerance."""
+    regressions = []
+    for key in ("titles", "reviews", "seed"):
+        before, after = baseline.get("meta", {}).get("args", {}).get(key), results["meta"]["args"][key]
+        if before != after:
+            print(f"Warning: baseline used --{key} {before}, this run {after}; the data differs")
+    print(f"\n{'transport':<12}{'scenario':<28}{'p50 before':>11}{'after':>9}{'change':>9}{'p95 change':>12}")
+    for transport, scenarios_run in results["results"].items():
+        for name, after in scenarios_run.items():
+            before = baseline.get("results", {}).get(transport, {}).get(name)
+            if not before:
+                continue
+            p50 = after["p50_ms"] / before["p50_ms"] - 1 if before["p50_ms"] else 0.0
+            p95 = after["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+            flag = ""
+            if p50 > tolerance:
+                flag = "  SLOWER"
+                regressions.append((transport, name))
+            print(f"{transport:<12}{name:<28}{before['p50_ms']:>11.3f}{after['p50_ms']:>9.3f}"
+                  f"{p50:>+9.1%}{p95:>+12.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-route API benchmark suite")
+    parser.add_argument("--titles", type=int, default=2000, help="titles per category")
+    parser.add_argument("--reviews", type=int, default=20000, help="reviews per category")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=200, help="requests per read scenario")
+    parser.add_argument("--warmup", type=int, default=10, help="untimed requests per read scenario")
+    parser.add_argument("--transport", nargs="+", choices=list(TRANSPORTS), default=list(TRANSPORTS))
+    parser.add_argument("--only", help="run only scenarios whose name contains this text")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="p50 slowdown reported as a regression")
+    args = parser.parse_args()
+
+    commit, dirty = git_commit()
+    results = {"meta": {"commit": commit, "dirty": dirty,
+                        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                        "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                        "platform": platform.platform(), "cpus": os.cpu_count(), "args": vars(args)},
+               "results": {}}
+    scenario_list = [scenario for scenario in scenarios(args.titles, args.reviews, args.seed)
+                     if not args.only or args.only in scenario.name]
+    record_review_owners(scenarios(args.titles, args.reviews, args.seed), args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template")
+        os.mkdir(template)
+        start = time.perf_counter()
+        generated = datagen.populate_all(template, args.titles, args.reviews, args.seed)
+        print(f"Generated {args.titles} titles and {args.reviews} reviews per category "
+              f"in {time.perf_counter() - start:.1f} s (seed {args.seed})")
+        for transport_name in args.transport:
+            # Each transport starts from an untouched copy of the data
+            run_dir = os.path.join(tmp, transport_name)
+            os.mkdir(run_dir)
+            paths = {category: shutil.copy(path, run_dir) for category, path in generated.items()}
+            cache.clear()
+            transport = TRANSPORTS[transport_name](paths)
+            results["results"][transport_name] = {}
+            print(f"\n{transport_name}")
+            print(f"{'scenario':<28}{'n':>6}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}")
+            try:
+                for scenario in scenario_list:
+                    stats = run_scenario(transport, scenario, scenario.count(args.requests), args.seed, args.warmup)
+                    results["results"][transport_name][scenario.name] = stats
+                    print(f"{scenario.name:<28}{stats['requests']:>6}{stats['errors']:>5}{stats['p50_ms']:>9.3f}"
+                          f"{stats['p95_ms']:>9.3f}{stats['p99_ms']:>9.3f}{stats['per_s']:>9.0f}")
+            finally:
+                transport.close()
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} scenario(s) slower than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# Load test: the Flask app on werkzeug's threaded server (`python api.py`)
+# vs the ASGI entry point (asgi.py) on uvicorn, one process each
+# Usage: python -m benchmarks.asgi_bench [--users N] [--calls N] [--workers N]
+#
+# Both servers run in child processes on the same seeded database and get the
+# same request mix from N concurrent users through api_client.AsyncClient.
+# Needs uvicorn installed.
+
+import argparse
+import logging
+import multiprocessing
+import os
+import socket
+import tempfile
+import time
+
+import api_client
+import asgi
+import database_setup
+import movies
+from benchmarks.client_bench import paths, percentiles, run_async, seed, serve
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_asgi(database, port, workers):
+    """Child process: serves the ASGI app with uvicorn."""
+    import uvicorn
+    movies.DATABASE = database
+    application = asgi.AsgiApp(asgi.api.app, max_workers=workers)
+    uvicorn.run(application, host="127.0.0.1", port=port, log_level="error", access_log=False)
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"server on port {port} did not start")
+            time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flask vs ASGI server load test")
+    parser.add_argument("--users", type=int, default=64, help="concurrent requests")
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--titles", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=None, help="ASGI handler threads (default asgi.MAX_WORKERS)")
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # database_setup writes to the working directory
+        os.chdir(tmp)
+        servers = []
+        try:
+            database_setup.initialize_db()
+            movies.DATABASE = os.path.join(tmp, "movie_reviews.db")
+            seed(args.titles)
+            ports = multiprocessing.Queue()
+            flask = multiprocessing.Process(target=serve, args=(movies.DATABASE, ports), daemon=True)
+            flask.start()
+            servers.append(flask)
+            flask_url = f"http://127.0.0.1:{ports.get(timeout=30)}"
+            port = free_port()
+            workers = args.workers or asgi.MAX_WORKERS
+            uvicorn_server = multiprocessing.Process(
+                target=serve_asgi, args=(movies.DATABASE, port, workers), daemon=True)
+            uvicorn_server.start()
+            servers.append(uvicorn_server)
+            asgi_url = f"http://127.0.0.1:{port}"
+            wait_until_up(port)
+
+            work = paths(args.calls, args.titles)
+            print(f"{args.calls} calls, {args.users} concurrent users, {workers} ASGI handler threads")
+            print(f"{'server':<28}{'p50 (ms)':>10}{'p99 (ms)':>10}{'req/s':>10}")
+            for name, base_url in (("Flask (werkzeug threaded)", flask_url), ("ASGI (uvicorn)", asgi_url)):
+                latencies, elapsed = run_async(
+                    args.users, work, api_client.AsyncClient(base_url, pool_size=args.users))
+                p50, p99 = percentiles(latencies)
+                print(f"{name:<28}{p50:>10.2f}{p99:>10.2f}{len(latencies) / elapsed:>10.0f}")
+        finally:
+            for server in servers:
+                server.terminate()
+                server.join()
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Benchmark: throughput of a read-mostly workload with and without the read cache
+# Usage: python -m benchmarks.cache_bench [--ops N] [--write-ratio R]
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import cache
+import database_setup
+import movies
+import storage
+
+
+def seed(titles, reviews_per_title):
+    conn = sqlite3.connect(movies.DATABASE)
+    genres = ["Drama", "Comedy", "Horror", "Sci-Fi", "Animation"]
+    conn.executemany('INSERT INTO movies (name, genre) VALUES (?, ?)',
+                     [(f"Movie {i}", genres[i % len(genres)]) for i in range(titles)])
+    conn.executemany('INSERT INTO reviews (movie_id, rating, note) VALUES (?, ?, ?)',
+                     [(i % titles + 1, i % 6, f"Seed review {i}") for i in range(titles * reviews_per_title)])
+    conn.commit()
+    conn.close()
+
+
+def workload(ops, titles, write_ratio, seed_value=42):
+    """Returns a fixed list of (function, args) calls, skewed towards popular titles."""
+    rng = random.Random(seed_value)
+    popular = lambda: min(titles, int(rng.paretovariate(1.2)))
+    reads = [
+        (movies.search_reviews, lambda: (popular(),)),
+        (movies.view_rating_stats, lambda: (popular(),)),
+        (movies.search_by_genre, lambda: (rng.choice(["Drama", "Comedy", "Horror"]),)),
+        (movies.view_movie_genre, lambda: ()),
+        (movies.view_top_rated, lambda: ()),
+        (movies.view_reviews_page, lambda: (20,)),
+    ]
+    calls = []
+    for _ in range(ops):
+        if rng.random() < write_ratio:
+            calls.append((movies.add_review, (popular(), rng.randint(0, 5), "Benchmark review")))
+        else:
+            func, make_args = rng.choice(reads)
+            calls.append((func, make_args()))
+    return calls
+
+
+def run_workload(calls):
+    """Returns operations per second for the call list."""
+    start = time.perf_counter()
+    for func, args in calls:
+        func(*args)
+    return len(calls) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read cache benchmark")
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--titles", type=int, default=2000)
+    parser.add_argument("--reviews", type=int, default=10, help="reviews per title")
+    parser.add_argument("--write-ratio", type=float, default=0.05)
+    args = parser.parse_args()
+
+    calls = workload(args.ops, args.titles, args.write_ratio)
+    print(f"{args.ops} ops, {args.write_ratio:.0%} writes, {args.titles} titles")
+    print(f"{'cache':<12}{'ops/s':>12}{'hit rate':>10}")
+    results = {}
+    for name, backend in (("off", cache.NullCache()), ("lru", cache.LRUCache(maxsize=1024, ttl=30))):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            # database_setup writes to the working directory
+            os.chdir(tmp)
+            try:
+                movies.DATABASE = os.path.join(tmp, "movie_reviews.db")
+                database_setup.initialize_db()
+                seed(args.titles, args.reviews)
+                cache.configure(backend=backend)
+                results[name] = run_workload(calls)
+            finally:
+                storage.close_all()
+                os.chdir(cwd)
+        stats = backend.stats()
+        lookups = stats.get("hits", 0) + stats.get("misses", 0)
+        hit_rate = f"{stats['hits'] / lookups:.0%}" if lookups else "-"
+        print(f"{name:<12}{results[name]:>12.0f}{hit_rate:>10}")
+    cache.configure()
+    print(f"speedup: {results['lru'] / results['off']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
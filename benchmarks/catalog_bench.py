@@ -0,0 +1,76 @@
+# Catalog view cost against catalog size: the old "View All" request (every
+# title with every review, GET /movies) against one sorted catalog page
+# (GET /movies/catalog) at the start and deep in the catalog, and a "Next"
+# click through the frontend's pager once the page was prefetched
+# Usage: python -m benchmarks.catalog_bench [--sizes 1000 10000 50000] [--reviews-per-title 10]
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+import api
+import api_client
+import cache
+import catalog_view
+import movies
+import storage
+from benchmarks import datagen
+from benchmarks.view_reviews_bench import best_of
+
+PAGE_SIZE = catalog_view.PAGE_SIZE
+
+
+def deep_cursor(client, sort, order, pages):
+    """Walks `pages` pages into the catalog and returns the cursor reached."""
+    after = None
+    for _ in range(pages):
+        query = f"sort={sort}&order={order}&limit={PAGE_SIZE}" + (f"&after={after}" if after else "")
+        after = client.get(f"/movies/catalog?{query}").get_json()["next"]
+    return after
+
+
+async def next_clicks(pager, clicks):
+    """Times "Next" clicks; each page was prefetched while the previous was shown."""
+    timings = []
+    rows, status, state = await catalog_view.show(pager, None, "Rating", "Descending")
+    for _ in range(clicks):
+        await asyncio.sleep(0.005)  # the user reading the page
+        start = time.perf_counter()
+        rows, status, state = await catalog_view.show(pager, state, "Rating", "Descending", "next")
+        timings.append((time.perf_counter() - start) * 1e3)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog view benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--reviews-per-title", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    client = api.app.test_client()
+    print(f"{'titles':>8}{'View All ms':>14}{'page 1 ms':>12}{'deep page ms':>14}{'Next (pager) ms':>17}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache.configure(backend=cache.NullCache())
+            movies.DATABASE = f"{tmp}/movies.db"
+            datagen.populate(movies.DATABASE, "movies", size, size * args.reviews_per_title)
+            try:
+                full = best_of(lambda: client.get("/movies").get_data(), max(1, args.repeat // 10))
+                first = best_of(lambda: client.get(f"/movies/catalog?sort=rating&order=desc&limit={PAGE_SIZE}")
+                                .get_data(), args.repeat)
+                after = deep_cursor(client, "title", "asc", size // PAGE_SIZE // 2)
+                deep = best_of(lambda: client.get(f"/movies/catalog?sort=title&limit={PAGE_SIZE}&after={after}")
+                               .get_data(), args.repeat)
+                cache.configure()
+                pager = catalog_view.CatalogPager(api_client.InProcessClient(api.app), "movies", "name")
+                click = asyncio.run(next_clicks(pager, min(args.repeat, size // PAGE_SIZE - 1)))
+                print(f"{size:>8}{full:>14.1f}{first:>12.2f}{deep:>14.2f}{click:>17.2f}")
+            finally:
+                storage.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# Delta sync cost against catalog size: an indexer re-downloading every title
+# with its reviews (GET /movies) against asking for what changed since its
+# last sync (GET /movies/changes?since=...), with a few changes waiting and
+# with none, plus what the version triggers add to a review write
+# Usage: python -m benchmarks.changes_bench [--sizes 1000 10000 50000] [--changes 10]
+
+import argparse
+import tempfile
+import time
+
+import api
+import cache
+import movies
+import storage
+from benchmarks import datagen
+from benchmarks.view_reviews_bench import best_of
+
+
+def write_us(writes):
+    start = time.perf_counter()
+    for _ in range(writes):
+        movies.add_review(1, 4, "Benchmark")
+    return (time.perf_counter() - start) / writes * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delta sync benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--reviews-per-title", type=int, default=10)
+    parser.add_argument("--changes", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    client = api.app.test_client()
+    print(f"{'titles':>8}{'full ms':>10}{f'{args.changes} changes ms':>16}{'no changes ms':>15}{'write us':>10}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache.configure(backend=cache.NullCache())
+            movies.DATABASE = f"{tmp}/movies.db"
+            datagen.populate(movies.DATABASE, "movies", size, size * args.reviews_per_title)
+            try:
+                full = best_of(lambda: client.get("/movies").get_data(), max(1, args.repeat // 10))
+                since = client.get("/movies/changes?since=0&limit=1000").get_json()["next"]
+                while True:
+                    body = client.get(f"/movies/changes?since={since}&limit=1000").get_json()
+                    since = body["next"]
+                    if not body["more"]:
+                        break
+                write = write_us(args.changes)
+                delta = best_of(lambda: client.get(f"/movies/changes?since={since}").get_data(), args.repeat)
+                latest = client.get(f"/movies/changes?since={since}").get_json()["next"]
+                idle = best_of(lambda: client.get(f"/movies/changes?since={latest}").get_data(), args.repeat)
+                print(f"{size:>8}{full:>10.1f}{delta:>16.2f}{idle:>15.2f}{write:>10.0f}")
+            finally:
+                storage.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# Load test: frontend-to-API call latency with per-call requests, the pooled
+# blocking client and the async client
+# Usage: python -m benchmarks.client_bench [--users N] [--calls N]
+#
+# Serves api.app on a free port from a child process (werkzeug's threaded
+# server, as `python api.py` does) and has N concurrent users make the calls
+# a frontend handler makes: one GET and decoding its JSON body. werkzeug
+# closes every connection after the response, so keep-alive reuse only shows
+# up behind a production server.
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+import api_client
+import database_setup
+import movies
+from api import app
+
+
+def seed(titles):
+    conn = sqlite3.connect(movies.DATABASE)
+    conn.executemany('INSERT INTO movies (name, genre) VALUES (?, ?)',
+                     [(f"Movie {i}", "Drama") for i in range(titles)])
+    conn.executemany('INSERT INTO reviews (movie_id, rating, note) VALUES (?, ?, ?)',
+                     [(i % titles + 1, 4, "Seed review") for i in range(titles * 3)])
+    conn.commit()
+    conn.close()
+
+
+def serve(database, ports):
+    """Child process: serves the API on a free port and reports the port."""
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    movies.DATABASE = database
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    ports.put(server.port)
+    server.serve_forever()
+
+
+def paths(calls, titles):
+    """The request mix: a page of the catalog and single-title reviews."""
+    return [f"/movies?limit=20&after={i % titles}" if i % 2 else f"/movies/{i % titles + 1}/reviews"
+            for i in range(calls)]
+
+
+def percentiles(latencies):
+    cuts = statistics.quantiles(latencies, n=100)
+    return cuts[49] * 1e3, cuts[98] * 1e3
+
+
+def run_threads(users, work, call):
+    """Runs `call(path)` for every path with `users` threads; returns (latencies, elapsed)."""
+    def timed(path):
+        start = time.perf_counter()
+        call(path)
+        return time.perf_counter() - start
+    start = time.perf_counter()
+    with ThreadPoolExecutor(users) as pool:
+        latencies = list(pool.map(timed, work))
+    return latencies, time.perf_counter() - start
+
+
+def run_async(users, work, client):
+    async def timed(path, slots):
+        async with slots:
+            start = time.perf_counter()
+            (await client.get(path)).json()
+            return time.perf_counter() - start
+
+    async def main():
+        slots = asyncio.Semaphore(users)
+        latencies = await asyncio.gather(*[timed(path, slots) for path in work])
+        await client.close()
+        return latencies
+    start = time.perf_counter()
+    latencies = asyncio.run(main())
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frontend HTTP client load test")
+    parser.add_argument("--users", type=int, default=16, help="concurrent handler calls")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--titles", type=int, default=500)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # database_setup writes to the working directory
+        os.chdir(tmp)
+        server = None
+        try:
+            database_setup.initialize_db()
+            movies.DATABASE = os.path.join(tmp, "movie_reviews.db")
+            seed(args.titles)
+            ports = multiprocessing.Queue()
+            server = multiprocessing.Process(target=serve, args=(movies.DATABASE, ports), daemon=True)
+            server.start()
+            base_url = f"http://127.0.0.1:{ports.get(timeout=30)}"
+            work = paths(args.calls, args.titles)
+            pooled = api_client.Client(base_url, pool_size=args.users)
+            cases = [
+                ("requests.get per call", lambda: run_threads(
+                    args.users, work, lambda path: requests.get(base_url + path).json())),
+                ("pooled Client", lambda: run_threads(
+                    args.users, work, lambda path: pooled.get(path).json())),
+                ("AsyncClient", lambda: run_async(
+                    args.users, work, api_client.AsyncClient(base_url, pool_size=args.users))),
+            ]
+            print(f"{args.calls} calls, {args.users} concurrent users")
+            print(f"{'client':<24}{'p50 (ms)':>10}{'p99 (ms)':>10}{'calls/s':>10}")
+            for name, run in cases:
+                latencies, elapsed = run()
+                p50, p99 = percentiles(latencies)
+                print(f"{name:<24}{p50:>10.2f}{p99:>10.2f}{len(latencies) / elapsed:>10.0f}")
+            pooled.close()
+        finally:
+            if server is not None:
+                server.terminate()
+                server.join()
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
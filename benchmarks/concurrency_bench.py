@@ -0,0 +1,108 @@
+# Stress test: N writer threads adding reviews while M reader threads fetch
+# them, under the old rollback-journal settings, the WAL profile, and WAL with
+# the group-commit writer
+# Usage: python -m benchmarks.concurrency_bench [--writers N] [--readers M] [--seconds S]
+#
+# Every thread has its own pooled connection, as a threaded API worker does.
+# Errors are counted rather than raised, so "database is locked" shows up as
+# an error rate instead of ending the run.
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+import cache
+import movies
+import storage
+
+
+def seed(titles):
+    conn = movies.get_connection()
+    with conn:
+        conn.executemany('INSERT INTO movies (name, genre) VALUES (?, ?)',
+                         [(f"Movie {i}", "Drama") for i in range(titles)])
+
+
+def worker(operation, stop, stats):
+    """Calls `operation()` until `stop` is set, recording latencies and errors."""
+    latencies = []
+    errors = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            operation()
+        except sqlite3.Error:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    stats.append((latencies, errors))
+
+
+def run(args, group_commit):
+    rng = random.Random(0)
+    write = lambda: movies.add_review(rng.randint(1, args.titles), 4, "Stress review")
+    read = lambda: movies.search_reviews(rng.randint(1, args.titles))
+    if group_commit:
+        storage.start_group_commit(movies.DATABASE, movies.get_connection)
+    stop = threading.Event()
+    writes, reads = [], []
+    threads = ([threading.Thread(target=worker, args=(write, stop, writes)) for _ in range(args.writers)] +
+               [threading.Thread(target=worker, args=(read, stop, reads)) for _ in range(args.readers)])
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    storage.close_all()
+    return writes, reads
+
+
+def summarize(stats, seconds):
+    latencies = [latency for thread_latencies, _ in stats for latency in thread_latencies]
+    errors = sum(thread_errors for _, thread_errors in stats)
+    total = len(latencies) + errors
+    p99 = statistics.quantiles(latencies, n=100)[98] * 1e3 if len(latencies) > 1 else float("nan")
+    return len(latencies) / seconds, errors / total * 100 if total else 0.0, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent reader/writer stress test")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--titles", type=int, default=500)
+    parser.add_argument("--busy-timeout", type=int, default=None,
+                        help="override busy_timeout (ms) in every case")
+    args = parser.parse_args()
+
+    # Measure the database, not the read cache
+    cache.configure(backend=cache.NullCache())
+    saved_profile = dict(storage.PROFILE)
+    cases = [
+        ("rollback journal", storage.ROLLBACK_PROFILE, False),
+        ("WAL", saved_profile, False),
+        ("WAL + group commit", saved_profile, True),
+    ]
+    print(f"{args.writers} writers, {args.readers} readers, {args.seconds:g}s per case")
+    print(f"{'profile':<22}{'writes/s':>10}{'err %':>8}{'p99 ms':>9}{'reads/s':>10}{'err %':>8}{'p99 ms':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n, (name, profile, group_commit) in enumerate(cases):
+            storage.configure(profile)
+            if args.busy_timeout is not None:
+                storage.configure(busy_timeout=args.busy_timeout)
+            movies.DATABASE = os.path.join(tmp, f"movies_{n}.db")
+            seed(args.titles)
+            writes, reads = run(args, group_commit)
+            row = summarize(writes, args.seconds) + summarize(reads, args.seconds)
+            print(f"{name:<22}{row[0]:>10.0f}{row[1]:>8.2f}{row[2]:>9.2f}{row[3]:>10.0f}{row[4]:>8.2f}{row[5]:>9.2f}")
+    storage.configure(saved_profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# Deterministic synthetic data for the movies, tv_shows and books databases
+# Usage: python -m benchmarks.datagen [--titles N] [--reviews M] [--seed S] [--dir DIR]
+#
+# The same arguments always produce the same rows. Review counts per title
+# follow a Zipf distribution over a shuffled popularity ranking, so a few
+# titles (at random ids) get most of the reviews and most get a handful or
+# none, as in a real catalog. Notes are long, their length lognormal: a
+# median of about 40 words with a tail past 300. Ratings lean positive.
+
+import argparse
+import bisect
+import itertools
+import math
+import os
+import random
+import sqlite3
+import zlib
+
+import bulk
+import migrations
+
+# Zipf exponent of review counts per title; around 1 for real popularity data
+ZIPF_EXPONENT = 1.1
+GENRES = ["Drama", "Comedy", "Action", "Thriller", "Sci-Fi", "Romance", "Horror", "Documentary",
+          "Fantasy", "Animation", "Mystery", "Crime", "Biography", "Western", "Musical", "History"]
+ADJECTIVES = ["Silent", "Crimson", "Last", "Hidden", "Broken", "Golden", "Endless", "Midnight", "Lost",
+              "Wild", "Frozen", "Burning", "Secret", "Distant", "Hollow", "Electric", "Quiet", "Savage"]
+NOUNS = ["River", "Empire", "Garden", "Signal", "Harbor", "Kingdom", "Mirror", "Storm", "Orchard",
+         "Machine", "Winter", "Frontier", "Letter", "Island", "Circus", "Voyage", "Tower", "Shadow"]
+WORDS = ("the a an and but of to in on with without story plot acting cast director pacing ending "
+         "beginning scene scenes music score dialogue character characters twist slow fast brilliant "
+         "boring moving funny dark beautiful predictable clever surprising performance writing visuals "
+         "chapter chapters season episode episodes finale pilot author prose world memorable forgettable "
+         "again recommend loved hated enjoyed really quite very somewhat never always").split()
+# Rating weights for 1..5 stars
+RATING_WEIGHTS = [0.06, 0.09, 0.2, 0.35, 0.3]
+# category -> database file name, as in database_setup.py (tables come from bulk.CATEGORIES)
+FILES = {"movies": "movie_reviews.db", "tv_shows": "tv_shows_reviews.db", "books": "books.db"}
+UPGRADES = {"movies": migrations.upgrade_movies, "tv_shows": migrations.upgrade_tv_shows,
+            "books": migrations.upgrade_books}
+
+
+def category_rng(seed, category, part):
+    """An independent, reproducible stream per (seed, category, part)."""
+    return random.Random(zlib.crc32(f"{seed}:{category}:{part}".encode()))
+
+
+def zipf_cumulative(n, exponent=ZIPF_EXPONENT):
+    """Cumulative Zipf weights for ranks 1..n."""
+    return list(itertools.accumulate(1.0 / rank ** exponent for rank in range(1, n + 1)))
+
+
+class ZipfSampler:
+    """Draws from `items` with Zipf probabilities by position: the first is the most likely."""
+
+    def __init__(self, items, rng=None, exponent=ZIPF_EXPONENT):
+        self.items = items
+        self.rng = rng
+        self.cumulative = zipf_cumulative(len(items), exponent)
+
+    def __call__(self, rng=None):
+        rank = bisect.bisect_left(self.cumulative, (rng or self.rng).random() * self.cumulative[-1])
+        return self.items[min(rank, len(self.items) - 1)]
+
+
+def ranking(category, n_titles, seed=0):
+    """Title ids from most to least reviewed, shuffled so popularity is not tied to insertion order."""
+    ids = list(range(1, n_titles + 1))
+    category_rng(seed, category, "popularity").shuffle(ids)
+    return ids
+
+
+def titles(category, n, seed=0):
+    """Yields n (title, genre) rows; genres are skewed like the reviews."""
+    rng = category_rng(seed, category, "titles")
+    genre = ZipfSampler(GENRES, rng, exponent=0.8)
+    for i in range(n):
+        name = f"The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}"
+        if rng.random() < 0.3:
+            name += f" {rng.randint(2, 5)}"
+        yield f"{name} #{i + 1}", genre()
+
+
+def note(rng):
+    words = max(3, min(400, int(rng.lognormvariate(math.log(40), 0.8))))
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def rating(category, rng):
+    stars = rng.choices(range(1, 6), RATING_WEIGHTS)[0]
+    if category == "tv_shows" and stars < 5 and rng.random() < 0.5:
+        return stars + 0.5
+    return stars
+
+
+def reviews(category, n_titles, m, seed=0):
+    """Yields m (title id, rating, note) rows for titles 1..n_titles."""
+    rng = category_rng(seed, category, "reviews")
+    title = ZipfSampler(ranking(category, n_titles, seed), rng)
+    for _ in range(m):
+        yield title(), rating(category, rng), note(rng)
+
+
+def populate(path, category, n_titles, m_reviews, seed=0):
+    """Creates (or empties) the category's database at `path` and fills it."""
+    spec = bulk.CATEGORIES[category]
+    connection = sqlite3.connect(path)
+    try:
+        UPGRADES[category](connection)
+        columns = ", ".join(spec["columns"])
+        with connection:
+            connection.execute("DELETE FROM reviews")
+            connection.execute(f"DELETE FROM {spec['table']}")
+            connection.execute("DELETE FROM sqlite_sequence")
+            connection.executemany(f"INSERT INTO {spec['table']} ({columns}) VALUES (?, ?)",
+                                   titles(category, n_titles, seed))
+            connection.executemany(
+                f"INSERT INTO reviews ({spec['item_column']}, rating, note) VALUES (?, ?, ?)",
+                reviews(category, n_titles, m_reviews, seed))
+        connection.execute("ANALYZE")
+    finally:
+        connection.close()
+
+
+def populate_all(directory, n_titles, m_reviews, seed=0):
+    """Fills one database per category in `directory`; returns {category: path}."""
+    paths = {}
+    for category, filename in FILES.items():
+        paths[category] = os.path.join(directory, filename)
+        populate(paths[category], category, n_titles, m_reviews, seed)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic review databases")
+    parser.add_argument("--titles", type=int, default=10000, help="titles per category")
+    parser.add_argument("--reviews", type=int, default=100000, help="reviews per category")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", default=".", help="where to write the database files")
+    args = parser.parse_args()
+    for category, path in populate_all(args.dir, args.titles, args.reviews, args.seed).items():
+        print(f"{category:<10}{args.titles:>8} titles{args.reviews:>9} reviews  {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Per-click latency of the Gradio frontend's API calls with each backend:
+# AsyncClient against the API served from a child process (as with
+# `python api.py`), and InProcessClient running the routes in this process
+# Usage: python -m benchmarks.frontend_bench [--titles N] [--reviews N] [--clicks N]
+#
+# A click is the request one handler in app.py makes plus decoding its JSON,
+# which is all the handlers do with the client before formatting the text.
+
+import argparse
+import asyncio
+import multiprocessing
+import statistics
+import tempfile
+import time
+
+import api_client
+import cache
+import movies
+import storage
+from api import app
+from benchmarks import datagen
+from benchmarks.client_bench import serve
+
+
+def clicks(n_titles, seed=0):
+    """(name, method, path, kwargs) per frontend button, over Zipf-popular titles."""
+    popular = datagen.ZipfSampler(datagen.ranking("movies", n_titles, seed),
+                                  datagen.category_rng(seed, "movies", "clicks"))
+    return [
+        ("search reviews", lambda: ("GET", f"/movies/{popular()}/reviews", {})),
+        ("search by genre", lambda: ("GET", "/movies/genre", {"params": {"genre": "Western"}})),
+        ("add review", lambda: ("POST", f"/movies/{popular()}/reviews", {"json": {"rating": 4.0, "note": "Fine"}})),
+        ("view all movies", lambda: ("GET", "/movies", {})),
+    ]
+
+
+async def run_clicks(client, make, count):
+    timings = []
+    for _ in range(count):
+        method, path, kwargs = make()
+        start = time.perf_counter()
+        response = await client.request(method, path, **kwargs)
+        response.json()
+        timings.append((time.perf_counter() - start) * 1e3)
+    await client.close()
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frontend backend per-click latency")
+    parser.add_argument("--titles", type=int, default=1000)
+    parser.add_argument("--reviews", type=int, default=10000)
+    parser.add_argument("--clicks", type=int, default=500, help="clicks per button and backend")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        movies.DATABASE = datagen.populate_all(tmp, args.titles, args.reviews, args.seed)["movies"]
+        ports = multiprocessing.Queue()
+        server = multiprocessing.Process(target=serve, args=(movies.DATABASE, ports), daemon=True)
+        server.start()
+        try:
+            base_url = f"http://127.0.0.1:{ports.get(timeout=30)}"
+            backends = [("http", lambda: api_client.connect("http", base_url)),
+                        ("inprocess", lambda: api_client.InProcessClient(app))]
+            print(f"{'click':<18}" + "".join(f"{name + ' p50':>16}{name + ' p95':>16}" for name, _ in backends))
+            for name, make in clicks(args.titles, args.seed):
+                count = max(1, args.clicks // 10) if name == "view all movies" else args.clicks
+                row = f"{name:<18}"
+                for _, connect in backends:
+                    cache.clear()
+                    p50, p95 = asyncio.run(run_clicks(connect(), make, count))
+                    row += f"{p50:>16.3f}{p95:>16.3f}"
+                print(row)
+        finally:
+            server.terminate()
+            server.join()
+            storage.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Home page latency: the four calls the landing view used to make on every
+# load (movies.view_movie_genre, movies.view_top_movies, books.view_book_genres,
+# books.view_top_books, read cache off) against one rebuild of the summary.py
+# document and GET /home served from memory
+# Usage: python -m benchmarks.home_bench [--titles 10000] [--reviews 100000] [--requests 2000]
+
+import argparse
+import statistics
+import tempfile
+import time
+
+import api
+import books
+import cache
+import movies
+import storage
+import summary
+import tv_shows
+from benchmarks import datagen
+from benchmarks.view_reviews_bench import best_of
+
+
+def legacy_home():
+    movies.view_movie_genre()
+    movies.view_top_movies()
+    books.view_book_genres()
+    books.view_top_books()
+
+
+def request_timings(client, requests, headers=None):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get("/home", headers=headers)
+        response.get_data()
+        timings.append((time.perf_counter() - start) * 1e3)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Home page latency benchmark")
+    parser.add_argument("--titles", type=int, default=10000)
+    parser.add_argument("--reviews", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    cache.configure(backend=cache.NullCache())
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = datagen.populate_all(tmp, args.titles, args.reviews, args.seed)
+        movies.DATABASE, tv_shows.DATABASE, books.DATABASE = paths["movies"], paths["tv_shows"], paths["books"]
+        home = summary.Summary({"movies": movies, "tv_shows": tv_shows, "books": books})
+        try:
+            legacy_home()
+            home.refresh()
+            print(f"{'path':<34}{'p50 ms':>10}{'p95 ms':>10}")
+            print(f"{'four legacy calls':<34}{best_of(legacy_home, args.repeat):>10.3f}{'':>10}")
+            print(f"{'summary rebuild (3 categories)':<34}"
+                  f"{best_of(lambda: home.refresh(force=True), args.repeat):>10.3f}{'':>10}")
+            print(f"{'summary check, nothing written':<34}{best_of(home.refresh, args.repeat):>10.3f}{'':>10}")
+
+            api.home.stop()
+            api.home = home
+            client = api.app.test_client()
+            client.get("/home")
+            p50, p95 = request_timings(client, args.requests)
+            print(f"{'GET /home (from memory)':<34}{p50:>10.3f}{p95:>10.3f}")
+            etag = client.get("/home").headers["ETag"]
+            p50, p95 = request_timings(client, args.requests, {"If-None-Match": etag})
+            print(f"{'GET /home, 304':<34}{p50:>10.3f}{p95:>10.3f}")
+        finally:
+            home.stop()
+            storage.close_all()
+
+
+if __name__ == "__main__":
+    main()
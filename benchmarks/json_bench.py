@@ -0,0 +1,64 @@
+# Serialization benchmark for the full GET /movies response body:
+# dicts + the standard json encoder (Flask's default provider), dicts + orjson,
+# and the SQLite-encoded rows joined as RawJSON (what api.py sends now)
+# Usage: python -m benchmarks.json_bench [--titles 10000] [--reviews 100000]
+
+import argparse
+import json
+import os
+import tempfile
+
+from flask import Flask
+
+import cache
+import database_setup
+import json_provider
+import movies
+import storage
+from benchmarks.view_reviews_bench import best_of, seed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON list response benchmark")
+    parser.add_argument("--titles", type=int, default=10000)
+    parser.add_argument("--reviews", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cache.configure(backend=cache.NullCache())
+    default_app = Flask(__name__)
+    fast_app = Flask(__name__)
+    fast_app.json = json_provider.FastJSONProvider(fast_app)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            movies.DATABASE = os.path.join(tmp, "movie_reviews.db")
+            database_setup.initialize_db()
+            seed(args.titles, max(1, args.reviews // args.titles))
+
+            cases = [
+                ("dicts + json", default_app, lambda: movies.view_reviews()),
+                ("dicts + orjson", fast_app, lambda: movies.view_reviews()),
+                ("sqlite rows + RawJSON", fast_app, lambda: json_provider.json_array(movies.view_reviews_json())),
+            ]
+            expected = None
+            print(f"{'path':<24}{'ms':>10}{'MB':>8}")
+            for name, app, build in cases:
+                if name == "dicts + orjson" and json_provider.orjson is None:
+                    print(f"{name:<24}{'(orjson not installed)':>18}")
+                    continue
+                with app.app_context():
+                    body = app.json.response(build()).get_data()
+                    if expected is None:
+                        expected = json.loads(body)
+                    assert json.loads(body) == expected
+                    elapsed = best_of(lambda: app.json.response(build()).get_data(), args.repeat)
+                print(f"{name:<24}{elapsed:>10.1f}{len(body) / 1e6:>8.1f}")
+        finally:
+            storage.close_all()
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Benchmark: cost of adding a review as the TV show library grows, whole-file
+# JSON rewrite (tv_showsTab.py before the log store) vs the append-only log store
+# Usage: python -m benchmarks.logstore_bench [--inserts N]
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from logstore import LogStore
+
+
+# The load/modify/save cycle tv_showsTab.py used for every action
+def legacy_add_review(path, show_id, rating, note):
+    with open(path, 'r') as file:
+        data = json.load(file)
+    for show in data["shows"]:
+        if show["id"] == show_id:
+            show["reviews"].append({"review_id": len(show["reviews"]) + 1, "rating": rating, "note": note})
+            break
+    with open(path, 'w') as file:
+        json.dump(data, file, indent=4)
+
+
+def write_library(path, shows):
+    library = {"shows": [
+        {"id": i, "title": f"Show {i}",
+         "reviews": [{"review_id": r, "rating": 4.0, "note": "Seed review"} for r in range(1, 4)]}
+        for i in range(1, shows + 1)
+    ]}
+    with open(path, "w") as file:
+        json.dump(library, file, indent=4)
+
+
+def time_inserts(add, inserts, shows):
+    """Returns the mean latency of `add(show_id)` in milliseconds."""
+    start = time.perf_counter()
+    for n in range(inserts):
+        add(n % shows + 1)
+    return (time.perf_counter() - start) / inserts * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TV show library insert benchmark")
+    parser.add_argument("--inserts", type=int, default=2000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    print(f"{'shows':>8}{'rewrite (ms)':>14}{'log (ms)':>10}{'log+fsync (ms)':>16}")
+    for shows in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            legacy_path = os.path.join(tmp, "legacy.json")
+            write_library(legacy_path, shows)
+            # The rewrite gets slow quickly; fewer inserts give the same mean
+            legacy_inserts = max(10, min(args.inserts, 200000 // shows))
+            legacy_ms = time_inserts(
+                lambda show_id: legacy_add_review(legacy_path, show_id, 5.0, "Benchmark review"),
+                legacy_inserts, shows)
+
+            results = []
+            for durable in (False, True):
+                path = os.path.join(tmp, f"log_{durable}.json")
+                write_library(path, shows)
+                store = LogStore(path, durable=durable)
+                store.shows()  # load the snapshot before timing
+                # Compaction runs inside the timed inserts, so its cost is amortized in
+                results.append(time_inserts(
+                    lambda show_id: store.add_review(show_id, 5.0, "Benchmark review"), args.inserts, shows))
+        print(f"{shows:>8}{legacy_ms:>14.3f}{results[0]:>10.3f}{results[1]:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
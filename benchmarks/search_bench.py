@@ -0,0 +1,94 @@
+# Benchmark: FTS5 search (movies.search) vs a LIKE scan over titles, genres and notes
+# Usage: python -m benchmarks.search_bench [--titles N] [--reviews M]
+
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import cache
+import database_setup
+import movies
+import storage
+
+GENRES = ["Drama", "Comedy", "Science Fiction", "Horror", "Documentary", "Animation", "Thriller"]
+
+# LIKE scan that finds every movie whose name, genre or any review note contains the text
+LIKE_QUERY = '''
+    SELECT m.id, m.name, m.genre
+    FROM movies m
+    WHERE LOWER(m.name) LIKE ? OR LOWER(m.genre) LIKE ?
+       OR EXISTS (SELECT 1 FROM reviews r WHERE r.movie_id = m.id AND LOWER(r.note) LIKE ?)
+'''
+
+
+def vocabulary(rng, size):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(size)]
+
+
+def seed(titles, reviews, rng):
+    """Inserts the corpus through the migrated schema, so the FTS triggers index it."""
+    words = vocabulary(rng, 5000)
+    # Word frequencies follow a rough Zipf curve so queries hit common and rare terms
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+    conn = sqlite3.connect(movies.DATABASE)
+    with conn:
+        conn.executemany('INSERT INTO movies (name, genre) VALUES (?, ?)',
+                         ((" ".join(rng.choices(words, k=2)).title(), rng.choice(GENRES)) for _ in range(titles)))
+        conn.executemany('INSERT INTO reviews (movie_id, rating, note) VALUES (?, ?, ?)',
+                         ((rng.randint(1, titles), rng.randint(1, 5), " ".join(rng.choices(words, cum_weights=cum_weights, k=12)))
+                          for _ in range(reviews)))
+    conn.close()
+    return words
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return (time.perf_counter() - start) * 1e3, result
+
+
+def like_search(text):
+    pattern = f"%{text.lower()}%"
+    conn = movies.get_connection()
+    return conn.execute(LIKE_QUERY, (pattern, pattern, pattern)).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text search benchmark")
+    parser.add_argument("--titles", type=int, default=10000)
+    parser.add_argument("--reviews", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Measure the query itself, not cache hits
+    cache.configure(backend=cache.NullCache())
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            movies.DATABASE = os.path.join(tmp, "movie_reviews.db")
+            database_setup.initialize_db()
+            start = time.perf_counter()
+            words = seed(args.titles, args.reviews, rng)
+            print(f"seeded {args.titles} titles / {args.reviews} reviews in {time.perf_counter() - start:.1f}s")
+
+            # A common word, a mid-frequency word and a rare word
+            queries = [words[0], words[100], words[4000]]
+            print(f"{'query':<12}{'LIKE (ms)':>12}{'matches':>10}{'FTS5 (ms)':>12}{'speedup':>10}")
+            for text in queries:
+                like_ms, like_rows = timed(like_search, text)
+                fts_ms, _ = timed(movies.search, text)
+                print(f"{text:<12}{like_ms:>12.1f}{len(like_rows):>10}{fts_ms:>12.1f}{like_ms / fts_ms:>9.1f}x")
+        finally:
+            storage.close_all()
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
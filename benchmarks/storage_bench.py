@@ -0,0 +1,114 @@
+# Micro-benchmark: per-call latency of connect-per-call vs the pooled storage layer
+# Usage: python -m benchmarks.storage_bench [--calls N]
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import cache
+import database_setup
+import movies
+import storage
+
+
+# Connect-per-call versions of the movies functions, as they were before storage.py
+def legacy_add_review(movie_id, rating, note):
+    conn = sqlite3.connect(movies.DATABASE)
+    cursor = conn.cursor()
+    cursor.execute('INSERT INTO reviews (movie_id, rating, note) VALUES (?, ?, ?)', (movie_id, rating, note))
+    conn.commit()
+    conn.close()
+
+def legacy_search_reviews(movie_id):
+    conn = sqlite3.connect(movies.DATABASE)
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM movies WHERE id = ?', (movie_id,))
+    movie = cursor.fetchone()
+    cursor.execute('SELECT * FROM reviews WHERE movie_id = ?', (movie_id,))
+    reviews = cursor.fetchall()
+    conn.close()
+    return {
+        "id": movie[0],
+        "name": movie[1],
+        "genre": movie[2],
+        "reviews": [{"review_id": r[0], "rating": r[2], "note": r[3]} for r in reviews]
+    }
+
+def legacy_view_reviews():
+    conn = sqlite3.connect(movies.DATABASE)
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM movies')
+    result = []
+    for movie in cursor.fetchall():
+        cursor.execute('SELECT * FROM reviews WHERE movie_id = ?', (movie[0],))
+        reviews = cursor.fetchall()
+        result.append({
+            "id": movie[0],
+            "name": movie[1],
+            "genre": movie[2],
+            "reviews": [{"review_id": r[0], "rating": r[2], "note": r[3]} for r in reviews]
+        })
+    conn.close()
+    return result
+
+
+def time_per_call(func, calls, *args):
+    """Returns the mean latency of `func(*args)` in microseconds."""
+    start = time.perf_counter()
+    for _ in range(calls):
+        func(*args)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def seed(titles):
+    conn = sqlite3.connect(movies.DATABASE)
+    conn.executemany('INSERT INTO movies (name, genre) VALUES (?, ?)',
+                     [(f"Movie {i}", "Drama") for i in range(titles)])
+    conn.executemany('INSERT INTO reviews (movie_id, rating, note) VALUES (?, ?, ?)',
+                     [(i % titles + 1, 4, "Seed review") for i in range(titles * 3)])
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Connection pool micro-benchmark")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--titles", type=int, default=50)
+    args = parser.parse_args()
+
+    # Measure the storage layer itself, not cache hits
+    cache.configure(backend=cache.NullCache())
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # database_setup writes to the working directory
+        os.chdir(tmp)
+        try:
+            movies.DATABASE = os.path.join(tmp, "movie_reviews.db")
+            database_setup.initialize_db()
+            seed(args.titles)
+            run(args)
+        finally:
+            storage.close_all()
+            os.chdir(cwd)
+
+
+def run(args):
+    # Reads run before writes so both variants see the same rows; the
+    # benchmark reviews go to an id outside the seeded catalog.
+    cases = [
+        ("search_reviews", legacy_search_reviews, movies.search_reviews, (1,)),
+        ("view_reviews", legacy_view_reviews, movies.view_reviews, ()),
+        ("add_review", legacy_add_review, movies.add_review, (0, 5, "Benchmark review")),
+    ]
+    print(f"{'function':<16}{'before (us)':>14}{'after (us)':>14}{'speedup':>10}")
+    for name, before, after, call_args in cases:
+        calls = args.calls if name != "view_reviews" else max(1, args.calls // 10)
+        before_us = time_per_call(before, calls, *call_args)
+        after_us = time_per_call(after, calls, *call_args)
+        print(f"{name:<16}{before_us:>14.1f}{after_us:>14.1f}{before_us / after_us:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
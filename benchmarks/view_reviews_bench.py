@@ -0,0 +1,89 @@
+# Scaling benchmark: per-title review queries (N+1) vs the single joined query
+# Usage: python -m benchmarks.view_reviews_bench [--sizes 1000 10000 100000]
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import cache
+import database_setup
+import movies
+import storage
+
+
+def legacy_view_reviews():
+    """The N+1 version of movies.view_reviews: one reviews query per movie."""
+    conn = movies.get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM movies')
+    result = []
+    for movie in cursor.fetchall():
+        cursor.execute('SELECT * FROM reviews WHERE movie_id = ?', (movie[0],))
+        reviews = cursor.fetchall()
+        result.append({
+            "id": movie[0],
+            "name": movie[1],
+            "genre": movie[2],
+            "reviews": [{"review_id": r[0], "rating": r[2], "note": r[3]} for r in reviews]
+        })
+    return result
+
+
+def seed(titles, reviews_per_title):
+    conn = sqlite3.connect(movies.DATABASE)
+    with conn:
+        conn.execute('DELETE FROM reviews')
+        conn.execute('DELETE FROM movies')
+        conn.execute("DELETE FROM sqlite_sequence")
+        conn.executemany('INSERT INTO movies (name, genre) VALUES (?, ?)',
+                         ((f"Movie {i}", f"Genre {i % 20}") for i in range(titles)))
+        conn.executemany('INSERT INTO reviews (movie_id, rating, note) VALUES (?, ?, ?)',
+                         ((i % titles + 1, i % 5 + 1, f"Review {i}") for i in range(titles * reviews_per_title)))
+    conn.close()
+
+
+def best_of(func, repeat):
+    """Returns the fastest of `repeat` runs of `func()` in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1e3)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="view_reviews scaling benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--reviews-per-title", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # Measure the query itself, not cache hits
+    cache.configure(backend=cache.NullCache())
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            movies.DATABASE = os.path.join(tmp, "movie_reviews.db")
+            # The migrated schema indexes reviews.movie_id, so the N+1 baseline
+            # pays round trips rather than full scans.
+            database_setup.initialize_db()
+
+            print(f"{'titles':>8}{'N+1 (ms)':>12}{'joined (ms)':>14}{'N+1 us/title':>15}{'joined us/title':>17}")
+            for titles in args.sizes:
+                seed(titles, args.reviews_per_title)
+                assert legacy_view_reviews() == movies.view_reviews()
+                before = best_of(legacy_view_reviews, args.repeat)
+                after = best_of(movies.view_reviews, args.repeat)
+                print(f"{titles:>8}{before:>12.1f}{after:>14.1f}"
+                      f"{before / titles * 1e3:>15.2f}{after / titles * 1e3:>17.2f}")
+        finally:
+            storage.close_all()
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
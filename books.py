@@ -2,64 +2,57 @@
 # Author: Kai Francis
 # Date: Updated December 6, 2024
 
-import sqlite3
+import cache
+import events
+import migrations
+import storage
 
-DATABASE = 'books.db'
+DATABASE = "books.db"
 
 # Utility to get a database connection
-import sqlite3
+def get_connection():
+    """Returns this thread's pooled connection; pending migrations run on first use."""
+    return storage.get_connection(DATABASE, migrations.upgrade_books)
 
-DATABASE = "books.db"  # Use in-memory database for testing
+def data_version():
+    """Returns a token that changes whenever a book or review is written, after
+    dropping cached reads made before a write from outside this process."""
+    return cache.revalidate("books")
 
-def get_connection():
-    """Returns a database connection and initializes tables if necessary."""
-    connection = sqlite3.connect(DATABASE)
-    cursor = connection.cursor()
-    # Initialize tables if they don't exist
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS books (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            genre TEXT NOT NULL
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reviews (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            book_id INTEGER NOT NULL,
-            rating INTEGER CHECK (rating BETWEEN 1 AND 5),
-            note TEXT NOT NULL,
-            FOREIGN KEY (book_id) REFERENCES books (id)
-        )
-    ''')
-    connection.commit()
-    return connection
+cache.track_version("books", lambda: storage.data_version(get_connection()))
+
+# Cache tags: "list" covers the listing pages, "item:<id>" one title's reviews
+# and rating stats, "genre" and "genres" the genre queries, "ratings"
+# the top-rated queries and "search" full-text results.
+def _review_tags(book_id, *args, **kwargs):
+    """Tags a review write affects: the title's own entries plus every listing."""
+    return ["list", f"item:{book_id}", "ratings", "search"]
 
 
-# Adding a new book with genre
+# Adding a new book with genre (genre search matches substrings, so every
+# cached genre query is dropped)
+@cache.invalidates("books", lambda book_title, genre: ["list", "genres", "genre", "search"])
 def add_book(book_title, genre):
     connection = get_connection()
     cursor = connection.cursor()
     query = "INSERT INTO books (title, genre) VALUES (?, ?)"
-    cursor.execute(query, (book_title, genre))
-    connection.commit()
+    with connection:
+        cursor.execute(query, (book_title, genre))
     book_id = cursor.lastrowid
-    connection.close()
+    events.publish("books", "book_added", {"book_id": book_id, "title": book_title, "genre": genre})
     return {"message": f"Book '{book_title}' added successfully.", "book": {"id": book_id, "title": book_title, "genre": genre}}
 
 # Adding a review to a book
+@cache.invalidates("books", _review_tags)
 def add_review(book_id, rating, note):
-    conn = get_connection()
-    cursor = conn.cursor()
     query = 'INSERT INTO reviews (book_id, rating, note) VALUES (?, ?, ?)'
-    cursor.execute(query, (book_id, rating, note))
-    conn.commit()
-    review_id = cursor.lastrowid
-    conn.close()
+    review_id = storage.write(DATABASE, get_connection, query, (book_id, rating, note))
+    events.publish("books", "review_added", {"book_id": book_id, "review_id": review_id, "rating": rating, "note": note})
     return {"message": f"Review added to book ID {book_id}.", "review_id": review_id}
 
 
 # Editing a review
+@cache.invalidates("books", _review_tags)
 def edit_review(book_id, review_id, rating=None, note=None):
     connection = get_connection()
     cursor = connection.cursor()
@@ -75,67 +68,125 @@ def edit_review(book_id, review_id, rating=None, note=None):
     values.extend([book_id, review_id])
 
     query = f"UPDATE reviews SET {', '.join(updates)} WHERE book_id = ? AND id = ?"
-    cursor.execute(query, tuple(values))
-    connection.commit()
-    connection.close()
+    with connection:
+        cursor.execute(query, tuple(values))
+    if cursor.rowcount:
+        events.publish("books", "review_edited", {"book_id": book_id, "review_id": review_id, "rating": rating, "note": note})
     return {"message": f"Review ID {review_id} for book ID {book_id} updated."}
 
 # Deleting a review
+@cache.invalidates("books", _review_tags)
 def delete_review(book_id, review_id):
     connection = get_connection()
     cursor = connection.cursor()
     query = "DELETE FROM reviews WHERE book_id = ? AND id = ?"
-    cursor.execute(query, (book_id, review_id))
-    connection.commit()
-    connection.close()
+    with connection:
+        cursor.execute(query, (book_id, review_id))
+    if cursor.rowcount:
+        events.publish("books", "review_deleted", {"book_id": book_id, "review_id": review_id})
     return {"message": f"Review ID {review_id} deleted from book ID {book_id}."}
 
 # Deleting a book
+@cache.invalidates("books", lambda book_id: _review_tags(book_id) + ["genres", "genre"])
 def delete_book(book_id):
     connection = get_connection()
     cursor = connection.cursor()
     query = "DELETE FROM reviews WHERE book_id = ?"
-    cursor.execute(query, (book_id,))
     delete_book_query = "DELETE FROM books WHERE id = ?"
-    cursor.execute(delete_book_query, (book_id,))
-    connection.commit()
-    connection.close()
+    with connection:
+        cursor.execute(query, (book_id,))
+        reviews = cursor.rowcount
+        cursor.execute(delete_book_query, (book_id,))
+    if cursor.rowcount:
+        events.publish("books", "book_deleted", {"book_id": book_id, "reviews_deleted": reviews})
     return {"message": f"Book ID {book_id} and its reviews have been deleted."}
 
 # Viewing all books
+@cache.cached("books", lambda: ["list"])
 def view_books():
+    return list(iter_books())
+
+# Viewing one keyset page of books
+@cache.cached("books", lambda limit, after=0: ["list"])
+def view_books_page(limit, after=0):
+    """Returns up to `limit` books with id greater than `after`."""
+    return list(iter_books(after, limit))
+
+def iter_books(after=0, limit=-1):
+    """Yields books with their review counts one at a time in id order (limit -1 means no limit)."""
     connection = get_connection()
     cursor = connection.cursor()
     query = """
     SELECT b.id, b.title, b.genre, COUNT(r.id) as reviews_count
     FROM books b
     LEFT JOIN reviews r ON b.id = r.book_id
+    WHERE b.id > ?
+      AND b.id <= (SELECT MAX(id) FROM (SELECT id FROM books WHERE id > ? ORDER BY id LIMIT ?))
     GROUP BY b.id, b.title, b.genre
+    ORDER BY b.id
     """
-    cursor.execute(query)
-    books = [
+    cursor.execute(query, (after, after, limit))
+    return (
         {"id": row[0], "title": row[1], "genre": row[2], "reviews_count": row[3], "reviews": []}
-        for row in cursor.fetchall()
-    ]
-    connection.close()
-    return books
+        for row in cursor
+    )
 
+# Viewing books as (id, JSON text) rows for list responses
+@cache.cached("books", lambda limit=-1, after=0: ["list"])
+def view_books_json(limit=-1, after=0):
+    """Returns view_books_page's books as (id, JSON text) rows; see iter_books_json."""
+    return list(iter_books_json(after, limit))
+
+def iter_books_json(after=0, limit=-1):
+    """Yields (id, JSON text) for books with their review counts in id order.
+
+    SQLite builds the JSON, with the same content as iter_books' dicts and
+    sorted keys, so list responses skip building and encoding dicts in Python.
+    """
+    connection = get_connection()
+    return connection.execute("""
+    SELECT b.id, json_object(
+        'genre', b.genre, 'id', b.id, 'reviews', json('[]'),
+        'reviews_count', (SELECT COUNT(*) FROM reviews WHERE book_id = b.id),
+        'title', b.title)
+    FROM books b
+    WHERE b.id > ?
+    ORDER BY b.id
+    LIMIT ?
+    """, (after, limit))
+
+@cache.cached("books", lambda sort="id", descending=False, limit=20, after=None: ["list"])
+def view_catalog_page(sort="id", descending=False, limit=20, after=None):
+    """Returns a page of books with their review count and average rating, sorted
+    by `sort` (one of storage.CATALOG_SORTS), and the `after` of the next page."""
+    rows, next_after = storage.catalog_page(get_connection(), "books", "title", "book_id",
+                                            sort, descending, limit, after)
+    return [{"id": row[0], "title": row[1], "genre": row[2], "review_count": row[3] or 0,
+             "average_rating": row[4]} for row in rows], next_after
+
+def view_changes_json(since, limit):
+    """Returns up to `limit` (version, JSON text) rows for the books and reviews
+    inserted, updated or deleted after version `since`, oldest first."""
+    return storage.changes_json(get_connection(), {
+        "books": ("book", {"title": "title", "genre": "genre"}),
+        "reviews": ("review", {"book_id": "book_id", "rating": "rating", "note": "note"}),
+    }, since, limit)
+
+@cache.cached("books", lambda book_id: [f"item:{book_id}"])
 def search_reviews(book_id):
     """Search for a book by ID and retrieve its reviews."""
-    connection = sqlite3.connect(DATABASE)
+    connection = get_connection()
     cursor = connection.cursor()
     
     # Fetch the book details
     cursor.execute('SELECT * FROM books WHERE id = ?', (book_id,))
     book = cursor.fetchone()
     if not book:
-        connection.close()
         return {"error": "Book not found."}
     
     # Fetch all reviews for the book
     cursor.execute('SELECT * FROM reviews WHERE book_id = ?', (book_id,))
     reviews = cursor.fetchall()
-    connection.close()
     
     # Return the book and its reviews
     return {
@@ -146,26 +197,64 @@ def search_reviews(book_id):
     }
 
 
+@cache.cached_many("books", lambda book_id: [f"item:{book_id}"], search_reviews)
+def search_reviews_many(book_ids):
+    """search_reviews() for many books at once, in the order given: one query
+    per storage.IN_CHUNK ids instead of two per book."""
+    conn = get_connection()
+    found = {}
+    for chunk in storage.chunked(book_ids):
+        cursor = conn.execute(f'''
+            SELECT t.id, t.title, t.genre, r.id, r.rating, r.note
+            FROM books t
+            LEFT JOIN reviews r ON r.book_id = t.id
+            WHERE t.id IN ({storage.placeholders(len(chunk))})
+            ORDER BY t.id, r.id
+        ''', chunk)
+        found.update((item["id"], item) for item in storage.iter_nested_reviews(cursor, "title"))
+    return [found.get(book_id, {"error": "Book not found."}) for book_id in book_ids]
+
+
+@cache.cached("books", lambda: ["list"])
 def view_books_with_reviews():
     connection = get_connection()
-    cursor = connection.cursor()
-    cursor.execute('SELECT * FROM books')
-    books = cursor.fetchall()
-    result = []
-    for book in books:
-        cursor.execute('SELECT * FROM reviews WHERE book_id = ?', (book[0],))
-        reviews = cursor.fetchall()
-        result.append({
-            "id": book[0],
-            "title": book[1],
-            "genre": book[2],
-            "reviews": [{"review_id": r[0], "rating": r[2], "note": r[3]} for r in reviews]
-        })
-    connection.close()
-    return result
+    cursor = connection.execute('''
+        SELECT b.id, b.title, b.genre, r.id, r.rating, r.note
+        FROM books b
+        LEFT JOIN reviews r ON r.book_id = b.id
+        ORDER BY b.id, r.id
+    ''')
+    return list(storage.iter_nested_reviews(cursor, "title"))
 
 
+# Full-text search over titles, genres and review notes
+@cache.cached("books", lambda text, limit=20: ["search"])
+def search(text, limit=20):
+    """Returns the books best matching `text` by bm25, across titles, genres and review notes."""
+    query = storage.fts_query(text)
+    if query is None:
+        return []
+    connection = get_connection()
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT b.id, b.title, b.genre, MIN(hits.score) AS score
+        FROM (
+            SELECT rowid AS book_id, bm25(books_fts) AS score
+            FROM books_fts WHERE books_fts MATCH ?
+            UNION ALL
+            SELECT r.book_id, bm25(reviews_fts)
+            FROM reviews_fts JOIN reviews r ON r.id = reviews_fts.rowid
+            WHERE reviews_fts MATCH ?
+        ) hits
+        JOIN books b ON b.id = hits.book_id
+        GROUP BY b.id
+        ORDER BY score
+        LIMIT ?
+    ''', (query, query, limit))
+    return [{"id": row[0], "title": row[1], "genre": row[2], "score": row[3]} for row in cursor]
+
 # Searching books by genre
+@cache.cached("books", lambda genre: ["genre"])
 def search_by_genre(genre):
     connection = get_connection()
     cursor = connection.cursor()
@@ -175,25 +264,59 @@ def search_by_genre(genre):
         {"id": row[0], "title": row[1], "genre": row[2]}
         for row in cursor.fetchall()
     ]
-    connection.close()
     return books
 
+@cache.cached("books", lambda: ["genres"])
 def view_book_genres():
     connection = get_connection()
     cursor = connection.cursor()
     cursor.execute('SELECT DISTINCT genre FROM books')
     genres = [row[0] for row in cursor.fetchall()]
-    connection.close()
     return genres
 
+@cache.cached("books", lambda: ["ratings"])
 def view_top_books():
     connection = get_connection()
     cursor = connection.cursor()
-    cursor.execute('SELECT book_id, AVG(rating) as avg_rating FROM reviews GROUP BY book_id ORDER BY avg_rating DESC LIMIT 3')
+    cursor.execute('SELECT book_id, rating_avg FROM rating_stats ORDER BY rating_avg DESC, book_id LIMIT 3')
     top_books = cursor.fetchall()
     result = [{"book_id": row[0], "average_rating": row[1]} for row in top_books]
-    connection.close()
     return result
 
+@cache.cached("books", lambda book_id: [f"item:{book_id}"])
+def view_rating_stats(book_id):
+    """Returns review count, rating sum, min, max and average for one book."""
+    connection = get_connection()
+    cursor = connection.cursor()
+    cursor.execute(
+        'SELECT review_count, rating_sum, rating_min, rating_max, rating_avg FROM rating_stats WHERE book_id = ?',
+        (book_id,))
+    row = cursor.fetchone()
+    if not row:
+        return {"book_id": book_id, "review_count": 0, "rating_sum": 0,
+                "rating_min": None, "rating_max": None, "average_rating": None}
+    return {"book_id": book_id, "review_count": row[0], "rating_sum": row[1],
+            "rating_min": row[2], "rating_max": row[3], "average_rating": row[4]}
 
 
+def view_summary(limit=5):
+    """Returns book and review counts, genres with their book counts and the
+    `limit` best-rated books, as summary.py puts them on the home page."""
+    conn = get_connection()
+    titles, reviews = conn.execute(
+        'SELECT (SELECT COUNT(*) FROM books), (SELECT COUNT(*) FROM reviews)').fetchone()
+    genres = conn.execute('SELECT genre, COUNT(*) FROM books GROUP BY genre ORDER BY genre')
+    top = conn.execute('''
+        SELECT t.id, t.title, t.genre, s.rating_avg, s.review_count
+        FROM rating_stats s
+        JOIN books t ON t.id = s.book_id
+        ORDER BY s.rating_avg DESC, s.book_id
+        LIMIT ?
+    ''', (limit,))
+    return {
+        "titles": titles,
+        "reviews": reviews,
+        "genres": [{"genre": row[0], "titles": row[1]} for row in genres],
+        "top_rated": [{"id": row[0], "title": row[1], "genre": row[2], "average_rating": row[3],
+                       "review_count": row[4]} for row in top],
+    }
@@ -4,6 +4,7 @@
 
 import unittest
 import json
+import sqlite3
 from api import app
 import books
 
@@ -15,7 +16,7 @@ class TestBooksIntegration(unittest.TestCase):
 
         # Using a test database for integration testing
         books.DATABASE = 'test_books.db'
-        with books.sqlite3.connect(books.DATABASE) as conn:
+        with sqlite3.connect(books.DATABASE) as conn:
             cursor = conn.cursor()
             # Create the books table
             cursor.execute('''
@@ -39,7 +40,7 @@ class TestBooksIntegration(unittest.TestCase):
 
     def tearDown(self):
         """Cleaning up the test database after each test."""
-        with books.sqlite3.connect(books.DATABASE) as conn:
+        with sqlite3.connect(books.DATABASE) as conn:
             cursor = conn.cursor()
             cursor.execute('DROP TABLE IF EXISTS reviews')
             cursor.execute('DROP TABLE IF EXISTS books')
@@ -1,6 +1,7 @@
 import unittest
 import sqlite3
 import books
+import migrations
 
 class TestBooks(unittest.TestCase):
 
@@ -27,6 +28,8 @@ class TestBooks(unittest.TestCase):
             )
         ''')
         self.conn.commit()
+        # Adding the indexes, search tables and rating_stats the module relies on
+        migrations.upgrade_books(self.conn)
 
         # Override books.get_connection to return the shared connection
         books.get_connection = lambda: self.conn
@@ -102,6 +105,16 @@ class TestBooks(unittest.TestCase):
         self.assertEqual(len(response[0]["reviews"]), 1)
         self.assertEqual(response[0]["reviews"][0]["note"], "Excellent book!")
 
+    def test_view_books_with_reviews_without_reviews(self):
+        """Testing that books without reviews are listed with an empty reviews list."""
+        books.add_book("1984", "Dystopian")
+        books.add_book("Brave New World", "Dystopian")
+        books.add_review(2, 4, "Good")
+        response = books.view_books_with_reviews()
+        self.assertEqual(len(response), 2)
+        self.assertEqual(response[0]["reviews"], [])
+        self.assertEqual(response[1]["reviews"][0]["note"], "Good")
+
     def test_view_book_genres(self):
         """Testing viewing distinct book genres."""
         books.add_book("1984", "Dystopian")
@@ -0,0 +1,247 @@
+# Bulk import and export of titles and reviews for movies, TV shows and books
+# Rows arrive as NDJSON or CSV streams and are validated and inserted in
+# chunks, one executemany and one transaction per chunk, so a large import
+# never holds more than a chunk in memory. Exports stream the same formats
+# straight from a database cursor.
+
+import csv
+import io
+import json
+import sqlite3
+import books
+import cache
+import events
+import movies
+import tv_shows
+
+# Rows per validation chunk and per transaction; also keeps the item id
+# existence check well under SQLite's bound-variable limit.
+CHUNK_SIZE = 500
+# Only the first errors are listed in the report; the rest are counted
+MAX_REPORTED_ERRORS = 1000
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# category -> connection module, catalog table and columns, review item column,
+# and the allowed rating range
+CATEGORIES = {
+    "movies": {"module": movies, "table": "movies", "columns": ("name", "genre"),
+               "item_column": "movie_id", "ratings": (0, 5)},
+    "tv_shows": {"module": tv_shows, "table": "tv_shows", "columns": ("title", "genre"),
+                 "item_column": "tv_show_id", "ratings": (0, 5)},
+    "books": {"module": books, "table": "books", "columns": ("title", "genre"),
+              "item_column": "book_id", "ratings": (1, 5)},
+}
+
+
+def request_format(content_type, requested=None):
+    """Returns "ndjson" or "csv" from an explicit format or a Content-Type, else None."""
+    if requested:
+        return requested if requested in FORMATS else None
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    for name, mimetype in FORMATS.items():
+        if content_type == mimetype:
+            return name
+    if content_type in ("application/json", "application/jsonl"):
+        return "ndjson"
+    return None
+
+
+def parse_records(lines, fmt):
+    """Yields (row number, dict) for each input row, or (row number, error message)."""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for number, record in enumerate(reader, start=1):
+            if None in record:
+                yield number, "row has more fields than the header"
+            else:
+                yield number, record
+        return
+    number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, f"invalid JSON: {e}"
+            continue
+        yield number, record if isinstance(record, dict) else "row must be a JSON object"
+
+
+def validate_title(record, spec):
+    """Returns the insert values for a catalog row, or an error message."""
+    values = []
+    for column in spec["columns"]:
+        value = record.get(column)
+        if not isinstance(value, str) or not value.strip():
+            return f"{column} is required"
+        values.append(value.strip())
+    return tuple(values)
+
+
+def validate_review(record, spec):
+    """Returns (item id, rating, note) for a review row, or an error message."""
+    item_column = spec["item_column"]
+    try:
+        item_id = int(record.get(item_column))
+    except (TypeError, ValueError):
+        return f"{item_column} must be an integer"
+    try:
+        rating = float(record.get("rating"))
+    except (TypeError, ValueError):
+        return "rating must be a number"
+    low, high = spec["ratings"]
+    if not low <= rating <= high:
+        return f"rating must be between {low} and {high}"
+    note = record.get("note")
+    if not isinstance(note, str) or not note.strip():
+        return "note is required"
+    return item_id, int(rating) if rating.is_integer() else rating, note
+
+
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ImportReport:
+    """Counts inserted rows and collects per-row errors for the response."""
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": number, "error": message})
+
+    def as_dict(self):
+        return {"rows": self.rows, "inserted": self.inserted, "error_count": self.error_count,
+                "errors": sorted(self.errors, key=lambda error: error["row"])}
+
+
+def insert_chunk(connection, sql, numbered_values, report):
+    """Inserts one chunk in a single transaction, falling back to row by row
+    inside a second transaction when a constraint rejects the batch."""
+    try:
+        with connection:
+            connection.executemany(sql, [values for _, values in numbered_values])
+        report.inserted += len(numbered_values)
+        return
+    except sqlite3.IntegrityError:
+        pass
+    with connection:
+        for number, values in numbered_values:
+            try:
+                connection.execute(sql, values)
+                report.inserted += 1
+            except sqlite3.IntegrityError as e:
+                report.error(number, str(e))
+
+
+def import_titles(category, records, chunk_size=None):
+    """Validates and inserts catalog rows; returns the import report as a dict."""
+    spec = CATEGORIES[category]
+    connection = spec["module"].get_connection()
+    columns = ", ".join(spec["columns"])
+    placeholders = ", ".join("?" for _ in spec["columns"])
+    sql = f"INSERT INTO {spec['table']} ({columns}) VALUES ({placeholders})"
+    report = ImportReport()
+    for chunk in chunks(records, chunk_size or CHUNK_SIZE):
+        valid = []
+        for number, record in chunk:
+            report.rows += 1
+            values = record if isinstance(record, str) else validate_title(record, spec)
+            if isinstance(values, str):
+                report.error(number, values)
+            else:
+                valid.append((number, values))
+        if valid:
+            insert_chunk(connection, sql, valid, report)
+            cache.invalidate(category)
+    if report.inserted:
+        events.publish(category, "titles_imported", {"inserted": report.inserted})
+    return report.as_dict()
+
+
+def import_reviews(category, records, chunk_size=None):
+    """Validates and inserts review rows, rejecting reviews of unknown items."""
+    spec = CATEGORIES[category]
+    connection = spec["module"].get_connection()
+    sql = f"INSERT INTO reviews ({spec['item_column']}, rating, note) VALUES (?, ?, ?)"
+    report = ImportReport()
+    for chunk in chunks(records, chunk_size or CHUNK_SIZE):
+        valid = []
+        for number, record in chunk:
+            report.rows += 1
+            values = record if isinstance(record, str) else validate_review(record, spec)
+            if isinstance(values, str):
+                report.error(number, values)
+            else:
+                valid.append((number, values))
+        # One IN query per chunk checks every referenced item exists
+        item_ids = sorted({values[0] for _, values in valid})
+        existing = set()
+        if item_ids:
+            placeholders = ", ".join("?" for _ in item_ids)
+            cursor = connection.execute(
+                f"SELECT id FROM {spec['table']} WHERE id IN ({placeholders})", item_ids)
+            existing = {row[0] for row in cursor}
+        known = []
+        for number, values in valid:
+            if values[0] in existing:
+                known.append((number, values))
+            else:
+                report.error(number, f"{spec['item_column']} {values[0]} does not exist")
+        if known:
+            insert_chunk(connection, sql, known, report)
+            cache.invalidate(category)
+    if report.inserted:
+        events.publish(category, "reviews_imported", {"inserted": report.inserted})
+    return report.as_dict()
+
+
+def encode_rows(columns, rows, fmt):
+    """Yields the header (CSV only) and one encoded line per row."""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+        return
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row))) + "\n"
+
+
+def export_titles(category, fmt):
+    """Streams every catalog row as NDJSON or CSV lines, in id order."""
+    spec = CATEGORIES[category]
+    columns = ("id",) + spec["columns"]
+    cursor = spec["module"].get_connection().execute(
+        f"SELECT {', '.join(columns)} FROM {spec['table']} ORDER BY id")
+    return encode_rows(columns, cursor, fmt)
+
+
+def export_reviews(category, fmt):
+    """Streams every review as NDJSON or CSV lines, in id order."""
+    spec = CATEGORIES[category]
+    columns = ("id", spec["item_column"], "rating", "note")
+    cursor = spec["module"].get_connection().execute(
+        f"SELECT {', '.join(columns)} FROM reviews ORDER BY id")
+    return encode_rows(columns, cursor, fmt)
@@ -0,0 +1,90 @@
+# Unit Tests for the bulk import and export endpoints
+
+import csv
+import io
+import json
+import os
+import unittest
+import books
+import bulk
+import movies
+import storage
+import tv_shows
+from api import app
+
+class TestBulkEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        """Pointing each module at a fresh database migrated by the storage layer."""
+        self.saved = {module: module.DATABASE for module in (movies, tv_shows, books)}
+        for module in self.saved:
+            module.DATABASE = f"test_bulk_{module.__name__}.db"
+        self.app = app.test_client()
+
+    def tearDown(self):
+        storage.close_all()
+        for module, database in self.saved.items():
+            if os.path.exists(module.DATABASE):
+                os.remove(module.DATABASE)
+            module.DATABASE = database
+
+    def test_import_ndjson_titles(self):
+        """Testing NDJSON title import with per-row errors."""
+        body = "\n".join([
+            json.dumps({"name": "Inception", "genre": "Science Fiction"}),
+            json.dumps({"name": "", "genre": "Drama"}),
+            "{not json",
+            json.dumps({"name": "Memento", "genre": "Thriller"}),
+        ])
+        response = self.app.post('/movies/bulk', data=body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        report = response.get_json()
+        self.assertEqual((report["rows"], report["inserted"], report["error_count"]), (4, 2, 2))
+        self.assertEqual([error["row"] for error in report["errors"]], [2, 3])
+        self.assertEqual([m["name"] for m in movies.view_reviews()], ["Inception", "Memento"])
+
+    def test_import_csv_reviews_in_chunks(self):
+        """Testing CSV review import across several chunks, rejecting unknown books."""
+        books.add_book("1984", "Dystopian")
+        rows = [{"book_id": 1, "rating": 1 + i % 5, "note": f"Review {i}"} for i in range(25)]
+        rows.append({"book_id": 2, "rating": 5, "note": "No such book"})
+        rows.append({"book_id": 1, "rating": 9, "note": "Out of range"})
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=["book_id", "rating", "note"])
+        writer.writeheader()
+        writer.writerows(rows)
+        saved_chunk_size = bulk.CHUNK_SIZE
+        bulk.CHUNK_SIZE = 10
+        try:
+            response = self.app.post('/books/reviews/bulk', data=buffer.getvalue(), content_type='text/csv')
+        finally:
+            bulk.CHUNK_SIZE = saved_chunk_size
+        report = response.get_json()
+        self.assertEqual((report["rows"], report["inserted"]), (27, 25))
+        self.assertEqual([error["row"] for error in report["errors"]], [26, 27])
+        self.assertEqual(books.view_rating_stats(1)["review_count"], 25)
+
+    def test_import_rejects_unknown_format(self):
+        """Testing that bodies that are neither NDJSON nor CSV are refused."""
+        response = self.app.post('/tv_shows/bulk', data="title;genre", content_type='text/plain')
+        self.assertEqual(response.status_code, 415)
+
+    def test_export_round_trip(self):
+        """Testing that exported NDJSON and CSV can be imported again."""
+        tv_shows.add_show("Breaking Bad", "Drama")
+        tv_shows.add_show("The Office", "Comedy")
+        tv_shows.add_review(1, 5, "Gripping, tense")
+        titles = self.app.get('/tv_shows/export').get_data(as_text=True)
+        self.assertEqual([json.loads(line)["title"] for line in titles.splitlines()], ["Breaking Bad", "The Office"])
+        reviews = self.app.get('/tv_shows/reviews/export?format=csv')
+        self.assertEqual(reviews.mimetype, 'text/csv')
+        exported = list(csv.DictReader(io.StringIO(reviews.get_data(as_text=True))))
+        self.assertEqual(exported[0]["note"], "Gripping, tense")
+        # Importing the exports again duplicates every row
+        self.app.post('/tv_shows/bulk', data=titles, content_type='application/x-ndjson')
+        report = self.app.post('/tv_shows/reviews/bulk', data=reviews.get_data(), content_type='text/csv').get_json()
+        self.assertEqual(report["inserted"], 1)
+        self.assertEqual(len(tv_shows.view_reviews()), 4)
+
+if __name__ == '__main__':
+    unittest.main()
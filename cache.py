@@ -0,0 +1,290 @@
+# Read-through cache for the movies, tv_shows and books read functions
+# Read functions are wrapped with @cached and write functions with
+# @invalidates; both name the tags a call touches (for example "item:3" or
+# "list") within the module's namespace, so a write drops exactly the
+# entries that could have changed. Writes from other processes are caught
+# by the namespace's database version, which every cached read checks first
+# (see track_version()). The backend is pluggable via configure().
+
+import functools
+import pickle
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+MISSING = object()
+
+
+class LRUCache:
+    """Size-bounded, thread-safe LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=1024, ttl=30.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires at, value, tags)
+        self._tagged = defaultdict(set)  # tag -> keys
+        self._generation = 0
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def generation(self):
+        """Returns a counter that changes on every invalidation."""
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            if entry[0] <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, tags, generation=None):
+        """Stores `value` unless an invalidation happened since `generation` was read,
+        in which case the value may already be stale."""
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self._clock() + self.ttl, value, tags)
+            for tag in tags:
+                self._tagged[tag].add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, tags):
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in self._tagged.pop(tag, ()):
+                    if key in self._entries:
+                        self._remove(key)
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tagged.clear()
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def stats(self):
+        return {"size": len(self._entries), "maxsize": self.maxsize, "ttl": self.ttl,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "expirations": self.expirations, "invalidations": self.invalidations}
+
+
+class NullCache:
+    """Backend that stores nothing; configure(backend=NullCache()) turns caching off."""
+
+    def generation(self):
+        return 0
+
+    def get(self, key):
+        return MISSING
+
+    def set(self, key, value, tags, generation=None):
+        pass
+
+    def invalidate(self, tags):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {"size": 0}
+
+
+_backend = LRUCache()
+_listeners = []
+_versions = {}  # namespace -> the database version validate() saw last
+_version_sources = {}  # namespace -> function reading its database version, see track_version()
+_versions_lock = threading.Lock()
+
+
+def configure(maxsize=None, ttl=None, backend=None):
+    """Replaces the cache backend, or resizes the default LRU backend."""
+    global _backend
+    if backend is None:
+        backend = LRUCache(maxsize if maxsize is not None else 1024, ttl if ttl is not None else 30.0)
+    _backend = backend
+    return _backend
+
+
+def stats():
+    return _backend.stats()
+
+
+def clear():
+    _backend.clear()
+
+
+def invalidate(namespace, *tags):
+    """Drops entries with the given tags in `namespace`, or all of it when no tags are given."""
+    _backend.invalidate([f"{namespace}:{tag}" for tag in tags] if tags else [namespace])
+    for listener in _listeners:
+        listener(namespace)
+
+
+def validate(namespace, version):
+    """Drops all of `namespace` if its database version moved since the last call.
+
+    Only writes made through this process invalidate by tag; this catches the
+    others (another worker, a direct SQL write), so a result read after
+    validate() is never older than `version`.
+    """
+    with _versions_lock:
+        previous = _versions.get(namespace)
+        _versions[namespace] = version
+    if previous is not None and previous != version:
+        _backend.invalidate([namespace])
+    return version
+
+
+def track_version(namespace, read_version):
+    """Makes every cached read in `namespace` revalidate() first, so a cached
+    result is never older than the last write from any process.
+
+    `read_version()` returns the namespace's database version, e.g.
+    storage.data_version() of the module's connection.
+    """
+    _version_sources[namespace] = read_version
+
+
+def revalidate(namespace):
+    """Reads `namespace`'s database version and validate()s it; returns the
+    version, or None if the namespace has no track_version()."""
+    read_version = _version_sources.get(namespace)
+    if read_version is not None:
+        return validate(namespace, read_version())
+    return None
+
+
+def _record_version(namespace):
+    """Takes the current version as seen without dropping anything: used right
+    after a write of this process, which invalidated its own tags."""
+    read_version = _version_sources.get(namespace)
+    if read_version is not None:
+        version = read_version()
+        with _versions_lock:
+            _versions[namespace] = version
+
+
+def _freeze(value):
+    """Results are cached pickled, and every hit unpickles its own copy, so a
+    caller changing its result cannot change what later callers get;
+    unpickling is several times faster than copying in Python."""
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def subscribe(listener):
+    """Calls `listener(namespace)` after every invalidation, i.e. after every write
+    through the backend modules; used to refresh derived data such as summary.py's."""
+    _listeners.append(listener)
+
+
+def unsubscribe(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def cached(namespace, tags):
+    """Caches a read function's results by arguments and the module's current DATABASE.
+
+    `tags(*args, **kwargs)` lists the tags the result depends on. Results that
+    report an error (dicts with an "error" key) are not cached, so a missing
+    item shows up as soon as it is created.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # Keyed on the module's DATABASE so switching databases never
+            # serves results read from another file
+            key = (namespace, func.__name__, func.__globals__.get("DATABASE"), args, tuple(sorted(kwargs.items())))
+            revalidate(namespace)
+            backend = _backend
+            frozen = backend.get(key)
+            if frozen is not MISSING:
+                return pickle.loads(frozen)
+            generation = backend.generation()
+            value = func(*args, **kwargs)
+            if not (isinstance(value, dict) and "error" in value):
+                entry_tags = [namespace] + [f"{namespace}:{tag}" for tag in tags(*args, **kwargs)]
+                backend.set(key, _freeze(value), entry_tags, generation)
+            return value
+        return wrapper
+    return decorator
+
+
+def cached_many(namespace, tags, single):
+    """Caches a batch read function item by item, in the entries of `single`.
+
+    `single` is the @cached function reading one item, e.g. search_reviews;
+    the decorated function takes a list of ids and returns `single`'s result
+    for each, in order. Cached ids are answered from the cache, only the rest
+    reach the function, and its results fill the cache for later single and
+    batch reads. `tags(item_id)` are `single`'s tags.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(ids):
+            target = single.__wrapped__
+            database = target.__globals__.get("DATABASE")
+            revalidate(namespace)
+            backend = _backend
+            results, missing = {}, []
+            for item_id in dict.fromkeys(ids):
+                frozen = backend.get((namespace, target.__name__, database, (item_id,), ()))
+                if frozen is MISSING:
+                    missing.append(item_id)
+                else:
+                    results[item_id] = frozen
+            if missing:
+                generation = backend.generation()
+                for item_id, value in zip(missing, func(missing)):
+                    results[item_id] = frozen = _freeze(value)
+                    if not (isinstance(value, dict) and "error" in value):
+                        entry_tags = [namespace] + [f"{namespace}:{tag}" for tag in tags(item_id)]
+                        backend.set((namespace, target.__name__, database, (item_id,), ()), frozen,
+                                    entry_tags, generation)
+            # Unpickled per position, so an id asked for twice gets two copies
+            return [pickle.loads(results[item_id]) for item_id in ids]
+        return wrapper
+    return decorator
+
+
+def invalidates(namespace, tags):
+    """Drops the cached entries a write function affects once it has run."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # Catches up with other processes' writes first, so the version
+            # recorded afterwards only moved past this write: SQLite lets no
+            # other writer commit while it runs
+            revalidate(namespace)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                invalidate(namespace, *tags(*args, **kwargs))
+                _record_version(namespace)
+        return wrapper
+    return decorator
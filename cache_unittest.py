@@ -0,0 +1,171 @@
+# Unit Tests for the LRU/TTL read cache and its invalidation by domain writes
+
+import contextlib
+import os
+import sqlite3
+import unittest
+import books
+import cache
+import movies
+import storage
+import tv_shows
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        """Testing that the oldest untouched entry goes first once the cache is full."""
+        lru = cache.LRUCache(maxsize=2)
+        lru.set("a", 1, ["t"])
+        lru.set("b", 2, ["t"])
+        lru.get("a")
+        lru.set("c", 3, ["t"])
+        self.assertIs(lru.get("b"), cache.MISSING)
+        self.assertEqual((lru.get("a"), lru.get("c")), (1, 3))
+        self.assertEqual(lru.stats()["evictions"], 1)
+
+    def test_entries_expire(self):
+        """Testing that entries are misses once their TTL has passed."""
+        clock = FakeClock()
+        lru = cache.LRUCache(ttl=10, clock=clock)
+        lru.set("a", 1, [])
+        clock.now = 9.9
+        self.assertEqual(lru.get("a"), 1)
+        clock.now = 10
+        self.assertIs(lru.get("a"), cache.MISSING)
+        stats = lru.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["expirations"]), (1, 1, 1))
+
+    def test_invalidate_by_tag(self):
+        """Testing that invalidating a tag drops only the entries carrying it."""
+        lru = cache.LRUCache()
+        lru.set("a", 1, ["movies", "movies:item:1"])
+        lru.set("b", 2, ["movies", "movies:item:2"])
+        lru.invalidate(["movies:item:1"])
+        self.assertIs(lru.get("a"), cache.MISSING)
+        self.assertEqual(lru.get("b"), 2)
+        lru.invalidate(["movies"])
+        self.assertIs(lru.get("b"), cache.MISSING)
+
+    def test_set_skips_values_read_before_an_invalidation(self):
+        """Testing that a read racing a write doesn't store the pre-write value."""
+        lru = cache.LRUCache()
+        generation = lru.generation()
+        lru.invalidate(["movies:list"])
+        lru.set("a", "stale", ["movies:list"], generation)
+        self.assertIs(lru.get("a"), cache.MISSING)
+
+class TestDomainCaching(unittest.TestCase):
+
+    def setUp(self):
+        """Pointing each module at a fresh database and starting from an empty cache."""
+        self.saved = {module: module.DATABASE for module in (movies, tv_shows, books)}
+        for module in self.saved:
+            module.DATABASE = f"test_cache_{module.__name__}.db"
+        self.lru = cache.configure(maxsize=100, ttl=60)
+
+    def tearDown(self):
+        cache.configure()
+        storage.close_all()
+        for module, database in self.saved.items():
+            if os.path.exists(module.DATABASE):
+                os.remove(module.DATABASE)
+            module.DATABASE = database
+
+    def test_reads_are_served_from_cache(self):
+        """Testing that a repeated read is a hit and returns the same result."""
+        movies.add_movie("Inception", "Sci-Fi")
+        first = movies.view_reviews()
+        self.assertEqual(movies.view_reviews(), first)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_review_write_invalidates_only_that_title(self):
+        """Testing that a review write drops the title's entries but not other titles'."""
+        movies.add_movie("Inception", "Sci-Fi")
+        movies.add_movie("Up", "Animation")
+        movies.search_reviews(1)
+        movies.search_reviews(2)
+        movies.view_movie_genre()
+        movies.add_review(1, 5, "Amazing movie!")
+        self.assertEqual(len(movies.search_reviews(1)["reviews"]), 1)
+        before = cache.stats()["hits"]
+        movies.search_reviews(2)
+        movies.view_movie_genre()
+        self.assertEqual(cache.stats()["hits"], before + 2)
+
+    def test_writes_keep_every_view_current(self):
+        """Testing that edits and deletes are visible through the cached reads."""
+        tv_shows.add_show("Lost", "Drama")
+        tv_shows.add_review(1, 2, "Confusing")
+        self.assertEqual(tv_shows.view_rating_stats(1)["rating_max"], 2)
+        self.assertEqual(len(tv_shows.search_by_genre("Drama")), 1)
+        tv_shows.edit_review(1, 1, rating=4)
+        self.assertEqual(tv_shows.view_rating_stats(1)["rating_max"], 4)
+        self.assertEqual(tv_shows.view_top_rated()[0]["average_rating"], 4)
+        tv_shows.delete_show(1)
+        self.assertEqual(tv_shows.search_by_genre("Drama"), [])
+        self.assertEqual(tv_shows.view_reviews(), [])
+
+    def test_cached_reads_see_writes_from_other_processes(self):
+        """Testing that every cached read revalidates: a write through another connection
+        (as from another worker) drops that namespace's entries, and only that namespace's."""
+        movies.add_movie("Inception", "Sci-Fi")
+        tv_shows.add_show("Lost", "Drama")
+        self.assertEqual(movies.view_movie_genre(), ["Sci-Fi"])
+        tv_shows.search_reviews(1)
+        movies.view_movie_genre()
+        self.assertEqual(cache.stats()["hits"], 1)
+        with contextlib.closing(sqlite3.connect(movies.DATABASE)) as other:
+            other.execute("INSERT INTO movies (name, genre) VALUES ('Up', 'Animation')")
+            other.commit()
+        self.assertEqual(len(movies.view_movie_genre()), 2)
+        tv_shows.search_reviews(1)
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (2, 3))
+
+    def test_callers_cannot_change_cached_results(self):
+        """Testing that changing a returned result leaves what later callers get intact."""
+        movies.add_movie("Inception", "Sci-Fi")
+        movies.add_review(1, 5, "Amazing")
+        for read in (lambda: movies.search_reviews(1), lambda: movies.search_reviews_many([1])[0]):
+            result = read()
+            result["reviews"].append({"note": "injected"})
+            result["title"] = "Changed"
+            self.assertEqual(read()["reviews"], [{"review_id": 1, "rating": 5, "note": "Amazing"}])
+
+    def test_missing_items_are_not_cached(self):
+        """Testing that a not-found result doesn't hide an item created afterwards."""
+        self.assertIn("error", books.search_reviews(1))
+        books.add_book("Dune", "Science Fiction")
+        self.assertEqual(books.search_reviews(1)["title"], "Dune")
+        self.assertEqual([b["title"] for b in books.search_by_genre("fiction")], ["Dune"])
+        books.add_book("Foundation", "Science Fiction")
+        self.assertEqual(len(books.search_by_genre("fiction")), 2)
+
+    def test_switching_databases_does_not_share_entries(self):
+        """Testing that the module's current DATABASE is part of the cache key."""
+        movies.add_movie("Inception", "Sci-Fi")
+        self.assertEqual(len(movies.view_reviews()), 1)
+        movies.DATABASE = "test_cache_other.db"
+        try:
+            self.assertEqual(movies.view_reviews(), [])
+        finally:
+            storage.close_all()
+            os.remove(movies.DATABASE)
+            movies.DATABASE = "test_cache_movies.db"
+
+    def test_null_cache_disables_caching(self):
+        """Testing that the NullCache backend reads through every time."""
+        cache.configure(backend=cache.NullCache())
+        movies.add_movie("Inception", "Sci-Fi")
+        movies.view_reviews()
+        self.assertEqual(cache.stats(), {"size": 0})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+# Unit Tests for the sorted catalog pages (GET /<category>/catalog) and the frontend's pager
+
+import asyncio
+import os
+import unittest
+import requests
+import api
+import api_client
+import books
+import cache
+import catalog_view
+import movies
+import storage
+import tv_shows
+import unified
+
+TEST_DATABASES = {movies: 'test_catalog_movies.db', tv_shows: 'test_catalog_tv_shows.db',
+                  books: 'test_catalog_books.db', unified: 'test_catalog_unified.db'}
+TITLES = [("Heat", "Crime"), ("Alien", "Sci-Fi"), ("Up", "Animation"), ("Brazil", "Sci-Fi"), ("Jaws", "Thriller")]
+RATINGS = {1: [4, 5], 2: [5], 3: [2], 5: [4, 5]}  # movie 4 has no reviews
+
+class FlakyClient:
+    """Fails the first request for a later page, then passes requests on to `client`."""
+
+    def __init__(self, client):
+        self.client = client
+        self.failures = 0
+
+    async def get(self, path, **kwargs):
+        if kwargs["params"].get("after") is not None and not self.failures:
+            self.failures += 1
+            raise requests.exceptions.ConnectionError("connection reset")
+        return await self.client.get(path, **kwargs)
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        """Adding the same five titles and their ratings to every category."""
+        self.saved = {module: module.DATABASE for module in TEST_DATABASES}
+        for module, path in TEST_DATABASES.items():
+            module.DATABASE = path
+        cache.configure()
+        for add_title, module in ((movies.add_movie, movies), (tv_shows.add_show, tv_shows),
+                                  (books.add_book, books), (unified.movies.add_movie, unified.movies)):
+            for title, genre in TITLES:
+                add_title(title, genre)
+            for item_id, ratings in RATINGS.items():
+                for rating in ratings:
+                    module.add_review(item_id, rating, "Note")
+        self.client = api.app.test_client()
+
+    def tearDown(self):
+        storage.close_all()
+        for module, path in TEST_DATABASES.items():
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            module.DATABASE = self.saved[module]
+        cache.configure()
+
+    def walk(self, module, sort, descending, limit):
+        ids, after = [], None
+        while True:
+            items, after = module.view_catalog_page(sort, descending, limit, after)
+            ids += [item["id"] for item in items]
+            if after is None:
+                return ids
+
+    def test_orders(self):
+        """Testing every sort in both directions and page sizes, unrated titles last by rating."""
+        expected = {("id", False): [1, 2, 3, 4, 5], ("title", False): [2, 4, 1, 5, 3],
+                    ("genre", True): [5, 4, 2, 1, 3], ("rating", True): [2, 1, 5, 3, 4],
+                    ("rating", False): [3, 5, 1, 2, 4]}
+        for module in (movies, tv_shows, books, unified.movies):
+            for (sort, descending), ids in expected.items():
+                for limit in (1, 2, 5, 10):
+                    self.assertEqual(self.walk(module, sort, descending, limit), ids, (module, sort, limit))
+        items, _ = movies.view_catalog_page("rating", True, 1)
+        self.assertEqual(items, [{"id": 2, "name": "Alien", "genre": "Sci-Fi", "review_count": 1,
+                                  "average_rating": 5.0}])
+
+    def test_endpoint(self):
+        """Testing the route's cursors, ETag and validation."""
+        first = self.client.get("/books/catalog?sort=title&limit=3").get_json()
+        self.assertEqual([item["title"] for item in first["items"]], ["Alien", "Brazil", "Heat"])
+        rest = self.client.get(f"/books/catalog?sort=title&limit=3&after={first['next']}").get_json()
+        self.assertEqual(([item["title"] for item in rest["items"]], rest["next"]), (["Jaws", "Up"], None))
+        etag = self.client.get("/books/catalog").headers["ETag"]
+        self.assertEqual(self.client.get("/books/catalog", headers={"If-None-Match": etag}).status_code, 304)
+        for query in ("sort=name", "order=up", "limit=0", "after=nope", "after=eyJhIjoxfQ=="):
+            self.assertEqual(self.client.get(f"/movies/catalog?{query}").status_code, 400, query)
+
+    def test_pager(self):
+        """Testing paging through the frontend table: prefetch, cache revalidation and sort changes."""
+        pager = catalog_view.CatalogPager(api_client.InProcessClient(api.app), "movies", "name", page_size=2)
+
+        async def run():
+            rows, status, state = await catalog_view.show(pager, None, "Title", "Ascending")
+            self.assertEqual([row[1] for row in rows], ["Alien", "Brazil"])
+            self.assertEqual(status, "Page 1")
+            await asyncio.sleep(0.2)  # the prefetch of page 2
+            fetches = pager.fetches
+            rows, status, state = await catalog_view.show(pager, state, "Title", "Ascending", "next")
+            self.assertEqual(([row[1] for row in rows], status), (["Heat", "Jaws"], "Page 2"))
+            # Page 2 came from the cache after a 304, and page 3 is being prefetched
+            self.assertEqual((pager.fetches, pager.revalidated), (fetches + 1, 1))
+            self.assertEqual(rows[0][3:], [2, "4.50"])
+            rows, status, state = await catalog_view.show(pager, state, "Title", "Ascending", "prev")
+            self.assertEqual(status, "Page 1")
+            rows, status, state = await catalog_view.show(pager, state, "Rating", "Descending", "next")
+            self.assertEqual(([row[1] for row in rows], status), (["Alien", "Heat"], "Page 1"))
+            movies.add_review(2, 1, "Changed my mind")
+            await catalog_view.show(pager, state, "Rating", "Descending", "first")
+            revalidated = pager.revalidated
+            rows, _, _ = await catalog_view.show(pager, None, "Title", "Ascending")
+            self.assertEqual(rows[0][3:], [2, "3.00"])
+            self.assertEqual(pager.revalidated, revalidated)
+        asyncio.run(run())
+        empty = catalog_view.CatalogPager(api_client.InProcessClient(api.app), "movies", "name")
+        movies.DATABASE = 'test_catalog_empty.db'
+        try:
+            rows, status, _ = asyncio.run(catalog_view.show(empty, None, "ID", "Ascending", empty="Nothing"))
+            self.assertEqual((rows, status), ([], "Nothing"))
+        finally:
+            storage.close_all()
+            os.remove(movies.DATABASE)
+            movies.DATABASE = TEST_DATABASES[movies]
+
+    def test_failed_prefetch_is_retried(self):
+        """Testing that a page whose prefetch fails while it is awaited is fetched again."""
+        client = FlakyClient(api_client.InProcessClient(api.app))
+        pager = catalog_view.CatalogPager(client, "movies", "name", page_size=2)
+
+        async def run():
+            first = await pager.page("title", "asc")
+            # The prefetch of page 2 has not run yet, so page() waits on it
+            self.assertIn(("title", "asc", first.next), pager._pending)
+            return await pager.page("title", "asc", first.next)
+        page = asyncio.run(run())
+        self.assertEqual([row[1] for row in page.rows], ["Heat", "Jaws"])
+        self.assertEqual(client.failures, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+# Paginated, sortable catalog tables for the Gradio frontend
+# Each table shows one page of GET /<category>/catalog, fetched through the
+# frontend's API client (api_client.connect). Rendered pages are kept in an LRU
+# shared by every session, keyed by sort, order and cursor; a cached page is
+# revalidated with its ETag, which costs an empty 304 unless something was
+# written. Once a page is shown the next one is fetched in the background, so
+# "Next" usually costs just that revalidation. Sessions only keep their sort,
+# order and the cursors of the pages they went through, so every interaction
+# costs the same however big the catalog is.
+
+import asyncio
+import collections
+
+import requests
+
+PAGE_SIZE = 20
+# Rendered pages kept per category
+CACHED_PAGES = 512
+# Table headers, and the dropdown labels for the API's sort and order values
+COLUMNS = ["ID", "Title", "Genre", "Reviews", "Avg rating"]
+SORTS = {"ID": "id", "Title": "title", "Genre": "genre", "Rating": "rating"}
+ORDERS = {"Ascending": "asc", "Descending": "desc"}
+
+Page = collections.namedtuple("Page", "rows next etag")
+
+
+class CatalogError(Exception):
+    """The API refused a page; the message is shown instead of the table."""
+
+
+class CatalogPager:
+    """Fetches, renders, caches and prefetches one category's catalog pages."""
+
+    def __init__(self, client, category, title_key, page_size=PAGE_SIZE, cached_pages=CACHED_PAGES):
+        self.client = client
+        self.category = category
+        self.title_key = title_key
+        self.page_size = page_size
+        self.cached_pages = cached_pages
+        self.fetches = 0
+        self.revalidated = 0
+        self._pages = collections.OrderedDict()  # (sort, order, after) -> Page
+        self._pending = {}  # (sort, order, after) -> asyncio.Task loading it
+
+    def render(self, item):
+        average = item["average_rating"]
+        return [item["id"], item[self.title_key], item["genre"], item["review_count"],
+                "-" if average is None else f"{average:.2f}"]
+
+    async def page(self, sort, order, after=None):
+        """Returns the Page after cursor `after` (None for the first) and starts
+        fetching the one after it."""
+        key = (sort, order, after)
+        pending = self._pending.get(key)
+        page = None
+        if pending is not None:
+            try:
+                page = await pending
+            except Exception:
+                pass  # The failed prefetch is retried below
+        if page is None:
+            page = await self._load(key)
+        if page.next is not None:
+            self.prefetch((sort, order, page.next))
+        return page
+
+    def prefetch(self, key):
+        if key in self._pages or key in self._pending:
+            return
+        task = asyncio.ensure_future(self._load(key))
+        self._pending[key] = task
+
+        def done(task):
+            self._pending.pop(key, None)
+            # A failed prefetch is retried when the page is asked for, see page()
+            if not task.cancelled():
+                task.exception()
+        task.add_done_callback(done)
+
+    async def _load(self, key):
+        sort, order, after = key
+        params = {"sort": sort, "order": order, "limit": self.page_size}
+        if after is not None:
+            params["after"] = after
+        cached = self._pages.get(key)
+        headers = {"If-None-Match": cached.etag} if cached is not None and cached.etag else None
+        response = await self.client.get(f"/{self.category}/catalog", params=params, headers=headers)
+        self.fetches += 1
+        if response.status_code == 304 and cached is not None:
+            self.revalidated += 1
+            self._pages.move_to_end(key)
+            return cached
+        if response.status_code != 200:
+            raise CatalogError(response.json().get("error", "Unexpected error"))
+        body = response.json()
+        page = Page([self.render(item) for item in body["items"]], body["next"], response.headers.get("etag"))
+        self._pages[key] = page
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.cached_pages:
+            self._pages.popitem(last=False)
+        return page
+
+
+async def show(pager, state, sort_label, order_label, move="first", empty="Nothing here yet."):
+    """Handles one interaction with a catalog table; returns (rows, status, state).
+
+    `move` is "first", "next", "prev" or "reload". `state` is None or the
+    dict returned last time, holding the sort, the order, the cursors of the
+    pages from the first to the current one, and the current page's next cursor.
+    """
+    sort, order = SORTS[sort_label], ORDERS[order_label]
+    if state is None or move == "first" or (state["sort"], state["order"]) != (sort, order):
+        cursors = [None]
+    else:
+        cursors = list(state["cursors"])
+        if move == "next" and state["next"] is not None:
+            cursors.append(state["next"])
+        elif move == "prev" and len(cursors) > 1:
+            cursors.pop()
+    try:
+        page = await pager.page(sort, order, cursors[-1])
+    except CatalogError as e:
+        return [], f"❌ Error: {e}", state
+    except requests.exceptions.RequestException as e:
+        return [], f"❌ Error: Failed to connect to the API - {str(e)}", state
+    if not page.rows and len(cursors) == 1:
+        status = empty
+    else:
+        status = f"Page {len(cursors)}" + ("" if page.next else " (last)")
+    return page.rows, status, {"sort": sort, "order": order, "cursors": cursors, "next": page.next}
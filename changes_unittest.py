@@ -0,0 +1,136 @@
+# Unit Tests for delta sync (row versions, tombstones and GET /<category>/changes)
+
+import json
+import os
+import sqlite3
+import unittest
+import api
+import cache
+import migrations
+import movies
+import storage
+import tv_shows
+import unified
+
+TEST_DATABASES = {movies: 'test_changes_movies.db', tv_shows: 'test_changes_tv_shows.db',
+                  unified: 'test_changes_unified.db'}
+
+class TestChanges(unittest.TestCase):
+
+    def setUp(self):
+        """Pointing the modules at empty databases."""
+        self.saved = {module: module.DATABASE for module in TEST_DATABASES}
+        for module, path in TEST_DATABASES.items():
+            module.DATABASE = path
+        cache.configure()
+        self.client = api.app.test_client()
+
+    def tearDown(self):
+        storage.close_all()
+        for module, path in TEST_DATABASES.items():
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            module.DATABASE = self.saved[module]
+        cache.configure()
+
+    def changes(self, module, since=0, limit=100):
+        return [json.loads(text) for _, text in module.view_changes_json(since, limit)]
+
+    def test_inserts_updates_and_deletes(self):
+        """Testing that each row appears once, at the version of its last change, and deletes as tombstones."""
+        movies.add_movie("Heat", "Crime")
+        movies.add_movie("Alien", "Sci-Fi")
+        movies.add_review(1, 4, "Good")
+        movies.add_review(2, 5, "Scary")
+        movies.edit_review(1, 1, rating=5)
+        movies.delete_movie(2)
+        changes = self.changes(movies)
+        self.assertEqual([(change["type"], change["id"], change["op"]) for change in changes],
+                         [("movie", 1, "upsert"), ("review", 1, "upsert"),
+                          ("review", 2, "delete"), ("movie", 2, "delete")])
+        self.assertEqual(changes[1]["data"], {"movie_id": 1, "rating": 5, "note": "Good"})
+        self.assertEqual(changes[2]["data"], None)
+        versions = [change["version"] for change in changes]
+        self.assertEqual(versions, sorted(set(versions)))
+        self.assertEqual(self.changes(movies, versions[-1]), [])
+        movies.edit_review(1, 1, note="Great")
+        self.assertEqual([(change["type"], change["data"]["note"]) for change in self.changes(movies, versions[-1])],
+                         [("review", "Great")])
+
+    def test_existing_rows_are_numbered(self):
+        """Testing that migrating a database with rows gives them distinct versions below new writes."""
+        conn = sqlite3.connect(movies.DATABASE)
+        migrations.migrate(conn, migrations.MOVIES[:6])
+        conn.executemany("INSERT INTO movies (name, genre) VALUES (?, ?)", [("Heat", "Crime"), ("Alien", "Sci-Fi")])
+        conn.execute("INSERT INTO reviews (movie_id, rating, note) VALUES (2, 5, 'Scary')")
+        conn.commit()
+        conn.close()
+        movies.add_review(1, 3, "Fine")
+        changes = self.changes(movies)
+        self.assertEqual([(change["type"], change["id"]) for change in changes],
+                         [("movie", 1), ("movie", 2), ("review", 1), ("review", 2)])
+        self.assertEqual(len({change["version"] for change in changes}), 4)
+
+    def test_cost_follows_changes_not_catalog_size(self):
+        """Testing that reading one change takes as many SQLite steps with 5000 titles as with 5."""
+        def steps_for_one_change(module, titles):
+            module.get_connection().executemany("INSERT INTO movies (name, genre) VALUES (?, 'Drama')",
+                                                [(f"Title {number}",) for number in range(titles)])
+            module.get_connection().commit()
+            since = json.loads(module.view_changes_json(0, 10 ** 6)[-1][1])["version"]
+            module.add_review(1, 4, "New")
+            steps = []
+            module.get_connection().set_progress_handler(lambda: steps.append(1), 10)
+            changes = module.view_changes_json(since, 100)
+            module.get_connection().set_progress_handler(None, 0)
+            self.assertEqual(len(changes), 1)
+            return len(steps)
+
+        small = steps_for_one_change(movies, 5)
+        movies.DATABASE = 'test_changes_large.db'
+        try:
+            large = steps_for_one_change(movies, 5000)
+        finally:
+            storage.close_all()
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists('test_changes_large.db' + suffix):
+                    os.remove('test_changes_large.db' + suffix)
+            movies.DATABASE = TEST_DATABASES[movies]
+        self.assertLessEqual(large, small + 2)
+
+    def test_unified_changes_are_per_category(self):
+        """Testing that the unified database reports each category's changes under its own keys."""
+        unified.movies.add_movie("Heat", "Crime")
+        unified.tv_shows.add_show("Lost", "Drama")
+        unified.tv_shows.add_review(1, 4, "Good")
+        unified.tv_shows.delete_review(1, 1)
+        self.assertEqual([(change["type"], change["data"]) for change in self.changes(unified.movies)],
+                         [("movie", {"name": "Heat", "genre": "Crime"})])
+        self.assertEqual([(change["type"], change["op"]) for change in self.changes(unified.tv_shows)],
+                         [("show", "upsert"), ("review", "delete")])
+
+    def test_endpoint_pages_through_changes(self):
+        """Testing GET /<category>/changes: paging with next and more, the ETag and validation."""
+        for number in range(5):
+            tv_shows.add_show(f"Show {number}", "Drama")
+        tv_shows.delete_show(2)
+        seen, since = [], 0
+        while True:
+            response = self.client.get(f"/tv_shows/changes?since={since}&limit=2")
+            self.assertEqual(response.status_code, 200)
+            body = response.get_json()
+            seen += [(change["id"], change["op"]) for change in body["items"]]
+            since = body["next"]
+            if not body["more"]:
+                break
+        self.assertEqual(seen, [(1, "upsert"), (3, "upsert"), (4, "upsert"), (5, "upsert"), (2, "delete")])
+        response = self.client.get(f"/tv_shows/changes?since={since}")
+        self.assertEqual(response.get_json(), {"items": [], "next": since, "more": False})
+        cached = self.client.get(f"/tv_shows/changes?since={since}", headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(cached.status_code, 304)
+        for query in ("since=x", "since=-1", "limit=0", f"limit={api.MAX_PAGE_SIZE + 1}"):
+            self.assertEqual(self.client.get(f"/tv_shows/changes?{query}").status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
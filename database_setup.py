@@ -1,65 +1,24 @@
 # Author: Aditi Jha, December 2, 2024
 # Setting up sqlite3 database for the project
+# The table and index definitions live in migrations.py; these functions bring
+# each database file up to the latest schema version.
 
 import sqlite3
+import migrations
 
 
 
 # Movies tab database, author Aditi, december 2, 2024
 def initialize_db():
     conn = sqlite3.connect('movie_reviews.db')
-    cursor = conn.cursor()
-    
-    # Creating  movies table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS movies (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            genre TEXT NOT NULL
-        )
-    ''')
-
-    # Creating reviews table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reviews (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            movie_id INTEGER NOT NULL,
-            rating INTEGER NOT NULL,
-            note TEXT NOT NULL,
-            FOREIGN KEY (movie_id) REFERENCES movies (id)
-        )
-    ''')
-
-    conn.commit()
+    migrations.upgrade_movies(conn)
     conn.close()
 # Tv_shows
 #Mastewal
 def initialize_tvshow_db():
     """Initialize the database and create tables if they don't exist."""
     conn = sqlite3.connect("tv_shows_reviews.db")
-    cursor = conn.cursor()
-
-    # Create tv_shows table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tv_shows (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            genre TEXT NOT NULL
-        )
-    ''')
-
-    # Create reviews table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reviews (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tv_show_id INTEGER NOT NULL,
-            rating REAL NOT NULL DEFAULT 0, -- Ensure valid default for ratings
-            note TEXT,
-            FOREIGN KEY (tv_show_id) REFERENCES tv_shows (id) ON DELETE CASCADE
-        )
-    ''')
-
-    conn.commit()
+    migrations.upgrade_tv_shows(conn)
     conn.close()
 
 
@@ -67,28 +26,7 @@ def initialize_tvshow_db():
 #books
 def initialize_database():
     conn = sqlite3.connect('books.db')
-    # connection = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS books (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            title VARCHAR(255) NOT NULL,
-            genre VARCHAR(100),
-            reviews_count INT DEFAULT 0
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reviews (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            book_id INT NOT NULL,
-            rating INT NOT NULL,
-            note TEXT,
-            FOREIGN KEY (book_id) REFERENCES books (id) ON DELETE CASCADE
-        )
-    ''')
-    # connection.commit()
-    # connection.close()
-    conn.commit()
+    migrations.upgrade_books(conn)
     conn.close()
 
 
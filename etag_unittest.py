@@ -0,0 +1,92 @@
+# Unit Tests for ETag / If-None-Match handling on the catalog and review endpoints
+
+import os
+import sqlite3
+import unittest
+import books
+import cache
+import movies
+import storage
+import tv_shows
+from api import app
+
+class TestConditionalRequests(unittest.TestCase):
+
+    def setUp(self):
+        """Pointing each module at a fresh database migrated by the storage layer."""
+        self.saved = {module: module.DATABASE for module in (movies, tv_shows, books)}
+        for module in self.saved:
+            module.DATABASE = f"test_etag_{module.__name__}.db"
+        self.app = app.test_client()
+
+    def tearDown(self):
+        storage.close_all()
+        for module, database in self.saved.items():
+            if os.path.exists(module.DATABASE):
+                os.remove(module.DATABASE)
+            module.DATABASE = database
+
+    def test_unchanged_list_returns_304(self):
+        """Testing that polling with the last ETag gets an empty 304 until a write."""
+        movies.add_movie("Inception", "Science Fiction")
+        response = self.app.get('/movies')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+        response = self.app.get('/movies', headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b"")
+        self.assertEqual(response.headers["ETag"], etag)
+        movies.add_review(1, 5, "Amazing movie!")
+        response = self.app.get('/movies', headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_every_write_changes_the_etag(self):
+        """Testing that inserts, updates and deletes on both tables change the version."""
+        versions = [tv_shows.data_version()]
+        tv_shows.add_show("Lost", "Drama")
+        versions.append(tv_shows.data_version())
+        tv_shows.add_review(1, 3, "Confusing")
+        versions.append(tv_shows.data_version())
+        tv_shows.edit_review(1, 1, note="Got better")
+        versions.append(tv_shows.data_version())
+        tv_shows.delete_show(1)
+        versions.append(tv_shows.data_version())
+        self.assertEqual(len(set(versions)), len(versions))
+
+    def test_review_and_paged_endpoints(self):
+        """Testing conditional GETs on item reviews, pages and other categories."""
+        books.add_book("Dune", "Science Fiction")
+        for url in ('/books', '/books?limit=1', '/books/1'):
+            etag = self.app.get(url).headers["ETag"]
+            self.assertEqual(self.app.get(url, headers={"If-None-Match": etag}).status_code, 304)
+        tv_shows.add_show("Lost", "Drama")
+        etag = self.app.get('/tv_shows/1/reviews').headers["ETag"]
+        response = self.app.get('/tv_shows/1/reviews', headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_errors_carry_no_etag(self):
+        """Testing that error responses are not made conditional."""
+        response = self.app.get('/movies?limit=0')
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn("ETag", response.headers)
+
+    def test_write_from_another_process_is_not_served_stale(self):
+        """Testing that a cached body is never sent under the ETag of a later write made
+        outside this process (another worker, a bulk import)."""
+        cache.configure()
+        movies.add_movie("Inception", "Science Fiction")
+        first = self.app.get('/movies/1/reviews')
+        self.assertEqual(first.get_json()["reviews"], [])
+        with sqlite3.connect(movies.DATABASE) as conn:
+            conn.execute("INSERT INTO reviews (movie_id, rating, note) VALUES (1, 5, 'Elsewhere')")
+        conn.close()
+        second = self.app.get('/movies/1/reviews', headers={"If-None-Match": first.headers["ETag"]})
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual([review["note"] for review in second.get_json()["reviews"]], ["Elsewhere"])
+        self.assertEqual(self.app.get('/movies/1/reviews', headers={"If-None-Match": second.headers["ETag"]})
+                         .status_code, 304)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,344 @@
+# Change events for GET /events (server-sent events)
+# The domain write functions publish typed events -- movie_added,
+# review_edited, show_deleted, ... -- after they commit, with the ids the
+# write created or touched; a write that matched no row publishes nothing.
+# Publishing only appends to one shared, bounded history and sets a flag, so
+# its cost does not depend on how many clients are listening: a dispatcher
+# thread wakes the subscribers, at most once per COALESCE seconds however
+# many writes land in between. Each subscriber reads the history from its own
+# position; one that falls more than its buffer behind (a slow consumer) is
+# dropped and has to reload and resubscribe. Subscribers wait either on a
+# thread (Subscription.wait) or as a coroutine on an event loop
+# (Subscription.wait_async), which is how asgi.py streams /events without a
+# thread per client.
+# The default Broker only sees the writes of its own process. Under several
+# worker processes, server.py and asgi.py configure a SharedBroker instead:
+# publish() appends to a SQLite event log all the workers share, whose ids
+# are the event ids, and each worker's dispatcher polls the log for the
+# events other workers wrote, so every client sees every write and
+# Last-Event-ID resumes work whichever worker a client reconnects to.
+
+import asyncio
+import collections
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import migrations
+import storage
+
+# Events kept per category for subscribers to catch up on (and for Last-Event-ID resumes)
+HISTORY = 4096
+# Events a subscriber may fall behind before it is dropped
+BUFFER = 1024
+# Seconds the dispatcher waits after a publish, so bursts wake subscribers once
+COALESCE = 0.01
+# Seconds between a SharedBroker's reads of the event log (its own writes are read at once)
+POLL = 0.1
+# Shared event log used by the multi-process launcher, see configure()
+DATABASE = 'events.db'
+# Event type prefix for title writes per category (movie_added, show_deleted, ...)
+TITLE_EVENTS = {"movies": "movie", "tv_shows": "show", "books": "book"}
+
+log = logging.getLogger("events")
+
+Event = collections.namedtuple("Event", "id category type data")
+
+
+class Dropped(Exception):
+    """The subscriber fell behind by more than its buffer or past the history,
+    or resumed from an event id the broker never issued."""
+
+
+class Broker:
+    """Bounded per-category event histories shared by every subscriber of a process."""
+
+    # Seconds the dispatcher waits for a publish before calling _collect() anyway
+    poll = None
+
+    def __init__(self, history=HISTORY, coalesce=COALESCE):
+        self.history = history
+        self.coalesce = coalesce
+        self.subscribers = 0
+        self._last_id = 0
+        self._floor = 0  # events up to this id were never loaded, so cannot be replayed
+        self._events = {}  # category -> deque of its latest Events
+        self._evicted = {}  # category -> id of the newest event that left its history
+        self._dirty = set()  # categories published since the dispatcher last ran
+        self._wake = {}  # subscribed categories (a frozenset, or None for all) -> Condition
+        self._wake_async = {}  # (subscribed categories, event loop) -> Future the next wake-up resolves
+        self.wakeups = collections.Counter()  # subscribed categories -> times the dispatcher woke them
+        self._lock = threading.Lock()
+        self._published = threading.Event()
+        self._dispatcher = None
+        self._closed = False
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, category, event_type, data):
+        with self._lock:
+            self._last_id += 1
+            self._append(Event(self._last_id, category, event_type, data))
+        self._published.set()
+
+    def _append(self, event):
+        events = self._events.get(event.category)
+        if events is None:
+            events = self._events[event.category] = collections.deque()
+        if len(events) == self.history:
+            self._evicted[event.category] = events.popleft().id
+        events.append(event)
+        self._dirty.add(event.category)
+
+    def _collect(self):
+        """Loads events published elsewhere; the in-process broker has none."""
+
+    def subscribe(self, categories=None, buffer=BUFFER, last_id=None):
+        """Returns a Subscription to `categories` (all if None), starting after
+        event `last_id` if given and otherwise with the next event published."""
+        key = None if categories is None else frozenset(categories)
+        with self._lock:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name="events-dispatch", daemon=True)
+                self._dispatcher.start()
+            wake = self._wake.setdefault(key, threading.Condition())
+            self.subscribers += 1
+            return Subscription(self, key, wake, buffer, self._last_id if last_id is None else last_id)
+
+    def unsubscribe(self):
+        with self._lock:
+            self.subscribers -= 1
+
+    def close(self):
+        """Stops the dispatcher; subscribers get no further events."""
+        with self._lock:
+            self._closed = True
+            dispatcher = self._dispatcher
+        self._published.set()
+        if dispatcher is not None:
+            dispatcher.join()
+
+    def _dispatch(self):
+        # Wakes only the subscribers of the categories that were written
+        while True:
+            self._published.wait(self.poll)
+            time.sleep(self.coalesce)
+            self._published.clear()
+            if self._closed:
+                return
+            self._collect()
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                waiting = [(key, wake) for key, wake in self._wake.items() if key is None or key & dirty]
+                woken = [(key, self._wake_async.pop((key, loop)), loop)
+                         for key, loop in list(self._wake_async) if key is None or key & dirty]
+            for key, wake in waiting:
+                with wake:
+                    wake.notify_all()
+                self.wakeups[key] += 1
+            for key, future, loop in woken:
+                try:
+                    loop.call_soon_threadsafe(_resolve, future)
+                except RuntimeError:  # the loop was closed
+                    continue
+                self.wakeups[key] += 1
+
+    def wake_future(self, categories):
+        """Returns a future of the running event loop that the dispatcher resolves
+        the next time it wakes the subscribers of `categories`."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            future = self._wake_async.get((categories, loop))
+            if future is None:
+                future = self._wake_async[(categories, loop)] = loop.create_future()
+            return future
+
+    def read(self, categories, after, buffer):
+        """Returns (the events in `categories` after id `after`, the id read up to);
+        raises Dropped if there are more than `buffer`, some left the history or
+        `after` is newer than any event this broker has."""
+        with self._lock:
+            if after > self._last_id:
+                # The client saw ids from before a restart that numbered events anew
+                raise Dropped(f"event {after} is newer than the latest event {self._last_id}")
+            found = []
+            for category in self._events if categories is None else categories:
+                if max(self._floor, self._evicted.get(category, 0)) > after:
+                    raise Dropped(f"{category} events after {after} are no longer kept")
+                for event in reversed(self._events.get(category, ())):
+                    if event.id <= after:
+                        break
+                    found.append(event)
+                    if len(found) > buffer:
+                        raise Dropped(f"more than {buffer} events behind")
+            found.sort()
+            return found, self._last_id
+
+    def has_new(self, categories, after):
+        with self._lock:
+            for category in self._events if categories is None else categories:
+                events = self._events.get(category)
+                if events and events[-1].id > after:
+                    return True
+            return False
+
+
+class SharedBroker(Broker):
+    """Broker whose events go through a SQLite log shared by every process using `database`.
+
+    publish() commits the event to the log; the dispatcher reads new rows
+    every POLL seconds, or as soon as this process publishes, into the same
+    per-category histories the in-process broker keeps. The log keeps about
+    `history` events per category and is pruned as it grows.
+    """
+
+    poll = POLL
+
+    def __init__(self, database, history=HISTORY, coalesce=COALESCE, poll=POLL):
+        super().__init__(history, coalesce)
+        self.database = database
+        self.poll = poll
+        self.keep = history * len(TITLE_EVENTS)  # rows the log keeps behind its newest event
+        self._collect_lock = threading.Lock()
+
+    def get_connection(self):
+        return storage.get_connection(self.database, migrations.upgrade_events)
+
+    def publish(self, category, event_type, data):
+        # The write this event reports has committed already, so failing here
+        # would turn a successful write into an error the client may retry
+        try:
+            conn = self.get_connection()
+            with conn:
+                event_id = conn.execute('INSERT INTO events (category, type, data) VALUES (?, ?, ?)',
+                                        (category, event_type, json.dumps(data, default=str))).lastrowid
+                if event_id % self.history == 0:
+                    conn.execute('DELETE FROM events WHERE id <= ?', (event_id - self.keep,))
+        except sqlite3.Error:
+            log.exception("could not log %s event %s", category, event_type)
+            return
+        self._published.set()
+
+    def subscribe(self, categories=None, buffer=BUFFER, last_id=None):
+        # Reads the log first, so a new subscriber starts after its newest event
+        self._collect()
+        return super().subscribe(categories, buffer, last_id)
+
+    def _collect(self):
+        """Loads the log's events newer than the last one loaded, at most `keep` of them."""
+        with self._collect_lock:
+            rows = self.get_connection().execute(
+                'SELECT id, category, type, data FROM events '
+                'WHERE id > MAX(?, (SELECT IFNULL(MAX(id), 0) FROM events) - ?) ORDER BY id',
+                (self._last_id, self.keep)).fetchall()
+            if not rows:
+                return
+            with self._lock:
+                # Ids only skip when rows were pruned before this process read them
+                if rows[0][0] > self._last_id + 1:
+                    self._floor = rows[0][0] - 1
+                for event_id, category, event_type, data in rows:
+                    self._append(Event(event_id, category, event_type, json.loads(data)))
+                self._last_id = rows[-1][0]
+
+
+class Subscription:
+    """One client's position in the broker's histories."""
+
+    def __init__(self, broker, categories, wake, buffer, last_id):
+        self.broker = broker
+        self.categories = categories
+        self.buffer = buffer
+        self.last_id = last_id
+        self.closed = False
+        self._wake = wake
+
+    def wait(self, timeout=None):
+        """Returns the next events for this subscriber, or [] after `timeout`
+        seconds without any; raises Dropped for a slow consumer."""
+        broker = self.broker
+        events, self.last_id = broker.read(self.categories, self.last_id, self.buffer)
+        if not events:
+            with self._wake:
+                if not broker.has_new(self.categories, self.last_id):
+                    self._wake.wait(timeout)
+            events, self.last_id = broker.read(self.categories, self.last_id, self.buffer)
+        return events
+
+    async def wait_async(self, timeout=None):
+        """wait() for a coroutine: waits on the running event loop, holding no thread."""
+        broker = self.broker
+        events, self.last_id = broker.read(self.categories, self.last_id, self.buffer)
+        if not events:
+            woken = broker.wake_future(self.categories)
+            if not broker.has_new(self.categories, self.last_id):
+                try:
+                    # Shielded: the future is shared by every subscriber of these categories on this loop
+                    await asyncio.wait_for(asyncio.shield(woken), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            events, self.last_id = broker.read(self.categories, self.last_id, self.buffer)
+        return events
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.broker.unsubscribe()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def parse_request(category=None, last_event_id=None):
+    """Returns (categories or None for all, last event id or None) for a
+    GET /events request's category parameter and Last-Event-ID header;
+    raises ValueError with a message for the client if either is invalid."""
+    categories = None
+    if category:
+        categories = category.split(",")
+        unknown = [name for name in categories if name not in TITLE_EVENTS]
+        if unknown:
+            raise ValueError(f"Unknown category '{unknown[0]}'")
+    try:
+        last_id = int(last_event_id) if last_event_id is not None else None
+    except ValueError:
+        raise ValueError("Last-Event-ID must be an event id") from None
+    return categories, last_id
+
+
+def format_event(event):
+    """The event as a text/event-stream message."""
+    data = json.dumps({"category": event.category, **event.data}, separators=(",", ":"), default=str)
+    return f"id: {event.id}\nevent: {event.type}\ndata: {data}\n\n"
+
+
+def format_dropped(error):
+    """The final message to a dropped subscriber."""
+    return f"event: dropped\ndata: {json.dumps({'error': str(error)})}\n\n"
+
+
+broker = Broker()
+
+
+def shared_database():
+    """The event log multi-process servers share: EVENTS_DATABASE if set, else DATABASE."""
+    return os.environ.get("EVENTS_DATABASE", DATABASE)
+
+
+def configure(database=None, **settings):
+    """Replaces the broker with a SharedBroker on `database` if given, else an
+    in-process Broker, and closes the old one."""
+    global broker
+    broker.close()
+    broker = Broker(**settings) if database is None else SharedBroker(database, **settings)
+
+
+def publish(category, event_type, data):
+    broker.publish(category, event_type, data)
+
@@ -0,0 +1,260 @@
+# Unit Tests for the change events (events.py and GET /events)
+
+import asyncio
+import os
+import threading
+import unittest
+import api
+import books
+import cache
+import events
+import movies
+import storage
+import tv_shows
+import unified
+
+TEST_DATABASES = {movies: 'test_events_movies.db', tv_shows: 'test_events_tv_shows.db',
+                  books: 'test_events_books.db'}
+TEST_LOG = 'test_events_log.db'
+
+
+def wait_for(subscription, count):
+    """Collects events until there are `count`, for up to a second."""
+    received = []
+    for _ in range(10):
+        received += subscription.wait(0.1)
+        if len(received) >= count:
+            break
+    return received
+
+class TestEvents(unittest.TestCase):
+
+    def setUp(self):
+        """Pointing the modules at empty databases and giving events a fresh broker."""
+        self.saved = {module: module.DATABASE for module in TEST_DATABASES}
+        for module, path in TEST_DATABASES.items():
+            module.DATABASE = path
+        cache.configure()
+        self.saved_broker = events.broker
+        events.broker = events.Broker(coalesce=0.001)
+
+    def tearDown(self):
+        events.broker.close()
+        events.broker = self.saved_broker
+        storage.close_all()
+        for module, path in TEST_DATABASES.items():
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            module.DATABASE = self.saved[module]
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_LOG + suffix):
+                os.remove(TEST_LOG + suffix)
+        cache.configure()
+
+    def test_writes_publish_typed_events(self):
+        """Testing that each domain write publishes its event type and arguments, in order."""
+        subscription = events.broker.subscribe()
+        movies.add_movie("Heat", "Crime")
+        movies.add_review(1, 5, "Great")
+        movies.edit_review(1, 1, note="Still great")
+        tv_shows.add_show("Lost", "Drama")
+        books.add_book("Dune", "Sci-Fi")
+        books.delete_book(1)
+        received = subscription.wait(1)
+        self.assertEqual([(event.category, event.type) for event in received],
+                         [("movies", "movie_added"), ("movies", "review_added"), ("movies", "review_edited"),
+                          ("tv_shows", "show_added"), ("books", "book_added"), ("books", "book_deleted")])
+        self.assertEqual(received[0].data, {"movie_id": 1, "name": "Heat", "genre": "Crime"})
+        self.assertEqual(received[1].data, {"movie_id": 1, "review_id": 1, "rating": 5, "note": "Great"})
+        self.assertEqual(received[2].data, {"movie_id": 1, "review_id": 1, "rating": None, "note": "Still great"})
+        self.assertEqual(received[4].data, {"book_id": 1, "title": "Dune", "genre": "Sci-Fi"})
+        self.assertEqual(received[5].data, {"book_id": 1, "reviews_deleted": 0})
+        self.assertEqual([event.id for event in received], sorted(event.id for event in received))
+
+    def test_writes_that_change_nothing_publish_nothing(self):
+        """Testing that edits and deletes of missing ids publish no event, in the modules and the unified database."""
+        saved = unified.DATABASE
+        unified.DATABASE = 'test_events_unified.db'
+        try:
+            subscription = events.broker.subscribe()
+            for module in (movies, tv_shows, books, unified.movies):
+                module.edit_review(1, 1, rating=3, note="Missing")
+                module.delete_review(1, 1)
+            movies.delete_movie(1)
+            tv_shows.delete_show(1)
+            books.delete_book(1)
+            unified.movies.delete_movie(1)
+            unified.movies.add_movie("Heat", "Crime")
+            unified.movies.add_review(1, 4, "Good")
+            unified.movies.delete_review(1, 2)
+            received = subscription.wait(1)
+            self.assertEqual([(event.type, event.data) for event in received],
+                             [("movie_added", {"movie_id": 1, "name": "Heat", "genre": "Crime"}),
+                              ("review_added", {"movie_id": 1, "review_id": 1, "rating": 4, "note": "Good"})])
+        finally:
+            storage.close_all()
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(unified.DATABASE + suffix):
+                    os.remove(unified.DATABASE + suffix)
+            unified.DATABASE = saved
+
+    def test_category_filter_and_resume(self):
+        """Testing that a subscriber only gets its categories and can resume after an event id."""
+        subscription = events.broker.subscribe(["books", "tv_shows"])
+        movies.add_movie("Heat", "Crime")
+        books.add_book("Dune", "Sci-Fi")
+        tv_shows.add_show("Lost", "Drama")
+        received = subscription.wait(1)
+        self.assertEqual([event.type for event in received], ["book_added", "show_added"])
+        self.assertEqual(subscription.wait(0.01), [])
+        resumed = events.broker.subscribe(last_id=received[0].id)
+        self.assertEqual([event.type for event in resumed.wait(1)], ["show_added"])
+
+    def test_coroutines_wait_on_the_event_loop(self):
+        """Testing that wait_async() returns [] on timeout and is woken by writes from other threads."""
+        async def follow():
+            subscription = events.broker.subscribe(["movies"])
+            self.assertEqual(await subscription.wait_async(0.01), [])
+            threading.Thread(target=movies.add_movie, args=("Heat", "Crime")).start()
+            return await subscription.wait_async(5)
+        self.assertEqual([event.type for event in asyncio.run(follow())], ["movie_added"])
+
+    def test_slow_consumer_is_dropped(self):
+        """Testing that a subscriber more than its buffer behind is dropped, and a fast one is not."""
+        slow = events.broker.subscribe(["movies"], buffer=3)
+        fast = events.broker.subscribe(["movies"], buffer=3)
+        movies.add_movie("Heat", "Crime")
+        for rating in range(1, 5):
+            movies.add_review(1, rating, "Again")
+            self.assertEqual(len(fast.wait(1)), 2 if rating == 1 else 1)
+        with self.assertRaises(events.Dropped):
+            slow.wait(1)
+        # Events that left a category's history are lost too
+        events.broker.close()
+        events.broker = events.Broker(history=2, coalesce=0.001)
+        behind = events.broker.subscribe(["movies"], buffer=100)
+        for rating in range(3):
+            movies.add_review(1, rating + 1, "More")
+        with self.assertRaises(events.Dropped):
+            behind.wait(1)
+
+    def test_shared_log_reaches_every_process(self):
+        """Testing that brokers sharing an event log, one per worker process, see
+        each other's writes under the same ids, and that a restarted one can resume."""
+        events.broker.close()
+        events.broker = events.SharedBroker(TEST_LOG, coalesce=0.001, poll=0.01)
+        other = events.SharedBroker(TEST_LOG, coalesce=0.001, poll=0.01)
+        restarted = None
+        try:
+            on_other = other.subscribe(["movies"])
+            movies.add_movie("Heat", "Crime")
+            movies.add_review(1, 5, "Great")
+            tv_shows.add_show("Lost", "Drama")
+            received = wait_for(on_other, 2)
+            self.assertEqual([(event.id, event.type) for event in received], [(1, "movie_added"), (2, "review_added")])
+            self.assertEqual(received[1].data, {"movie_id": 1, "review_id": 1, "rating": 5, "note": "Great"})
+            restarted = events.SharedBroker(TEST_LOG, coalesce=0.001, poll=0.01)
+            self.assertEqual([event.type for event in wait_for(restarted.subscribe(last_id=1), 2)],
+                             ["review_added", "show_added"])
+            self.assertEqual(restarted.subscribe().last_id, 3)
+        finally:
+            other.close()
+            if restarted is not None:
+                restarted.close()
+
+    def test_shared_log_is_pruned(self):
+        """Testing that the shared log keeps about `history` events per category, and
+        that resuming from a pruned event is refused rather than silently skipping."""
+        events.broker.close()
+        events.broker = events.SharedBroker(TEST_LOG, history=2, coalesce=0.001)
+        movies.add_movie("Heat", "Crime")
+        for rating in range(1, 10):
+            movies.add_review(1, rating, "Again")
+        kept = events.broker.get_connection().execute("SELECT MIN(id), MAX(id) FROM events").fetchone()
+        self.assertEqual(kept, (5, 10))
+        with self.assertRaises(events.Dropped):
+            events.broker.subscribe(last_id=3).wait(1)
+        self.assertEqual([event.id for event in wait_for(events.broker.subscribe(last_id=8), 2)], [9, 10])
+
+    def test_resuming_past_a_restart_is_dropped(self):
+        """Testing that a Last-Event-ID from before the broker restarted is refused, not silently skipped."""
+        for name in ("Heat", "Alien", "Up"):
+            movies.add_movie(name, "Drama")
+        last_id = events.broker.last_id
+        events.broker.close()
+        events.broker = events.Broker(coalesce=0.001)
+        movies.add_movie("Jaws", "Thriller")
+        with self.assertRaises(events.Dropped):
+            events.broker.subscribe(last_id=last_id).wait(1)
+        self.assertEqual([event.type for event in events.broker.subscribe(last_id=0).wait(1)], ["movie_added"])
+
+    def test_failed_event_log_write_keeps_the_write(self):
+        """Testing that a write whose event can't be logged still succeeds, and the failure is logged."""
+        events.broker.close()
+        events.broker = events.SharedBroker(TEST_LOG, coalesce=0.001)
+        events.broker.get_connection().execute("DROP TABLE events")
+        with self.assertLogs("events", "ERROR"):
+            self.assertEqual(movies.add_movie("Heat", "Crime"), {"message": "Movie 'Heat' added successfully."})
+        self.assertEqual(len(movies.view_reviews()), 1)
+
+    def test_endpoint_streams_events(self):
+        """Testing GET /events: validation, the SSE format, filtering and Last-Event-ID."""
+        client = api.app.test_client()
+        self.assertEqual(client.get("/events?category=games").status_code, 400)
+        self.assertEqual(client.get("/events", headers={"Last-Event-ID": "x"}).status_code, 400)
+        movies.add_movie("Heat", "Crime")
+        books.add_book("Dune", "Sci-Fi")
+        response = client.get("/events?category=books", headers={"Last-Event-ID": "0"}, buffered=False)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        chunks = response.response
+        self.assertEqual(next(chunks), b": connected\n\n")
+        self.assertEqual(next(chunks).decode(),
+                         'id: 2\nevent: book_added\ndata: {"category":"books","book_id":1,"title":"Dune","genre":"Sci-Fi"}\n\n')
+        response.close()
+        self.assertEqual(events.broker.subscribers, 0)
+
+    def test_publishing_does_not_wake_subscribers(self):
+        """Testing that writes only append: subscribers are woken by the dispatcher,
+        once per burst for each group of subscribed categories however many
+        subscribers and writes there are, and never for categories not written."""
+        broker = events.broker
+        followers = [broker.subscribe(["movies"]) for _ in range(300)]
+        idle = [broker.subscribe(["tv_shows", "books"]) for _ in range(300)]
+        received, idle_woken = [], []
+
+        def follow(subscription):
+            events_seen = []
+            while len(events_seen) < 100:
+                events_seen += subscription.wait(5)
+            received.append(len(events_seen))
+
+        threads = [threading.Thread(target=follow, args=(subscription,), daemon=True) for subscription in followers]
+        threads += [threading.Thread(target=lambda s=subscription: idle_woken.append(s.wait(30)), daemon=True)
+                    for subscription in idle]
+        for thread in threads:
+            thread.start()
+        # Holding the followers' condition stops the dispatcher from waking them;
+        # writes still finish, so publishing never waits on subscribers
+        writer = threading.Thread(target=lambda: [movies.add_review(1, 4, "Again") for _ in range(100)])
+        with broker._wake[frozenset(["movies"])]:
+            writer.start()
+            writer.join(10)
+            self.assertFalse(writer.is_alive())
+            self.assertEqual(broker.wakeups[frozenset(["movies"])], 0)
+        for thread in threads[:len(followers)]:
+            thread.join(10)
+        self.assertEqual(received, [100] * len(followers))
+        # The burst that piled up behind the held condition costs at most two wake-ups
+        self.assertLessEqual(broker.wakeups[frozenset(["movies"])], 2)
+        self.assertEqual(broker.wakeups[frozenset(["tv_shows", "books"])], 0)
+        self.assertEqual(idle_woken, [])
+        # Let the idle threads finish
+        tv_shows.add_show("Lost", "Drama")
+        for thread in threads[len(followers):]:
+            thread.join(10)
+        self.assertEqual([[event.type for event in woken] for woken in idle_woken], [["show_added"]] * len(idle))
+        self.assertEqual(broker.wakeups[frozenset(["tv_shows", "books"])], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# Pluggable JSON encoding for the Flask app (app.json = FastJSONProvider(app))
+# Encodes with orjson when it is installed and with the standard library
+# otherwise, as Flask's default provider does: sorted keys, compact unless
+# debugging, Flask's handling of dates, decimals and dataclasses. Unlike
+# Flask, non-ASCII text is written as UTF-8 rather than \u escapes, as orjson
+# writes it, so responses are orjson's bytes as they are; only integers
+# beyond 64 bits, which orjson refuses, are encoded by the standard library.
+# Setting ensure_ascii brings Flask's escaping back, at the cost of encoding
+# non-ASCII output twice. One difference remains: orjson writes NaN and
+# Infinity as null, where the standard library writes the non-JSON tokens
+# NaN and Infinity. Values wrapped in RawJSON are JSON text encoded
+# elsewhere -- by SQLite, in the domain modules' *_json functions, with
+# non-ASCII characters unescaped -- and are copied into the output as they
+# are instead of being built into dicts and re-encoded.
+
+import json
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+
+class RawJSON(str):
+    """JSON text to be written to the output unchanged."""
+
+
+def holds_raw_json(obj):
+    return isinstance(obj, RawJSON) or (isinstance(obj, dict) and
+                                        any(isinstance(value, RawJSON) for value in obj.values()))
+
+
+def json_array(rows):
+    """Joins (id, json_text) rows, as the *_json domain functions return them, into a JSON array."""
+    return RawJSON("[" + ",".join(text for _, text in rows) + "]")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's default JSON provider with an orjson fast path and RawJSON support.
+
+    RawJSON is honoured as the whole value or as a value of the top-level
+    dict, which covers list responses and their {"items", "next"} envelope.
+    """
+
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs):
+        if isinstance(obj, RawJSON):
+            return str(obj)
+        if holds_raw_json(obj):
+            keys = sorted(obj) if kwargs.get("sort_keys", self.sort_keys) else obj
+            return "{" + ",".join(f"{json.dumps(str(key))}:{self.dumps(obj[key], **kwargs)}" for key in keys) + "}"
+        if orjson is not None and not kwargs.get("indent") and not set(kwargs) - {"sort_keys"}:
+            data = self._orjson_or_none(obj, kwargs.get("sort_keys", self.sort_keys))
+            if data is not None:
+                return data.decode("utf-8")
+            # Compact, as orjson would have written it
+            kwargs["separators"] = (",", ":")
+        kwargs.setdefault("default", self.default)
+        kwargs.setdefault("ensure_ascii", self.ensure_ascii)
+        kwargs.setdefault("sort_keys", self.sort_keys)
+        return json.dumps(obj, **kwargs)
+
+    def _orjson_or_none(self, obj, sort_keys):
+        """orjson's output for `obj`, or None where the standard library has to
+        write it: integers beyond 64 bits, and non-ASCII text under ensure_ascii."""
+        try:
+            data = self._orjson_dumps(obj, sort_keys)
+        except orjson.JSONEncodeError:
+            return None
+        return data if not self.ensure_ascii or data.isascii() else None
+
+    def _orjson_dumps(self, obj, sort_keys):
+        # Dates and dataclasses go through Flask's default() so they come out
+        # as they do from the standard encoder
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = None
+        if self.compact is False or (self.compact is None and self._app.debug):
+            indent = 2
+        if indent:
+            body = self.dumps(obj, indent=indent).encode("utf-8")
+        elif orjson is None:
+            body = self.dumps(obj, separators=(",", ":")).encode("utf-8")
+        else:
+            # orjson's bytes go out as they are, without a trip through str
+            body = None if holds_raw_json(obj) else self._orjson_or_none(obj, self.sort_keys)
+            if body is None:
+                body = self.dumps(obj).encode("utf-8")
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,133 @@
+# Unit Tests for the JSON provider and the SQLite-encoded list rows
+
+import datetime
+import decimal
+import json
+import os
+import unittest
+from unittest import mock
+from flask import Flask
+import api
+import books
+import cache
+import json_provider
+import movies
+import storage
+import tv_shows
+import unified
+
+TEST_DATABASES = {movies: 'test_json_movies.db', tv_shows: 'test_json_tv_shows.db',
+                  books: 'test_json_books.db', unified: 'test_json_unified.db'}
+
+class TestJSONRows(unittest.TestCase):
+
+    def setUp(self):
+        """Filling fresh databases with awkward values: quotes, non-ASCII, NULLs and titles without reviews."""
+        cache.configure(backend=cache.NullCache())
+        self.saved = {module: module.DATABASE for module in TEST_DATABASES}
+        for module, path in TEST_DATABASES.items():
+            module.DATABASE = path
+        for add_title, module in ((movies.add_movie, movies), (tv_shows.add_show, tv_shows),
+                                  (books.add_book, books), (unified.movies.add_movie, unified.movies),
+                                  (unified.books.add_book, unified.books)):
+            add_title('Amélie "Le Fabuleux"', "Comedy")
+            add_title("Heat", "Crime")
+            module.add_review(1, 5, "Charmant\nnote")
+            module.add_review(1, 3, "Bien")
+        tv_shows.add_review(2, 4.5, None)
+
+    def tearDown(self):
+        storage.close_all()
+        for module, path in TEST_DATABASES.items():
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            module.DATABASE = self.saved[module]
+        cache.configure()
+
+    def assertRowsMatch(self, rows, dicts):
+        self.assertEqual([row[0] for row in rows], [item["id"] for item in dicts])
+        self.assertEqual([json.loads(row[1]) for row in rows], dicts)
+        for _, text in rows:
+            self.assertEqual(text, json.dumps(json.loads(text), sort_keys=True, separators=(",", ":"),
+                                              ensure_ascii=False))
+
+    def test_rows_match_dicts(self):
+        """Testing that the JSON rows hold exactly what the dict functions return, with sorted keys."""
+        self.assertRowsMatch(movies.view_reviews_json(), movies.view_reviews())
+        self.assertRowsMatch(tv_shows.view_reviews_json(), tv_shows.view_reviews())
+        self.assertRowsMatch(books.view_books_json(), books.view_books())
+        self.assertRowsMatch(movies.view_reviews_json(1, 1), movies.view_reviews_page(1, 1))
+        self.assertRowsMatch(unified.movies.view_reviews_json(), unified.movies.view_reviews())
+        self.assertRowsMatch(unified.books.view_books_json(), unified.books.view_books())
+
+    def test_list_endpoints(self):
+        """Testing that full lists, pages and NDJSON decode to the same titles as before."""
+        client = api.app.test_client()
+        self.assertEqual(client.get("/movies").get_json(), movies.view_reviews())
+        page = client.get("/tv_shows?limit=1").get_json()
+        self.assertEqual(page, {"items": tv_shows.view_reviews_page(1), "next": 1})
+        lines = client.get("/books?format=ndjson").get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], books.view_books())
+
+class TestFastJSONProvider(unittest.TestCase):
+
+    def setUp(self):
+        self.fast = Flask(__name__)
+        self.fast.json = json_provider.FastJSONProvider(self.fast)
+        self.default = Flask(__name__)
+
+    def responses(self, value):
+        with self.fast.app_context():
+            fast = self.fast.json.response(value).get_data()
+        with self.default.app_context():
+            default = self.default.json.response(value).get_data()
+        return fast, default
+
+    def test_same_output_as_flask(self):
+        """Testing that orjson and the fallback both write what Flask's own provider writes."""
+        value = {"b": [1, 2.5, None, "é"], "a": {"z": True, "y": "x"},
+                 "when": datetime.date(2024, 12, 1), "price": decimal.Decimal("9.99")}
+        fast, default = self.responses(value)
+        self.assertEqual(json.loads(fast), json.loads(default))
+        self.assertEqual(list(json.loads(fast)), ["a", "b", "price", "when"])
+        with mock.patch.object(json_provider, "orjson", None):
+            without_orjson, default = self.responses(value)
+            self.assertEqual(json.loads(without_orjson), json.loads(default))
+        self.assertEqual(without_orjson, fast)
+
+    def test_ascii_and_big_integers_match_flask_byte_for_byte(self):
+        """Testing that ASCII output and integers beyond 64 bits are written as Flask does."""
+        for value in ({"count": 2 ** 70}, {"a": "plain", "n": -1}, [1.5, None, True]):
+            fast, default = self.responses(value)
+            self.assertEqual(fast, default)
+
+    def test_non_ascii_is_utf8_from_orjson(self):
+        """Testing that non-ASCII text is written as UTF-8, straight from orjson, with or without it."""
+        value = {"title": "Amélie", "note": "日本"}
+        with self.fast.app_context(), \
+                mock.patch.object(json_provider.json, "dumps", side_effect=AssertionError("encoded twice")):
+            fast = self.fast.json.response(value).get_data()
+        self.assertEqual(fast, '{"note":"日本","title":"Amélie"}\n'.encode("utf-8"))
+        self.assertEqual(json.loads(fast), json.loads(self.responses(value)[1]))
+        with mock.patch.object(json_provider, "orjson", None):
+            self.assertEqual(self.responses(value)[0], fast)
+        self.fast.json.ensure_ascii = True
+        self.assertEqual(self.responses({"a": "é"}), (b'{"a":"\\u00e9"}\n',) * 2)
+
+    def test_raw_json_is_embedded(self):
+        """Testing that RawJSON is copied into the output, alone or in the list envelope."""
+        rows = [(1, '{"id":1}'), (2, '{"id":2}')]
+        with self.fast.app_context():
+            body = self.fast.json.response({"next": None, "items": json_provider.json_array(rows)}).get_data()
+        self.assertEqual(body, b'{"items":[{"id":1},{"id":2}],"next":null}\n')
+        self.assertEqual(json_provider.json_array([]), "[]")
+
+    def test_debug_output_is_indented(self):
+        """Testing that debug mode pretty-prints as Flask does."""
+        self.fast.debug = self.default.debug = True
+        fast, default = self.responses({"a": [1, 2]})
+        self.assertEqual(fast, default)
+
+if __name__ == '__main__':
+    unittest.main()
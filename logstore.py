@@ -0,0 +1,244 @@
+# Append-only log store for the TV show library managed by tv_showsTab.py
+# The library is a JSON snapshot (the file tv_showsTab always used) plus an
+# operation log next to it. Each change appends one JSON line to the log and
+# fsyncs it, so a write costs the same however large the library is. Every
+# COMPACT_EVERY operations the log is folded into a new snapshot, written to
+# a temp file and swapped in with an atomic rename. A lock file serializes
+# writers across processes, and every store catches up on the lines other
+# processes appended before it reads or writes. The log's first line holds a
+# generation number that each compaction increments, which tells a store
+# that the files were replaced and it must reload from the snapshot.
+
+import contextlib
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: msvcrt byte-range locks, which are always exclusive
+    fcntl = None
+    import msvcrt
+
+# Operations appended to the log between compactions
+COMPACT_EVERY = 1000
+
+
+def _lock(file, exclusive):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _unlock(file):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _read_header(log):
+    """Returns (generation, header length) of an open log, (0, 0) for a log
+    written before generations were (or an empty one)."""
+    first = log.readline()
+    if first.endswith(b"\n"):
+        header = json.loads(first)
+        if "generation" in header:
+            return header["generation"], len(first)
+    return 0, 0
+
+
+def _header(generation):
+    return (json.dumps({"generation": generation}) + "\n").encode("utf-8")
+
+
+def _write_durably(path, data):
+    """Writes `data` to a temp file, fsyncs it and renames it over `path`."""
+    temp = path + ".tmp"
+    with open(temp, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp, path)
+
+
+class LogStore:
+    """TV show library kept as a snapshot plus an append-only operation log.
+
+    Shows are held in memory, indexed by id. Every operation carries a
+    sequence number and the snapshot records the last one it includes, so
+    replaying a log that a crash left behind after compaction is harmless.
+    """
+
+    def __init__(self, path, compact_every=None, durable=True):
+        self.path = path
+        self.log_path = path + ".log"
+        self.lock_path = path + ".lock"
+        self.compact_every = compact_every or COMPACT_EVERY
+        # fsync each append; benchmarks and tests may turn this off
+        self.durable = durable
+        self._mutex = threading.Lock()
+        self._shows = {}  # show id -> {"id", "title", "reviews"}, in insertion order
+        self._seq = 0
+        self._next_id = 1
+        # Generation of the log loaded; file ids can't tell, since a replaced
+        # file may get the inode number of the one it replaced
+        self._generation = None
+        self._offset = 0  # bytes of the log applied
+        self._log_ops = 0
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive):
+        with self._mutex, open(self.lock_path, "a+b") as lock_file:
+            _lock(lock_file, exclusive)
+            try:
+                self._refresh(truncate_torn=exclusive)
+                yield
+            finally:
+                _unlock(lock_file)
+
+    def _refresh(self, truncate_torn):
+        """Catches up with the files, reloading if another process compacted them."""
+        try:
+            log = open(self.log_path, "rb")
+        except FileNotFoundError:
+            log = None
+        generation, header = _read_header(log) if log is not None else (0, 0)
+        if generation != self._generation:
+            self._load_snapshot()
+            self._generation = generation
+            self._offset = 0
+            self._log_ops = 0
+        if log is None:
+            return
+        with log:
+            # Another store may have added the header since this one last read
+            self._offset = max(self._offset, header)
+            log.seek(self._offset)
+            data = log.read()
+        # Only whole lines count; a partial last line is a write cut off by a
+        # crash, since appends happen under the exclusive lock.
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if line.strip():
+                self._apply(json.loads(line))
+                self._log_ops += 1
+        self._offset += end
+        if truncate_torn and end < len(data):
+            os.truncate(self.log_path, self._offset)
+
+    def _load_snapshot(self):
+        self._shows = {}
+        self._seq = 0
+        self._next_id = 1
+        if os.path.exists(self.path):
+            with open(self.path, "r") as file:
+                snapshot = json.load(file)
+            # Files written before the log store have no sequence number
+            self._seq = snapshot.get("seq", 0)
+            for show in snapshot["shows"]:
+                self._shows[show["id"]] = show
+                self._next_id = max(self._next_id, show["id"] + 1)
+
+    def _apply(self, op):
+        if op["seq"] <= self._seq:
+            return
+        self._seq = op["seq"]
+        kind = op["op"]
+        if kind == "add_show":
+            self._shows[op["id"]] = {"id": op["id"], "title": op["title"], "reviews": []}
+            self._next_id = max(self._next_id, op["id"] + 1)
+        elif kind == "add_review":
+            show = self._shows.get(op["show_id"])
+            if show is not None:
+                show["reviews"].append(op["review"])
+        elif kind == "delete_show":
+            self._shows.pop(op["id"], None)
+        elif kind == "delete_review":
+            show = self._shows.get(op["show_id"])
+            if show is not None:
+                show["reviews"] = [r for r in show["reviews"] if r["review_id"] != op["review_id"]]
+
+    def _append(self, op):
+        """Logs and applies one operation; must hold the exclusive lock."""
+        op["seq"] = self._seq + 1
+        line = (json.dumps(op) + "\n").encode("utf-8")
+        with open(self.log_path, "ab") as log:
+            if log.tell() == 0:
+                header = _header(self._generation)
+                log.write(header)
+                self._offset += len(header)
+            log.write(line)
+            log.flush()
+            if self.durable:
+                os.fsync(log.fileno())
+        self._offset += len(line)
+        self._log_ops += 1
+        self._apply(op)
+        if self._log_ops >= self.compact_every:
+            self._compact()
+
+    def _compact(self):
+        snapshot = {"seq": self._seq, "shows": list(self._shows.values())}
+        _write_durably(self.path, json.dumps(snapshot).encode("utf-8"))
+        # The new log's generation tells other processes to reload from the
+        # new snapshot; replacing the log keeps the change atomic.
+        self._generation += 1
+        header = _header(self._generation)
+        _write_durably(self.log_path, header)
+        self._offset = len(header)
+        self._log_ops = 0
+
+    def add_show(self, title):
+        with self._locked(exclusive=True):
+            show_id = self._next_id
+            self._append({"op": "add_show", "id": show_id, "title": title})
+            return self._copy(self._shows[show_id])
+
+    def add_review(self, show_id, rating, note):
+        """Adds a review and returns it, or returns None if the show doesn't exist."""
+        with self._locked(exclusive=True):
+            show = self._shows.get(show_id)
+            if show is None:
+                return None
+            review_id = max((r["review_id"] for r in show["reviews"]), default=0) + 1
+            review = {"review_id": review_id, "rating": rating, "note": note}
+            self._append({"op": "add_review", "show_id": show_id, "review": review})
+            return dict(review)
+
+    def delete_show(self, show_id):
+        """Deletes a show and its reviews; returns False if it doesn't exist."""
+        with self._locked(exclusive=True):
+            if show_id not in self._shows:
+                return False
+            self._append({"op": "delete_show", "id": show_id})
+            return True
+
+    def delete_review(self, show_id, review_id):
+        """Deletes a review; returns False if the show or review doesn't exist."""
+        with self._locked(exclusive=True):
+            show = self._shows.get(show_id)
+            if show is None or all(r["review_id"] != review_id for r in show["reviews"]):
+                return False
+            self._append({"op": "delete_review", "show_id": show_id, "review_id": review_id})
+            return True
+
+    def compact(self):
+        with self._locked(exclusive=True):
+            self._compact()
+
+    def get_show(self, show_id):
+        with self._locked(exclusive=False):
+            show = self._shows.get(show_id)
+            return self._copy(show) if show is not None else None
+
+    def shows(self):
+        with self._locked(exclusive=False):
+            return [self._copy(show) for show in self._shows.values()]
+
+    @staticmethod
+    def _copy(show):
+        return dict(show, reviews=[dict(review) for review in show["reviews"]])
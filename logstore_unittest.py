@@ -0,0 +1,139 @@
+# Unit Tests for the append-only log store behind tv_showsTab.py
+
+import json
+import os
+import threading
+import unittest
+from unittest import mock
+from logstore import LogStore
+
+TEST_FILE = 'test_tv_show_reviews.json'
+
+class TestLogStore(unittest.TestCase):
+
+    def setUp(self):
+        """Starting each test from an empty library."""
+        self.tearDown()
+
+    def tearDown(self):
+        """Removing the snapshot, log and lock files."""
+        for suffix in ("", ".log", ".lock", ".tmp", ".log.tmp"):
+            if os.path.exists(TEST_FILE + suffix):
+                os.remove(TEST_FILE + suffix)
+
+    def test_add_and_delete(self):
+        """Testing that shows and reviews are added, numbered and deleted."""
+        store = LogStore(TEST_FILE, durable=False)
+        self.assertEqual(store.add_show("Lost")["id"], 1)
+        self.assertEqual(store.add_show("The Office")["id"], 2)
+        self.assertEqual(store.add_review(1, 4.5, "Gripping")["review_id"], 1)
+        self.assertEqual(store.add_review(1, 2, "Confusing")["review_id"], 2)
+        self.assertIsNone(store.add_review(9, 3, "No such show"))
+        self.assertTrue(store.delete_review(1, 1))
+        self.assertFalse(store.delete_review(1, 1))
+        self.assertEqual([r["note"] for r in store.get_show(1)["reviews"]], ["Confusing"])
+        self.assertTrue(store.delete_show(2))
+        self.assertFalse(store.delete_show(2))
+        self.assertEqual([show["title"] for show in store.shows()], ["Lost"])
+        # Ids are never reused after a delete
+        self.assertEqual(store.add_show("Fringe")["id"], 3)
+
+    def test_reopen_replays_the_log(self):
+        """Testing that a new store rebuilds the library from the files."""
+        store = LogStore(TEST_FILE, durable=False)
+        store.add_show("Lost")
+        store.add_review(1, 5, "Gripping")
+        self.assertFalse(os.path.exists(TEST_FILE))
+        self.assertEqual(LogStore(TEST_FILE).shows(), store.shows())
+
+    def test_compaction_writes_snapshot_and_empties_log(self):
+        """Testing that compaction folds the log into an atomically replaced snapshot."""
+        store = LogStore(TEST_FILE, compact_every=3, durable=False)
+        for title in ("Lost", "Fringe", "Dark"):
+            store.add_show(title)
+        with open(TEST_FILE + ".log", "rb") as log:
+            self.assertEqual(log.read(), b'{"generation": 1}\n')
+        with open(TEST_FILE) as file:
+            snapshot = json.load(file)
+        self.assertEqual((snapshot["seq"], len(snapshot["shows"])), (3, 3))
+        store.add_review(2, 4, "Weird")
+        self.assertEqual(LogStore(TEST_FILE).shows(), store.shows())
+
+    def test_log_left_behind_by_a_crash_is_not_applied_twice(self):
+        """Testing that operations already in the snapshot are skipped on replay."""
+        store = LogStore(TEST_FILE, durable=False)
+        store.add_show("Lost")
+        store.add_review(1, 5, "Gripping")
+        with open(TEST_FILE + ".log", "rb") as log:
+            old_log = log.read()
+        store.compact()
+        # As if the process died between replacing the snapshot and the log
+        with open(TEST_FILE + ".log", "wb") as log:
+            log.write(old_log)
+        self.assertEqual(len(LogStore(TEST_FILE).get_show(1)["reviews"]), 1)
+
+    def test_torn_last_line_is_ignored_and_truncated(self):
+        """Testing recovery from a write cut off mid-line."""
+        store = LogStore(TEST_FILE, durable=False)
+        store.add_show("Lost")
+        with open(TEST_FILE + ".log", "ab") as log:
+            log.write(b'{"op": "add_show", "id": 2, "ti')
+        reopened = LogStore(TEST_FILE, durable=False)
+        self.assertEqual(len(reopened.shows()), 1)
+        reopened.add_show("Fringe")
+        self.assertEqual([show["title"] for show in LogStore(TEST_FILE).shows()], ["Lost", "Fringe"])
+
+    def test_legacy_file_is_loaded_as_snapshot(self):
+        """Testing that a library saved by the old whole-file writer still loads."""
+        with open(TEST_FILE, "w") as file:
+            json.dump({"shows": [{"id": 4, "title": "Lost", "reviews": []}]}, file, indent=4)
+        store = LogStore(TEST_FILE, durable=False)
+        self.assertEqual(store.add_show("Fringe")["id"], 5)
+        self.assertEqual(len(store.shows()), 2)
+
+    def test_compaction_is_noticed_when_inodes_are_reused(self):
+        """Testing that a store that slept through compactions reloads even if the
+        new files got the inode numbers of the ones it read (faked through os.stat)."""
+        first = LogStore(TEST_FILE, durable=False)
+        first.add_show("Lost")
+        first.compact()
+        sleeper = LogStore(TEST_FILE, compact_every=1000, durable=False)
+        sleeper.shows()
+        real_stat = os.stat
+        seen = {path: real_stat(path) for path in (TEST_FILE, TEST_FILE + ".log")}
+
+        def reused_stat(path, *args, **kwargs):
+            result = real_stat(path, *args, **kwargs)
+            if path not in seen:
+                return result
+            fields = list(result)
+            fields[1], fields[2] = seen[path].st_ino, seen[path].st_dev
+            return os.stat_result(fields)
+
+        writer = LogStore(TEST_FILE, compact_every=2, durable=False)
+        for n in range(4):
+            writer.add_review(1, 3, f"Review {n}")
+        with mock.patch("os.stat", reused_stat):
+            sleeper.add_review(1, 5, "Late")
+        self.assertEqual([r["review_id"] for r in LogStore(TEST_FILE).get_show(1)["reviews"]], [1, 2, 3, 4, 5])
+
+    def test_concurrent_writers_lose_no_updates(self):
+        """Testing that separate stores on one file see each other's writes."""
+        first = LogStore(TEST_FILE, compact_every=25, durable=False)
+        first.add_show("Lost")
+        stores = [LogStore(TEST_FILE, compact_every=25, durable=False) for _ in range(4)]
+
+        def write(store):
+            for n in range(30):
+                store.add_review(1, 3, f"Review {n}")
+        threads = [threading.Thread(target=write, args=(store,)) for store in stores]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        reviews = first.get_show(1)["reviews"]
+        self.assertEqual(len(reviews), 120)
+        self.assertEqual(len({r["review_id"] for r in reviews}), 120)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+# Request and database timing for the API, exposed in Prometheus text format
+# init_app(app) times every request and counts it by route, method and status;
+# instrument(module, name) stands in for a domain module (movies, tv_shows,
+# books, unified, bulk) and times each call into it as "name.function", which
+# is also added to the current request's database time. render() writes the
+# counters and histograms out for GET /metrics.
+#
+# Everything lives in this process: under gunicorn every worker keeps and
+# reports its own numbers, which Prometheus sums across scrape targets.
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+from flask import request
+import cache
+
+# Histogram upper bounds in seconds (Prometheus' defaults plus 1 ms)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Route label for requests that matched no route, so 404 scans add one series
+UNMATCHED = "<unmatched>"
+
+
+class Histogram:
+    """Counts observations per bucket; each bucket holds values <= its bound."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Yields (le label, observations <= le) pairs, ending with +Inf."""
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            yield (bound if bound == "+Inf" else repr(float(bound))), total
+
+
+class Registry:
+    """Thread-safe store of the request and database call metrics."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}       # (route, method, status) -> count
+            self.latency = {}        # (route, method) -> Histogram
+            self.request_db = {}     # (route, method) -> Histogram
+            self.calls = {}          # function -> Histogram
+            self.call_errors = {}    # function -> count
+
+    def observe_request(self, route, method, status, seconds, db_seconds):
+        key = (route, method)
+        with self._lock:
+            self.requests[key + (status,)] = self.requests.get(key + (status,), 0) + 1
+            self._histogram(self.latency, key).observe(seconds)
+            self._histogram(self.request_db, key).observe(db_seconds)
+
+    def observe_call(self, function, seconds, failed=False):
+        with self._lock:
+            self._histogram(self.calls, function).observe(seconds)
+            if failed:
+                self.call_errors[function] = self.call_errors.get(function, 0) + 1
+
+    def _histogram(self, table, key):
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram(self.buckets)
+        return histogram
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format (0.0.4)."""
+        lines = []
+        with self._lock:
+            family(lines, "http_requests_total", "counter", "HTTP requests by route, method and status.",
+                   ((labels(route=route, method=method, status=status), count)
+                    for (route, method, status), count in sorted(self.requests.items())))
+            histograms(lines, "http_request_duration_seconds",
+                       "Time from the start of the request to the response, by route.",
+                       ((labels(route=route, method=method), h) for (route, method), h in sorted(self.latency.items())))
+            histograms(lines, "http_request_db_seconds",
+                       "Time a request spent in domain (database) calls, by route.",
+                       ((labels(route=route, method=method), h) for (route, method), h in sorted(self.request_db.items())))
+            histograms(lines, "db_call_duration_seconds", "Time per domain function call.",
+                       ((labels(function=function), h) for function, h in sorted(self.calls.items())))
+            family(lines, "db_call_errors_total", "counter", "Domain function calls that raised.",
+                   ((labels(function=function), count) for function, count in sorted(self.call_errors.items())))
+        stats = cache.stats()
+        family(lines, "cache_events_total", "counter", "Read cache hits, misses, evictions, expirations and invalidations.",
+               ((labels(event=event), stats[event]) for event in
+                ("hits", "misses", "evictions", "expirations", "invalidations") if event in stats))
+        family(lines, "cache_entries", "gauge", "Entries in the read cache.", (("", stats.get("size", 0)),))
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def labels(**values):
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in values.items()) + "}"
+
+
+def family(lines, name, kind, help_text, samples):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    lines.extend(f"{name}{label} {value}" for label, value in samples)
+
+
+def histograms(lines, name, help_text, series):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for label, histogram in series:
+        for le, count in histogram.cumulative():
+            lines.append(f'{name}_bucket{label[:-1]},le="{le}"}} {count}')
+        lines.append(f"{name}_sum{label} {histogram.sum!r}")
+        lines.append(f"{name}_count{label} {histogram.count}")
+
+
+registry = Registry()
+# Start time and database time of the request this thread is serving
+_local = threading.local()
+
+
+def timed(name, func):
+    """Wraps `func` so each call is recorded as `name` and counted as database time."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            _local.db_seconds = getattr(_local, "db_seconds", 0.0) + elapsed
+            registry.observe_call(name, elapsed, failed)
+    return wrapper
+
+
+class Instrumented:
+    """Stands in for a domain module (or unified.Category), timing its public
+    functions, or only those named in `only`. Other attributes, such as
+    DATABASE, read and write through."""
+
+    def __init__(self, target, name, only=None):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_only", only)
+        object.__setattr__(self, "_wrappers", {})
+
+    def __getattr__(self, attr):
+        value = getattr(self._target, attr)
+        if attr.startswith("_") or not callable(value) or isinstance(value, type):
+            return value
+        if self._only is not None and attr not in self._only:
+            return value
+        wrapper = self._wrappers.get(attr)
+        # Rewrapped if the function was replaced, e.g. patched in a test
+        if wrapper is None or wrapper.__wrapped__ != value:
+            wrapper = self._wrappers[attr] = timed(f"{self._name}.{attr}", value)
+        return wrapper
+
+    def __setattr__(self, attr, value):
+        setattr(self._target, attr, value)
+
+
+def instrument(target, name, only=None):
+    return Instrumented(target, name, only)
+
+
+def start_request():
+    _local.start = time.perf_counter()
+    _local.db_seconds = 0.0
+
+
+def finish_request(response):
+    start = getattr(_local, "start", None)
+    if start is not None:
+        _local.start = None
+        current = request._get_current_object()
+        rule = current.url_rule
+        registry.observe_request(rule.rule if rule else UNMATCHED, current.method, response.status_code,
+                                 time.perf_counter() - start, _local.db_seconds)
+    return response
+
+
+def init_app(app):
+    """Times every request to `app`. Streamed bodies are timed to the first byte."""
+    app.before_request(start_request)
+    app.after_request(finish_request)
+
+
+def render():
+    return registry.render()
@@ -0,0 +1,98 @@
+# Unit Tests for request timing and the /metrics endpoint
+
+import os
+import re
+import unittest
+import api
+import books
+import cache
+import metrics
+import movies
+import storage
+
+TEST_DATABASES = {movies: 'test_metrics_movies.db', books: 'test_metrics_books.db'}
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        """Pointing the modules at fresh databases and clearing the counters."""
+        self.saved = {module: module.DATABASE for module in TEST_DATABASES}
+        for module, path in TEST_DATABASES.items():
+            module.DATABASE = path
+        cache.configure()
+        metrics.registry.reset()
+        self.client = api.app.test_client()
+
+    def tearDown(self):
+        storage.close_all()
+        for module, path in TEST_DATABASES.items():
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            module.DATABASE = self.saved[module]
+        metrics.registry.reset()
+
+    def sample(self, text, name, **labels):
+        """Returns the value of the sample with exactly these labels."""
+        label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+        match = re.search(rf'^{re.escape(name)}\{{{re.escape(label_text)}\}} (\S+)$', text, re.MULTILINE)
+        return float(match.group(1)) if match else None
+
+    def test_requests_counted_by_route_and_status(self):
+        """Testing that requests are counted per route template, method and status."""
+        self.client.post("/movies", json={"name": "Heat", "genre": "Crime"})
+        self.client.get("/movies/1/reviews")
+        self.client.get("/movies/2/reviews")
+        self.client.post("/movies", json={})
+        self.client.get("/no/such/page")
+        text = self.client.get("/metrics").get_data(as_text=True)
+        self.assertEqual(self.sample(text, "http_requests_total", route="/movies/<int:movie_id>/reviews",
+                                     method="GET", status=200), 2)
+        self.assertEqual(self.sample(text, "http_requests_total", route="/movies", method="POST", status=201), 1)
+        self.assertEqual(self.sample(text, "http_requests_total", route="/movies", method="POST", status=400), 1)
+        self.assertEqual(self.sample(text, "http_requests_total", route=metrics.UNMATCHED, method="GET", status=404), 1)
+        self.assertEqual(self.sample(text, "http_request_duration_seconds_count",
+                                     route="/movies/<int:movie_id>/reviews", method="GET"), 2)
+        self.assertEqual(self.sample(text, "http_request_duration_seconds_bucket",
+                                     route="/movies/<int:movie_id>/reviews", method="GET", le="+Inf"), 2)
+
+    def test_database_time_by_function(self):
+        """Testing that domain calls are timed per function and add up to the request's database time."""
+        self.client.post("/books", json={"title": "Dune", "genre": "Sci-Fi"})
+        self.client.get("/books?limit=10")
+        text = self.client.get("/metrics").get_data(as_text=True)
+        self.assertEqual(self.sample(text, "db_call_duration_seconds_count", function="books.add_book"), 1)
+        self.assertEqual(self.sample(text, "db_call_duration_seconds_count", function="books.view_books_json"), 1)
+        self.assertEqual(self.sample(text, "db_call_duration_seconds_count", function="books.data_version"), 1)
+        calls = sum(self.sample(text, "db_call_duration_seconds_sum", function=f"books.{name}")
+                    for name in ("view_books_json", "data_version"))
+        request_db = self.sample(text, "http_request_db_seconds_sum", route="/books", method="GET")
+        self.assertAlmostEqual(request_db, calls, places=6)
+        self.assertLessEqual(request_db, self.sample(text, "http_request_duration_seconds_sum",
+                                                     route="/books", method="GET"))
+
+    def test_failed_calls_counted(self):
+        """Testing that a domain function that raises is counted as an error."""
+        timed = metrics.timed("test.fails", lambda: 1 / 0)
+        with self.assertRaises(ZeroDivisionError):
+            timed()
+        text = metrics.render()
+        self.assertEqual(self.sample(text, "db_call_errors_total", function="test.fails"), 1)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Testing that bucket counts include every smaller bucket and that bounds are inclusive."""
+        histogram = metrics.Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.cumulative()), [("0.1", 2), ("1.0", 3), ("+Inf", 4)])
+
+    def test_instrumented_module_passes_attributes_through(self):
+        """Testing that DATABASE reads and writes reach the wrapped module."""
+        proxy = metrics.instrument(movies, "movies")
+        self.assertEqual(proxy.DATABASE, movies.DATABASE)
+        proxy.DATABASE = "test_metrics_other.db"
+        self.assertEqual(movies.DATABASE, "test_metrics_other.db")
+        proxy.DATABASE = TEST_DATABASES[movies]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,425 @@
+# Versioned schema migrations for the movies, TV shows and books databases,
+# for the optional unified database that holds all three (unified.py), and
+# for the event log the server's workers share (events.py)
+# Each database records the number of migrations applied to it in
+# PRAGMA user_version; pending migrations are applied in order, each in its
+# own transaction, the first time the storage layer opens the database.
+
+def full_text_index(table, columns, rowid="id"):
+    """Statements for an FTS5 index over `columns` of `table`, kept in sync by triggers.
+
+    The index is an external-content table: it stores only the tokens and
+    reads column values back from `table` by its `rowid` column.
+    """
+    fts = f"{table}_fts"
+    names = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    insert = f"INSERT INTO {fts} (rowid, {names}) VALUES (new.{rowid}, {new_values});"
+    delete = f"INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', old.{rowid}, {old_values});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='{table}', content_rowid='{rowid}')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {names} ON {table} BEGIN {delete} {insert} END",
+        # Index the rows that existed before the triggers
+        f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+    ]
+
+
+def rating_stats(table, item_column):
+    """Statements for a rating_stats table holding per-item review count, sum, min, max
+    and average, maintained by triggers in the same transaction as each review write.
+
+    Inserts update the item's row in place; deletes and rating changes recompute
+    it from the (item, rating) index, since min and max can't be undone
+    incrementally.
+    """
+    def refresh(item):
+        return (
+            f"DELETE FROM rating_stats WHERE {item_column} = {item}; "
+            f"INSERT INTO rating_stats "
+            f"SELECT {item_column}, COUNT(rating), SUM(rating), MIN(rating), MAX(rating), AVG(rating) "
+            f"FROM reviews WHERE {item_column} = {item} AND rating IS NOT NULL GROUP BY {item_column};"
+        )
+    return [
+        f'''
+        CREATE TABLE IF NOT EXISTS rating_stats (
+            {item_column} INTEGER PRIMARY KEY,
+            review_count INTEGER NOT NULL,
+            rating_sum NUMERIC NOT NULL,
+            rating_min NUMERIC NOT NULL,
+            rating_max NUMERIC NOT NULL,
+            rating_avg REAL NOT NULL
+        )
+        ''',
+        f"CREATE INDEX IF NOT EXISTS idx_rating_stats_avg ON rating_stats (rating_avg DESC, {item_column})",
+        f'''
+        CREATE TRIGGER IF NOT EXISTS rating_stats_insert AFTER INSERT ON reviews
+        WHEN new.rating IS NOT NULL BEGIN
+            INSERT INTO rating_stats
+            VALUES (new.{item_column}, 1, new.rating, new.rating, new.rating, new.rating)
+            ON CONFLICT ({item_column}) DO UPDATE SET
+                review_count = review_count + 1,
+                rating_sum = rating_sum + excluded.rating_sum,
+                rating_min = MIN(rating_min, excluded.rating_min),
+                rating_max = MAX(rating_max, excluded.rating_max),
+                rating_avg = (rating_sum + excluded.rating_sum) * 1.0 / (review_count + 1);
+        END
+        ''',
+        f"CREATE TRIGGER IF NOT EXISTS rating_stats_delete AFTER DELETE ON reviews BEGIN {refresh('old.' + item_column)} END",
+        f"CREATE TRIGGER IF NOT EXISTS rating_stats_update AFTER UPDATE OF rating, {item_column} ON reviews "
+        f"BEGIN {refresh('old.' + item_column)} {refresh('new.' + item_column)} END",
+        f"CREATE TRIGGER IF NOT EXISTS rating_stats_item_delete AFTER DELETE ON {table} "
+        f"BEGIN DELETE FROM rating_stats WHERE {item_column} = old.id; END",
+        # Backfill from the reviews that existed before the triggers
+        f"INSERT INTO rating_stats "
+        f"SELECT {item_column}, COUNT(rating), SUM(rating), MIN(rating), MAX(rating), AVG(rating) "
+        f"FROM reviews WHERE rating IS NOT NULL GROUP BY {item_column}",
+    ]
+
+
+def change_counters(tables):
+    """Statements for a table_versions row per table that triggers bump on every
+    insert, update and delete, so readers can tell cheaply whether anything changed.
+
+    An extra 'epoch' row holds a random number fixed when the table is created,
+    which keeps versions from a deleted and recreated database from repeating.
+    """
+    statements = [
+        "CREATE TABLE IF NOT EXISTS table_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO table_versions VALUES ('epoch', random() & 281474976710655)",
+    ]
+    for table in tables:
+        statements.append(f"INSERT OR IGNORE INTO table_versions VALUES ('{table}', 0)")
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            statements.append(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table} "
+                f"BEGIN UPDATE table_versions SET version = version + 1 WHERE name = '{table}'; END")
+    return statements
+
+
+def row_versions(tables, rowid="id", scope=()):
+    """Statements giving every row of `tables` ({table: columns}) a version column
+    for delta sync, and a tombstones table for the rows deleted.
+
+    Versions come from one sequence per database: triggers stamp a row with
+    the next one when it is inserted or one of its `columns` is updated, and
+    record a tombstone under the next one when it is deleted. `scope` names
+    columns (such as the unified database's category) that lead the version
+    indexes and are copied into tombstones. Rows that existed before are
+    numbered by rowid, one table after the other.
+    """
+    current = "(SELECT version FROM change_sequence)"
+    advance = "UPDATE change_sequence SET version = version + 1;"
+    scope_names = "".join(f"{column}, " for column in scope)
+    scope_columns = "".join(f", {column}" for column in scope)
+    statements = [
+        "CREATE TABLE IF NOT EXISTS change_sequence (version INTEGER NOT NULL)",
+        "INSERT INTO change_sequence VALUES (0)",
+        "CREATE TABLE IF NOT EXISTS tombstones (version INTEGER PRIMARY KEY, table_name TEXT NOT NULL, "
+        "id INTEGER NOT NULL" + "".join(f", {column} TEXT NOT NULL" for column in scope) + ")",
+    ]
+    if scope:
+        statements.append(f"CREATE INDEX IF NOT EXISTS idx_tombstones_version ON tombstones ({scope_names}version)")
+    for table, columns in tables.items():
+        stamp = f"UPDATE {table} SET version = {current} WHERE {rowid} = new.{rowid};"
+        old_scope = "".join(f", old.{column}" for column in scope)
+        tombstone = (f"INSERT INTO tombstones (version, table_name, id{scope_columns}) "
+                     f"VALUES ({current}, '{table}', old.id{old_scope});")
+        statements += [
+            f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+            f"UPDATE {table} SET version = {current} + {rowid}",
+            f"UPDATE change_sequence SET version = version + IFNULL((SELECT MAX({rowid}) FROM {table}), 0)",
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_version ON {table} ({scope_names}version)",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_row_version_insert AFTER INSERT ON {table} "
+            f"BEGIN {advance} {stamp} END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_row_version_update AFTER UPDATE OF {', '.join(columns)} "
+            f"ON {table} BEGIN {advance} {stamp} END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_row_version_delete AFTER DELETE ON {table} "
+            f"BEGIN {advance} {tombstone} END",
+        ]
+    return statements
+
+
+# Movies database (movie_reviews.db)
+MOVIES = [
+    # 1: initial tables
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS movies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            genre TEXT NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            movie_id INTEGER NOT NULL,
+            rating INTEGER NOT NULL,
+            note TEXT NOT NULL,
+            FOREIGN KEY (movie_id) REFERENCES movies (id)
+        )
+        ''',
+    ],
+    # 2: foreign key, genre and rating indexes
+    [
+        'CREATE INDEX IF NOT EXISTS idx_reviews_movie_id ON reviews (movie_id)',
+        'CREATE INDEX IF NOT EXISTS idx_reviews_movie_rating ON reviews (movie_id, rating)',
+        'CREATE INDEX IF NOT EXISTS idx_reviews_rating ON reviews (rating)',
+        'CREATE INDEX IF NOT EXISTS idx_movies_genre ON movies (genre)',
+    ],
+    # 3: full-text search over titles, genres and review notes
+    full_text_index('movies', ['name', 'genre']) + full_text_index('reviews', ['note']),
+    # 4: per-movie rating aggregates
+    rating_stats('movies', 'movie_id'),
+    # 5: change counters for HTTP ETags
+    change_counters(['movies', 'reviews']),
+    # 6: title order for the sorted catalog pages
+    ['CREATE INDEX IF NOT EXISTS idx_movies_name ON movies (name)'],
+    # 7: row versions and tombstones for GET /movies/changes
+    row_versions({'movies': ['name', 'genre'], 'reviews': ['movie_id', 'rating', 'note']}),
+]
+
+# TV shows database (tv_shows_reviews.db)
+TV_SHOWS = [
+    # 1: initial tables
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS tv_shows (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            genre TEXT NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tv_show_id INTEGER NOT NULL,
+            rating REAL NOT NULL DEFAULT 0, -- Ensure valid default for ratings
+            note TEXT,
+            FOREIGN KEY (tv_show_id) REFERENCES tv_shows (id) ON DELETE CASCADE
+        )
+        ''',
+    ],
+    # 2: foreign key, genre and rating indexes
+    [
+        'CREATE INDEX IF NOT EXISTS idx_reviews_tv_show_id ON reviews (tv_show_id)',
+        'CREATE INDEX IF NOT EXISTS idx_reviews_tv_show_rating ON reviews (tv_show_id, rating)',
+        'CREATE INDEX IF NOT EXISTS idx_tv_shows_genre ON tv_shows (genre)',
+    ],
+    # 3: full-text search over titles, genres and review notes
+    full_text_index('tv_shows', ['title', 'genre']) + full_text_index('reviews', ['note']),
+    # 4: per-show rating aggregates
+    rating_stats('tv_shows', 'tv_show_id'),
+    # 5: change counters for HTTP ETags
+    change_counters(['tv_shows', 'reviews']),
+    # 6: title order for the sorted catalog pages
+    ['CREATE INDEX IF NOT EXISTS idx_tv_shows_title ON tv_shows (title)'],
+    # 7: row versions and tombstones for GET /tv_shows/changes
+    row_versions({'tv_shows': ['title', 'genre'], 'reviews': ['tv_show_id', 'rating', 'note']}),
+]
+
+# Books database (books.db)
+BOOKS = [
+    # 1: initial tables
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS books (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            genre TEXT NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL,
+            rating INTEGER CHECK (rating BETWEEN 1 AND 5),
+            note TEXT NOT NULL,
+            FOREIGN KEY (book_id) REFERENCES books (id)
+        )
+        ''',
+    ],
+    # 2: foreign key, genre and rating indexes
+    [
+        'CREATE INDEX IF NOT EXISTS idx_reviews_book_id ON reviews (book_id)',
+        'CREATE INDEX IF NOT EXISTS idx_reviews_book_rating ON reviews (book_id, rating)',
+        'CREATE INDEX IF NOT EXISTS idx_books_genre ON books (genre)',
+    ],
+    # 3: full-text search over titles, genres and review notes
+    full_text_index('books', ['title', 'genre']) + full_text_index('reviews', ['note']),
+    # 4: per-book rating aggregates
+    rating_stats('books', 'book_id'),
+    # 5: change counters for HTTP ETags
+    change_counters(['books', 'reviews']),
+    # 6: title order for the sorted catalog pages
+    ['CREATE INDEX IF NOT EXISTS idx_books_title ON books (title)'],
+    # 7: row versions and tombstones for GET /books/changes
+    row_versions({'books': ['title', 'genre'], 'reviews': ['book_id', 'rating', 'note']}),
+]
+
+
+# Unified database (reviews.db): every category in one `items` table and one
+# `reviews` table, told apart by a category column. Ids stay per category, so
+# (category, id) is unique and the integer `key` is only the internal rowid.
+UNIFIED_CATEGORIES = ("movies", "tv_shows", "books")
+
+UNIFIED = [
+    # 1: tables, indexes, full-text search, rating aggregates and per-category change counters
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS items (
+            key INTEGER PRIMARY KEY,
+            category TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            genre TEXT NOT NULL,
+            UNIQUE (category, id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reviews (
+            key INTEGER PRIMARY KEY,
+            category TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            item_id INTEGER NOT NULL,
+            rating NUMERIC CHECK (category != 'books' OR rating BETWEEN 1 AND 5),
+            note TEXT,
+            UNIQUE (category, id),
+            FOREIGN KEY (category, item_id) REFERENCES items (category, id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_items_genre ON items (genre, category, id)',
+        'CREATE INDEX IF NOT EXISTS idx_items_category_genre ON items (category, genre)',
+        'CREATE INDEX IF NOT EXISTS idx_reviews_item_rating ON reviews (category, item_id, rating)',
+        '''
+        CREATE TABLE IF NOT EXISTS rating_stats (
+            category TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            review_count INTEGER NOT NULL,
+            rating_sum NUMERIC NOT NULL,
+            rating_min NUMERIC NOT NULL,
+            rating_max NUMERIC NOT NULL,
+            rating_avg REAL NOT NULL,
+            PRIMARY KEY (category, item_id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_rating_stats_avg ON rating_stats (rating_avg DESC, category, item_id)',
+        'CREATE INDEX IF NOT EXISTS idx_rating_stats_category_avg ON rating_stats (category, rating_avg DESC, item_id)',
+        '''
+        CREATE TRIGGER IF NOT EXISTS rating_stats_insert AFTER INSERT ON reviews
+        WHEN new.rating IS NOT NULL BEGIN
+            INSERT INTO rating_stats
+            VALUES (new.category, new.item_id, 1, new.rating, new.rating, new.rating, new.rating)
+            ON CONFLICT (category, item_id) DO UPDATE SET
+                review_count = review_count + 1,
+                rating_sum = rating_sum + excluded.rating_sum,
+                rating_min = MIN(rating_min, excluded.rating_min),
+                rating_max = MAX(rating_max, excluded.rating_max),
+                rating_avg = (rating_sum + excluded.rating_sum) * 1.0 / (review_count + 1);
+        END
+        ''',
+    ]
+    + [
+        # Deletes and rating changes recompute the item's row, as in rating_stats()
+        f"CREATE TRIGGER IF NOT EXISTS rating_stats_{event} AFTER {clause} ON reviews BEGIN "
+        + " ".join(
+            f"DELETE FROM rating_stats WHERE category = {row}.category AND item_id = {row}.item_id; "
+            f"INSERT INTO rating_stats "
+            f"SELECT category, item_id, COUNT(rating), SUM(rating), MIN(rating), MAX(rating), AVG(rating) "
+            f"FROM reviews WHERE category = {row}.category AND item_id = {row}.item_id AND rating IS NOT NULL "
+            f"GROUP BY category, item_id;"
+            for row in rows)
+        + " END"
+        for event, clause, rows in (("delete", "DELETE", ("old",)),
+                                    ("update", "UPDATE OF rating, item_id", ("old", "new")))
+    ]
+    + [
+        "CREATE TRIGGER IF NOT EXISTS rating_stats_item_delete AFTER DELETE ON items BEGIN "
+        "DELETE FROM rating_stats WHERE category = old.category AND item_id = old.id; END",
+    ]
+    + full_text_index('items', ['title', 'genre'], rowid='key')
+    + full_text_index('reviews', ['note'], rowid='key')
+    # One change counter per category rather than per table, so each
+    # category's ETag only moves when that category is written
+    + [
+        "CREATE TABLE IF NOT EXISTS table_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO table_versions VALUES ('epoch', random() & 281474976710655)",
+    ]
+    + [f"INSERT OR IGNORE INTO table_versions VALUES ('{category}', 0)" for category in UNIFIED_CATEGORIES]
+    + [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table} "
+        f"BEGIN UPDATE table_versions SET version = version + 1 WHERE name IN ({rows}); END"
+        for table in ("items", "reviews")
+        for event, rows in (("INSERT", "new.category"), ("UPDATE", "old.category, new.category"),
+                            ("DELETE", "old.category"))
+    ],
+    # 2: title and genre order within a category for the sorted catalog pages
+    [
+        'CREATE INDEX IF NOT EXISTS idx_items_category_title ON items (category, title, id)',
+        'CREATE INDEX IF NOT EXISTS idx_items_category_genre_id ON items (category, genre, id)',
+    ],
+    # 3: row versions and tombstones for GET /<category>/changes, indexed per category
+    row_versions({'items': ['category', 'id', 'title', 'genre'],
+                  'reviews': ['category', 'id', 'item_id', 'rating', 'note']}, rowid='key', scope=('category',)),
+]
+
+# The event log shared by the server's worker processes, see events.SharedBroker
+EVENTS = [
+    # 1: one row per published event; AUTOINCREMENT keeps ids growing after pruning
+    ['CREATE TABLE IF NOT EXISTS events ('
+     'id INTEGER PRIMARY KEY AUTOINCREMENT, category TEXT NOT NULL, type TEXT NOT NULL, data TEXT NOT NULL)'],
+]
+
+
+def schema_version(connection):
+    """Returns the number of migrations applied to the database."""
+    return connection.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(connection, migrations):
+    """Applies the migrations the database hasn't seen yet and returns its new version.
+
+    Safe to call from several processes at once: each migration runs in a
+    write transaction that re-reads the version, so only one process applies it.
+    """
+    while True:
+        # DDL doesn't open an implicit transaction, so begin one explicitly to
+        # apply each migration and its version bump atomically. IMMEDIATE takes
+        # the write lock before the version is read, so another process can't
+        # apply the same migration in between.
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            version = schema_version(connection)
+            if version >= len(migrations):
+                connection.rollback()
+                return version
+            for statement in migrations[version]:
+                connection.execute(statement)
+            connection.execute(f'PRAGMA user_version = {version + 1}')
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+
+def upgrade_movies(connection):
+    return migrate(connection, MOVIES)
+
+
+def upgrade_tv_shows(connection):
+    return migrate(connection, TV_SHOWS)
+
+
+def upgrade_books(connection):
+    return migrate(connection, BOOKS)
+
+
+def upgrade_unified(connection):
+    return migrate(connection, UNIFIED)
+
+
+def upgrade_events(connection):
+    return migrate(connection, EVENTS)
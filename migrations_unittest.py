@@ -0,0 +1,218 @@
+# Unit Tests for the schema migration runner and index coverage of the domain queries
+
+import multiprocessing
+import os
+import re
+import sqlite3
+import unittest
+import books
+import cache
+import migrations
+import movies
+import storage
+import tv_shows
+
+TEST_DATABASE = 'test_migrations.db'
+
+# Plans that may walk a whole table, with the reason why
+ALLOWED_SCANS = {
+    "books.view_books_with_reviews": "lists every book in id order",
+    "books.search_by_genre": "substring LIKE on genre cannot use a b-tree index",
+}
+
+def open_migrated(database, start):
+    """Child process: waits for the others, then opens `database` as a worker would."""
+    start.wait()
+    storage.get_connection(database, migrations.upgrade_movies)
+
+class TestMigrations(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(TEST_DATABASE)
+
+    def tearDown(self):
+        self.conn.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DATABASE + suffix):
+                os.remove(TEST_DATABASE + suffix)
+
+    def test_migrate_records_version(self):
+        """Testing that a fresh database is migrated to the latest version."""
+        version = migrations.upgrade_movies(self.conn)
+        self.assertEqual(version, len(migrations.MOVIES))
+        self.assertEqual(migrations.schema_version(self.conn), len(migrations.MOVIES))
+        indexes = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn("idx_reviews_movie_rating", indexes)
+
+    def test_migrate_applies_only_pending(self):
+        """Testing that only migrations newer than the recorded version run."""
+        migrations.migrate(self.conn, migrations.BOOKS[:1])
+        self.assertEqual(migrations.schema_version(self.conn), 1)
+        self.conn.execute("INSERT INTO books (title, genre) VALUES ('1984', 'Dystopian')")
+        self.conn.commit()
+        migrations.upgrade_books(self.conn)
+        migrations.upgrade_books(self.conn)
+        self.assertEqual(migrations.schema_version(self.conn), len(migrations.BOOKS))
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM books").fetchone()[0], 1)
+
+    def test_processes_migrating_at_once_apply_each_migration_once(self):
+        """Testing that six processes opening an old database together all succeed, with rows backfilled once."""
+        migrations.migrate(self.conn, migrations.MOVIES[:1])
+        self.conn.execute("INSERT INTO movies (name, genre) VALUES ('Heat', 'Crime')")
+        self.conn.execute("INSERT INTO reviews (movie_id, rating, note) VALUES (1, 4, 'Good')")
+        self.conn.commit()
+        context = multiprocessing.get_context("spawn")
+        start = context.Barrier(6)
+        processes = [context.Process(target=open_migrated, args=(TEST_DATABASE, start)) for _ in range(6)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(60)
+        self.assertEqual([process.exitcode for process in processes], [0] * 6)
+        self.assertEqual(migrations.schema_version(self.conn), len(migrations.MOVIES))
+        self.assertEqual(self.conn.execute("SELECT review_count FROM rating_stats").fetchall(), [(1,)])
+
+    def test_failed_migration_rolls_back(self):
+        """Testing that a failing migration leaves the version and schema unchanged."""
+        broken = [migrations.MOVIES[0], ["CREATE TABLE extra (id INTEGER)", "CREATE INDEX bad ON missing (x)"]]
+        with self.assertRaises(sqlite3.OperationalError):
+            migrations.migrate(self.conn, broken)
+        self.assertEqual(migrations.schema_version(self.conn), 1)
+        tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertNotIn("extra", tables)
+
+
+class TestQueryPlans(unittest.TestCase):
+    """Runs every domain function and checks each statement's plan for table scans."""
+
+    def setUp(self):
+        self.saved = {module: module.DATABASE for module in (movies, tv_shows, books)}
+        for module in self.saved:
+            module.DATABASE = f"test_plans_{module.__name__}.db"
+
+    def tearDown(self):
+        storage.close_all()
+        for module, database in self.saved.items():
+            if os.path.exists(module.DATABASE):
+                os.remove(module.DATABASE)
+            module.DATABASE = database
+
+    def scanned_table(self, conn, statement, step, plan):
+        """Returns the table a bare SCAN step walks, or None (subquery results don't
+        count, nor does a walk in id order that stops at a LIMIT)."""
+        match = re.fullmatch(r"SCAN (\w+)", step)
+        if not match:
+            return None
+        if re.search(rf"ORDER BY {match.group(1)}\.id( ASC| DESC)?\s+LIMIT", statement) \
+                and not any("TEMP B-TREE" in other for other in plan):
+            return None
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        aliases = dict((alias, table) for table, alias in
+                       re.findall(r"(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?(\w+)", statement, re.IGNORECASE))
+        name = aliases.get(match.group(1), match.group(1))
+        return name if name in tables else None
+
+    def assert_uses_indexes(self, module, calls):
+        conn = module.get_connection()
+        for name, call in calls:
+            # Cleared first, so cached functions run their queries
+            cache.clear()
+            statements = []
+            conn.set_trace_callback(statements.append)
+            try:
+                call()
+            finally:
+                conn.set_trace_callback(None)
+            qualified = f"{module.__name__}.{name}"
+            for statement in statements:
+                if not re.match(r"\s*(SELECT|UPDATE|DELETE)", statement, re.IGNORECASE):
+                    continue
+                plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + statement)]
+                scans = [step for step in plan if self.scanned_table(conn, statement, step, plan)]
+                if qualified not in ALLOWED_SCANS:
+                    self.assertEqual(scans, [], f"{qualified} scans a table: {statement.strip()}")
+
+    def catalog_pages(self, module):
+        """Every sort of view_catalog_page, both ways, for a first and a later page."""
+        later = {"id": [(1, 1)], "title": [("M", 1)], "genre": [("M", 1)], "rating": [(4.0, 1), (None, 1)]}
+        return [(f"view_catalog_page({sort}, descending={descending}, after={after})",
+                 lambda sort=sort, descending=descending, after=after:
+                     module.view_catalog_page(sort, descending, 1, after))
+                for sort in storage.CATALOG_SORTS for descending in (False, True)
+                for after in [None] + later[sort]]
+
+    def test_movies_queries_use_indexes(self):
+        self.assert_uses_indexes(movies, [
+            ("add_movie", lambda: movies.add_movie("Inception", "Science Fiction")),
+            ("add_review", lambda: movies.add_review(1, 5, "Amazing movie!")),
+            ("edit_review", lambda: movies.edit_review(1, 1, 4, "Still great")),
+            ("view_reviews", movies.view_reviews),
+            ("view_reviews_page", lambda: movies.view_reviews_page(10, 0)),
+            ("iter_reviews", lambda: list(movies.iter_reviews(0, 10))),
+            ("view_reviews_json", lambda: movies.view_reviews_json(10, 0)),
+            ("iter_reviews_json", lambda: list(movies.iter_reviews_json(0, 10))),
+            *self.catalog_pages(movies),
+            ("search_reviews_many", lambda: movies.search_reviews_many([1, 2])),
+            ("search_reviews", lambda: movies.search_reviews(1)),
+            ("search_by_genre", lambda: movies.search_by_genre("Science Fiction")),
+            ("search", lambda: movies.search("inception great")),
+            ("view_movie_genre", movies.view_movie_genre),
+            ("view_top_movies", movies.view_top_movies),
+            ("view_top_rated", movies.view_top_rated),
+            ("view_rating_stats", lambda: movies.view_rating_stats(1)),
+            ("view_summary", movies.view_summary),
+            ("view_changes_json", lambda: movies.view_changes_json(1, 10)),
+            ("delete_review", lambda: movies.delete_review(1, 1)),
+            ("delete_movie", lambda: movies.delete_movie(1)),
+        ])
+
+    def test_tv_shows_queries_use_indexes(self):
+        self.assert_uses_indexes(tv_shows, [
+            ("add_show", lambda: tv_shows.add_show("Breaking Bad", "Drama")),
+            ("add_review", lambda: tv_shows.add_review(1, 5, "Gripping")),
+            ("edit_review", lambda: tv_shows.edit_review(1, 1, 4, "Still gripping")),
+            ("view_reviews", tv_shows.view_reviews),
+            ("view_reviews_page", lambda: tv_shows.view_reviews_page(10, 0)),
+            ("iter_reviews", lambda: list(tv_shows.iter_reviews(0, 10))),
+            ("view_reviews_json", lambda: tv_shows.view_reviews_json(10, 0)),
+            ("iter_reviews_json", lambda: list(tv_shows.iter_reviews_json(0, 10))),
+            *self.catalog_pages(tv_shows),
+            ("search_reviews_many", lambda: tv_shows.search_reviews_many([1, 2])),
+            ("search_reviews", lambda: tv_shows.search_reviews(1)),
+            ("search_by_genre", lambda: tv_shows.search_by_genre("Drama")),
+            ("search", lambda: tv_shows.search("breaking")),
+            ("view_top_rated", tv_shows.view_top_rated),
+            ("view_rating_stats", lambda: tv_shows.view_rating_stats(1)),
+            ("view_summary", tv_shows.view_summary),
+            ("view_changes_json", lambda: tv_shows.view_changes_json(1, 10)),
+            ("delete_review", lambda: tv_shows.delete_review(1, 1)),
+            ("delete_show", lambda: tv_shows.delete_show(1)),
+        ])
+
+    def test_books_queries_use_indexes(self):
+        self.assert_uses_indexes(books, [
+            ("add_book", lambda: books.add_book("1984", "Dystopian")),
+            ("add_review", lambda: books.add_review(1, 5, "Excellent book!")),
+            ("edit_review", lambda: books.edit_review(1, 1, 4, "Still excellent")),
+            ("view_books", books.view_books),
+            ("view_books_page", lambda: books.view_books_page(10, 0)),
+            ("iter_books", lambda: list(books.iter_books(0, 10))),
+            ("view_books_json", lambda: books.view_books_json(10, 0)),
+            ("iter_books_json", lambda: list(books.iter_books_json(0, 10))),
+            *self.catalog_pages(books),
+            ("view_books_with_reviews", books.view_books_with_reviews),
+            ("search_reviews_many", lambda: books.search_reviews_many([1, 2])),
+            ("search_reviews", lambda: books.search_reviews(1)),
+            ("search_by_genre", lambda: books.search_by_genre("Dystopian")),
+            ("search", lambda: books.search("dystopian")),
+            ("view_book_genres", books.view_book_genres),
+            ("view_top_books", books.view_top_books),
+            ("view_rating_stats", lambda: books.view_rating_stats(1)),
+            ("view_summary", books.view_summary),
+            ("view_changes_json", lambda: books.view_changes_json(1, 10)),
+            ("delete_review", lambda: books.delete_review(1, 1)),
+            ("delete_book", lambda: books.delete_book(1)),
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,74 +2,150 @@
 # Author: Aditi Jha
 # Date: November 01, 2024, updated november 22, 2024, updated December 1, 2024
 
-import sqlite3
+import cache
+import events
+import migrations
+import storage
 
 DATABASE = 'movie_reviews.db'
 
+def get_connection():
+    """Returns this thread's pooled connection to the movies database."""
+    return storage.get_connection(DATABASE, migrations.upgrade_movies)
+
+def data_version():
+    """Returns a token that changes whenever a movie or review is written, after
+    dropping cached reads made before a write from outside this process."""
+    return cache.revalidate("movies")
+
+cache.track_version("movies", lambda: storage.data_version(get_connection()))
+
+# Cache tags: "list" covers the listing pages, "item:<id>" one title's reviews
+# and rating stats, "genre:<genre>" and "genres" the genre queries, "ratings"
+# the top-rated queries and "search" full-text results.
+def _review_tags(movie_id, *args, **kwargs):
+    """Tags a review write affects: the title's own entries plus every listing."""
+    return ["list", f"item:{movie_id}", "ratings", "search"]
+
+@cache.invalidates("movies", lambda name, genre: ["list", "genres", f"genre:{genre}", "search"])
 def add_movie(name, genre):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO movies (name, genre) VALUES (?, ?)', (name, genre))
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:
+        movie_id = conn.execute('INSERT INTO movies (name, genre) VALUES (?, ?)', (name, genre)).lastrowid
+    events.publish("movies", "movie_added", {"movie_id": movie_id, "name": name, "genre": genre})
     return {"message": f"Movie '{name}' added successfully."}
 
+@cache.invalidates("movies", _review_tags)
 def add_review(movie_id, rating, note):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO reviews (movie_id, rating, note) VALUES (?, ?, ?)', (movie_id, rating, note))
-    conn.commit()
-    conn.close()
+    review_id = storage.write(DATABASE, get_connection,
+                              'INSERT INTO reviews (movie_id, rating, note) VALUES (?, ?, ?)', (movie_id, rating, note))
+    events.publish("movies", "review_added",
+                   {"movie_id": movie_id, "review_id": review_id, "rating": rating, "note": note})
     return {"message": f"Review added to movie ID {movie_id}."}
 
+@cache.invalidates("movies", _review_tags)
 def edit_review(movie_id, review_id, rating=None, note=None):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    if rating:
-        cursor.execute('UPDATE reviews SET rating = ? WHERE id = ? AND movie_id = ?', (rating, review_id, movie_id))
-    if note:
-        cursor.execute('UPDATE reviews SET note = ? WHERE id = ? AND movie_id = ?', (note, review_id, movie_id))
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    updated = 0
+    with conn:
+        if rating:
+            updated += conn.execute('UPDATE reviews SET rating = ? WHERE id = ? AND movie_id = ?',
+                                    (rating, review_id, movie_id)).rowcount
+        if note:
+            updated += conn.execute('UPDATE reviews SET note = ? WHERE id = ? AND movie_id = ?',
+                                    (note, review_id, movie_id)).rowcount
+    if updated:
+        events.publish("movies", "review_edited",
+                       {"movie_id": movie_id, "review_id": review_id, "rating": rating, "note": note})
     return {"message": f"Review ID {review_id} for movie ID {movie_id} updated."}
 
+@cache.invalidates("movies", _review_tags)
 def delete_review(movie_id, review_id):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM reviews WHERE id = ? AND movie_id = ?', (review_id, movie_id))
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:
+        deleted = conn.execute('DELETE FROM reviews WHERE id = ? AND movie_id = ?', (review_id, movie_id)).rowcount
+    if deleted:
+        events.publish("movies", "review_deleted", {"movie_id": movie_id, "review_id": review_id})
     return {"message": f"Review ID {review_id} deleted from movie ID {movie_id}."}
 
+@cache.invalidates("movies", lambda movie_id: _review_tags(movie_id) + ["genres", "genre"])
 def delete_movie(movie_id):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM reviews WHERE movie_id = ?', (movie_id,))
-    cursor.execute('DELETE FROM movies WHERE id = ?', (movie_id,))
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:
+        reviews = conn.execute('DELETE FROM reviews WHERE movie_id = ?', (movie_id,)).rowcount
+        deleted = conn.execute('DELETE FROM movies WHERE id = ?', (movie_id,)).rowcount
+    if deleted:
+        events.publish("movies", "movie_deleted", {"movie_id": movie_id, "reviews_deleted": reviews})
     return {"message": f"Movie ID {movie_id} and its reviews have been deleted."}
 
+@cache.cached("movies", lambda: ["list"])
 def view_reviews():
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM movies')
-    movies = cursor.fetchall()
-    result = []
-    for movie in movies:
-        cursor.execute('SELECT * FROM reviews WHERE movie_id = ?', (movie[0],))
-        reviews = cursor.fetchall()
-        result.append({
-            "id": movie[0],
-            "name": movie[1],
-            "genre": movie[2],
-            "reviews": [{"review_id": r[0], "rating": r[2], "note": r[3]} for r in reviews]
-        })
-    conn.close()
-    return result
+    return list(iter_reviews())
+
+@cache.cached("movies", lambda limit, after=0: ["list"])
+def view_reviews_page(limit, after=0):
+    """Returns up to `limit` movies with id greater than `after`, with their reviews."""
+    return list(iter_reviews(after, limit))
+
+def iter_reviews(after=0, limit=-1):
+    """Yields movies with their reviews one at a time in id order (limit -1 means no limit)."""
+    conn = get_connection()
+    # Bounding the page by its last id (instead of joining a LIMIT subquery)
+    # keeps the join a flat, id-ordered scan that can stream without sorting.
+    cursor = conn.execute('''
+        SELECT m.id, m.name, m.genre, r.id, r.rating, r.note
+        FROM movies m
+        LEFT JOIN reviews r ON r.movie_id = m.id
+        WHERE m.id > ?
+          AND m.id <= (SELECT MAX(id) FROM (SELECT id FROM movies WHERE id > ? ORDER BY id LIMIT ?))
+        ORDER BY m.id, r.id
+    ''', (after, after, limit))
+    return storage.iter_nested_reviews(cursor, "name")
 
+@cache.cached("movies", lambda limit=-1, after=0: ["list"])
+def view_reviews_json(limit=-1, after=0):
+    """Returns view_reviews_page's movies as (id, JSON text) rows; see iter_reviews_json."""
+    return list(iter_reviews_json(after, limit))
+
+def iter_reviews_json(after=0, limit=-1):
+    """Yields (id, JSON text) for movies with their reviews in id order.
+
+    SQLite builds the JSON, with the same content as iter_reviews' dicts and
+    sorted keys, so list responses skip building and encoding dicts in Python.
+    """
+    conn = get_connection()
+    return conn.execute('''
+        SELECT m.id, json_object(
+            'genre', m.genre, 'id', m.id, 'name', m.name,
+            'reviews', json((
+                SELECT json_group_array(json_object('note', r.note, 'rating', r.rating, 'review_id', r.id))
+                FROM (SELECT id, rating, note FROM reviews WHERE movie_id = m.id ORDER BY id) r)))
+        FROM movies m
+        WHERE m.id > ?
+        ORDER BY m.id
+        LIMIT ?
+    ''', (after, limit))
+
+@cache.cached("movies", lambda sort="id", descending=False, limit=20, after=None: ["list"])
+def view_catalog_page(sort="id", descending=False, limit=20, after=None):
+    """Returns a page of movies with their review count and average rating, sorted
+    by `sort` (one of storage.CATALOG_SORTS), and the `after` of the next page."""
+    rows, next_after = storage.catalog_page(get_connection(), "movies", "name", "movie_id",
+                                            sort, descending, limit, after)
+    return [{"id": row[0], "name": row[1], "genre": row[2], "review_count": row[3] or 0,
+             "average_rating": row[4]} for row in rows], next_after
+
+def view_changes_json(since, limit):
+    """Returns up to `limit` (version, JSON text) rows for the movies and reviews
+    inserted, updated or deleted after version `since`, oldest first."""
+    return storage.changes_json(get_connection(), {
+        "movies": ("movie", {"name": "name", "genre": "genre"}),
+        "reviews": ("review", {"movie_id": "movie_id", "rating": "rating", "note": "note"}),
+    }, since, limit)
+
+@cache.cached("movies", lambda movie_id: [f"item:{movie_id}"])
 def search_reviews(movie_id):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM movies WHERE id = ?', (movie_id,))
     movie = cursor.fetchone()
@@ -77,7 +153,6 @@ def search_reviews(movie_id):
         return {"error": "Movie not found."}
     cursor.execute('SELECT * FROM reviews WHERE movie_id = ?', (movie_id,))
     reviews = cursor.fetchall()
-    conn.close()
     return {
         "id": movie[0],
         "name": movie[1],
@@ -85,12 +160,53 @@ def search_reviews(movie_id):
         "reviews": [{"review_id": r[0], "rating": r[2], "note": r[3]} for r in reviews]
     }
 
+@cache.cached_many("movies", lambda movie_id: [f"item:{movie_id}"], search_reviews)
+def search_reviews_many(movie_ids):
+    """search_reviews() for many movies at once, in the order given: one query
+    per storage.IN_CHUNK ids instead of two per movie."""
+    conn = get_connection()
+    found = {}
+    for chunk in storage.chunked(movie_ids):
+        cursor = conn.execute(f'''
+            SELECT t.id, t.name, t.genre, r.id, r.rating, r.note
+            FROM movies t
+            LEFT JOIN reviews r ON r.movie_id = t.id
+            WHERE t.id IN ({storage.placeholders(len(chunk))})
+            ORDER BY t.id, r.id
+        ''', chunk)
+        found.update((item["id"], item) for item in storage.iter_nested_reviews(cursor, "name"))
+    return [found.get(movie_id, {"error": "Movie not found."}) for movie_id in movie_ids]
+
+@cache.cached("movies", lambda text, limit=20: ["search"])
+def search(text, limit=20):
+    """Full-text search over movie names, genres and review notes, best bm25 match first."""
+    query = storage.fts_query(text)
+    if query is None:
+        return []
+    conn = get_connection()
+    cursor = conn.execute('''
+        SELECT m.id, m.name, m.genre, MIN(hits.score) AS score
+        FROM (
+            SELECT rowid AS movie_id, bm25(movies_fts) AS score
+            FROM movies_fts WHERE movies_fts MATCH ?
+            UNION ALL
+            SELECT r.movie_id, bm25(reviews_fts)
+            FROM reviews_fts JOIN reviews r ON r.id = reviews_fts.rowid
+            WHERE reviews_fts MATCH ?
+        ) hits
+        JOIN movies m ON m.id = hits.movie_id
+        GROUP BY m.id
+        ORDER BY score
+        LIMIT ?
+    ''', (query, query, limit))
+    return [{"id": row[0], "name": row[1], "genre": row[2], "score": row[3]} for row in cursor]
+
+@cache.cached("movies", lambda genre: ["genre", f"genre:{genre}"])
 def search_by_genre(genre):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM movies WHERE genre = ?', (genre,))
     movies = cursor.fetchall()
-    conn.close()
     return [{"id": movie[0], "name": movie[1], "genre": movie[2]} for movie in movies]
 
 
@@ -99,21 +215,67 @@ def search_by_genre(genre):
 #Keith
 
 
+@cache.cached("movies", lambda: ["genres"])
 def view_movie_genre():
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT DISTINCT genre FROM movies')
     genres = cursor.fetchall()
     result = [genre[0] for genre in genres]
-    conn.close()
     return result
 
 
+@cache.cached("movies", lambda: ["ratings"])
 def view_top_movies():
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM reviews ORDER BY rating DESC LIMIT 3')
     reviews = cursor.fetchall()
     result = [review[0] for review in reviews]
-    conn.close()
     return result
+
+
+@cache.cached("movies", lambda limit=3: ["ratings"])
+def view_top_rated(limit=3):
+    """Returns the movies with the highest average rating, read from rating_stats."""
+    conn = get_connection()
+    cursor = conn.execute(
+        'SELECT movie_id, rating_avg, review_count FROM rating_stats ORDER BY rating_avg DESC, movie_id LIMIT ?',
+        (limit,))
+    return [{"movie_id": row[0], "average_rating": row[1], "review_count": row[2]} for row in cursor]
+
+@cache.cached("movies", lambda movie_id: [f"item:{movie_id}"])
+def view_rating_stats(movie_id):
+    """Returns review count, rating sum, min, max and average for one movie."""
+    conn = get_connection()
+    row = conn.execute(
+        'SELECT review_count, rating_sum, rating_min, rating_max, rating_avg FROM rating_stats WHERE movie_id = ?',
+        (movie_id,)).fetchone()
+    if not row:
+        return {"movie_id": movie_id, "review_count": 0, "rating_sum": 0,
+                "rating_min": None, "rating_max": None, "average_rating": None}
+    return {"movie_id": movie_id, "review_count": row[0], "rating_sum": row[1],
+            "rating_min": row[2], "rating_max": row[3], "average_rating": row[4]}
+
+
+def view_summary(limit=5):
+    """Returns movie and review counts, genres with their movie counts and the
+    `limit` best-rated movies, as summary.py puts them on the home page."""
+    conn = get_connection()
+    titles, reviews = conn.execute(
+        'SELECT (SELECT COUNT(*) FROM movies), (SELECT COUNT(*) FROM reviews)').fetchone()
+    genres = conn.execute('SELECT genre, COUNT(*) FROM movies GROUP BY genre ORDER BY genre')
+    top = conn.execute('''
+        SELECT t.id, t.name, t.genre, s.rating_avg, s.review_count
+        FROM rating_stats s
+        JOIN movies t ON t.id = s.movie_id
+        ORDER BY s.rating_avg DESC, s.movie_id
+        LIMIT ?
+    ''', (limit,))
+    return {
+        "titles": titles,
+        "reviews": reviews,
+        "genres": [{"genre": row[0], "titles": row[1]} for row in genres],
+        "top_rated": [{"id": row[0], "name": row[1], "genre": row[2], "average_rating": row[3],
+                       "review_count": row[4]} for row in top],
+    }
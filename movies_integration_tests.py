@@ -4,6 +4,7 @@
 
 import unittest
 import json
+import sqlite3
 from api import app
 import movies
 
@@ -15,7 +16,7 @@ class TestMoviesIntegration(unittest.TestCase):
 
         # Using a test database for integration testing
         movies.DATABASE = 'test_movie_reviews.db'
-        with movies.sqlite3.connect(movies.DATABASE) as conn:
+        with sqlite3.connect(movies.DATABASE) as conn:
             cursor = conn.cursor()
             # Create the movies table
             cursor.execute('''
@@ -39,7 +40,7 @@ class TestMoviesIntegration(unittest.TestCase):
 
     def tearDown(self):
         """Cleaning up the test database after each test."""
-        with movies.sqlite3.connect(movies.DATABASE) as conn:
+        with sqlite3.connect(movies.DATABASE) as conn:
             cursor = conn.cursor()
             cursor.execute('DROP TABLE IF EXISTS reviews')
             cursor.execute('DROP TABLE IF EXISTS movies')
@@ -189,5 +190,52 @@ class TestMoviesIntegration(unittest.TestCase):
         self.assertEqual(data[0]['name'], "Inception")
         self.assertEqual(data[1]['name'], "Interstellar")
 
+    def test_view_reviews_paginated(self):
+        """Testing keyset pagination on the GET /movies endpoint."""
+        for name in ("Inception", "Interstellar", "Memento"):
+            self.app.post(
+                '/movies',
+                data=json.dumps({"name": name, "genre": "Science Fiction"}),
+                content_type='application/json'
+            )
+        response = self.app.get('/movies?limit=2')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.get_data(as_text=True))
+        self.assertEqual([m['name'] for m in data['items']], ["Inception", "Interstellar"])
+        self.assertEqual(data['next'], 2)
+        # Following the cursor to the last page
+        response = self.app.get(f"/movies?limit=2&after={data['next']}")
+        data = json.loads(response.get_data(as_text=True))
+        self.assertEqual([m['name'] for m in data['items']], ["Memento"])
+        self.assertIsNone(data['next'])
+        # Rejecting invalid page sizes
+        response = self.app.get('/movies?limit=0')
+        self.assertEqual(response.status_code, 400)
+
+    def test_view_reviews_ndjson(self):
+        """Testing the streaming NDJSON mode of the GET /movies endpoint."""
+        self.app.post(
+            '/movies',
+            data=json.dumps({"name": "Inception", "genre": "Science Fiction"}),
+            content_type='application/json'
+        )
+        self.app.post(
+            '/movies',
+            data=json.dumps({"name": "Interstellar", "genre": "Science Fiction"}),
+            content_type='application/json'
+        )
+        self.app.post(
+            '/movies/2/reviews',
+            data=json.dumps({"rating": 5, "note": "Amazing movie!"}),
+            content_type='application/json'
+        )
+        response = self.app.get('/movies?format=ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = response.get_data(as_text=True).splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([m['name'] for m in rows], ["Inception", "Interstellar"])
+        self.assertEqual(rows[1]['reviews'][0]['note'], "Amazing movie!")
+
 if __name__ == '__main__':
     unittest.main()
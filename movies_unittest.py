@@ -112,6 +112,32 @@ class TestMovies(unittest.TestCase):
         self.assertEqual(len(response[0]["reviews"]), 1)
         self.assertEqual(response[0]["reviews"][0]["note"], "Amazing movie!")
 
+    def test_view_reviews_groups_reviews_by_movie(self):
+        """Testing that reviews stay with their movie and unreviewed movies are listed."""
+        movies.add_movie("Inception", "Science Fiction")
+        movies.add_movie("Interstellar", "Science Fiction")
+        movies.add_movie("Memento", "Thriller")
+        movies.add_review(3, 4, "Twisty")
+        movies.add_review(1, 5, "Amazing movie!")
+        movies.add_review(3, 5, "Even better the second time")
+        response = movies.view_reviews()
+        self.assertEqual([m["name"] for m in response], ["Inception", "Interstellar", "Memento"])
+        self.assertEqual([r["note"] for r in response[0]["reviews"]], ["Amazing movie!"])
+        self.assertEqual(response[1]["reviews"], [])
+        self.assertEqual([r["review_id"] for r in response[2]["reviews"]], [1, 3])
+
+    def test_view_reviews_page(self):
+        """Testing keyset pages of movies and their reviews."""
+        movies.add_movie("Inception", "Science Fiction")
+        movies.add_movie("Interstellar", "Science Fiction")
+        movies.add_movie("Memento", "Thriller")
+        movies.add_review(2, 5, "Amazing movie!")
+        first = movies.view_reviews_page(2)
+        self.assertEqual([m["id"] for m in first], [1, 2])
+        self.assertEqual(first[1]["reviews"][0]["note"], "Amazing movie!")
+        second = movies.view_reviews_page(2, after=2)
+        self.assertEqual([m["name"] for m in second], ["Memento"])
+
     def test_search_reviews(self):
         """Testing searching for reviews by movie ID."""
         movies.add_movie("Inception", "Science Fiction")
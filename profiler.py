@@ -0,0 +1,247 @@
+# Opt-in SQL statement profiler for the connections opened through storage.py
+# Pooled connections are created as profiler.Connection, which behaves exactly
+# like sqlite3.Connection until enable() is called. From then on every
+# statement run through execute(), executemany() or a cursor is timed,
+# including the time spent fetching its rows, and aggregated by normalized
+# text (literals replaced by ?, IN lists collapsed). Statements slower than the
+# threshold also go to the "slow_queries" log with their EXPLAIN QUERY PLAN.
+# Profiling is per process; see POST /admin/profiler in api.py.
+
+import collections
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+# Statements at least this slow (ms) are written to the slow-query log
+DEFAULT_THRESHOLD_MS = 100.0
+# Slow statements kept in memory for report()
+SLOW_ENTRIES = 100
+
+log = logging.getLogger("slow_queries")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(sql):
+    """Returns `sql` with literals replaced by ? and whitespace collapsed, so that
+    statements differing only in their values are counted together."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _SPACE.sub(" ", sql).strip()
+    return _IN_LIST.sub("(?, ...)", sql)
+
+
+def count_parameters(parameters):
+    return len(parameters) if parameters is not None else 0
+
+
+class Profiler:
+    """Aggregates statement timings and keeps the slow-query log."""
+
+    def __init__(self, threshold_ms=DEFAULT_THRESHOLD_MS, explain=True):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._stats = {}  # normalized sql -> [calls, total ms, max ms, rows, max parameters]
+        self._plans = {}  # normalized sql -> EXPLAIN QUERY PLAN text
+        self.slow = collections.deque(maxlen=SLOW_ENTRIES)
+
+    def record(self, connection, sql, parameters, param_count, rows, elapsed_ms):
+        text = normalize(sql)
+        with self._lock:
+            stat = self._stats.get(text)
+            if stat is None:
+                stat = self._stats[text] = [0, 0.0, 0.0, 0, 0]
+            stat[0] += 1
+            stat[1] += elapsed_ms
+            stat[2] = max(stat[2], elapsed_ms)
+            stat[3] += rows
+            stat[4] = max(stat[4], param_count)
+        if elapsed_ms >= self.threshold_ms:
+            self.log_slow(connection, sql, text, parameters, param_count, rows, elapsed_ms)
+
+    def log_slow(self, connection, sql, text, parameters, param_count, rows, elapsed_ms):
+        plan = self._plans.get(text)
+        if plan is None and self.explain:
+            plan = self._plans[text] = explain(connection, sql, parameters)
+        entry = {"sql": text, "ms": round(elapsed_ms, 3), "rows": rows, "params": param_count,
+                 "plan": plan, "at": time.time()}
+        self.slow.append(entry)
+        log.warning("slow query %.1f ms, %d rows: %s\n%s", elapsed_ms, rows, text, plan or "")
+
+    def top(self, n=20, order="total_ms"):
+        """Returns the `n` statements with the highest `order` (total_ms, calls, max_ms, mean_ms or rows)."""
+        with self._lock:
+            rows = [{"sql": text, "calls": calls, "total_ms": round(total, 3), "mean_ms": round(total / calls, 3),
+                     "max_ms": round(longest, 3), "rows": rows, "params": params}
+                    for text, (calls, total, longest, rows, params) in self._stats.items()]
+        rows.sort(key=lambda row: row[order], reverse=True)
+        return rows[:n]
+
+    def report(self, n=20, order="total_ms"):
+        return {"enabled": True, "since": self.started, "threshold_ms": self.threshold_ms,
+                "top": self.top(n, order), "slow": list(self.slow)}
+
+
+def explain(connection, sql, parameters):
+    """Returns the EXPLAIN QUERY PLAN of `sql` as indented text, or None if SQLite refuses it."""
+    try:
+        rows = sqlite3.Connection.execute(connection, f"EXPLAIN QUERY PLAN {sql}", parameters or ()).fetchall()
+    except (sqlite3.Error, ValueError):
+        return None
+    depth = {0: 0}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, 0) + 1
+        lines.append("  " * (depth[node] - 1) + detail)
+    return "\n".join(lines)
+
+
+# The running Profiler, or None while profiling is off
+active = None
+_lock = threading.Lock()
+_timer = None
+
+
+def enable(threshold_ms=DEFAULT_THRESHOLD_MS, duration=None, explain=True):
+    """Starts a fresh profile; stops it again after `duration` seconds if given."""
+    global active, _timer
+    with _lock:
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+        active = Profiler(threshold_ms, explain)
+        if duration:
+            _timer = threading.Timer(duration, _expire, (active,))
+            _timer.daemon = True
+            _timer.start()
+        return active
+
+
+def disable():
+    """Stops profiling and returns the finished Profiler (or None)."""
+    global active, _timer
+    with _lock:
+        profiler, active = active, None
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+        return profiler
+
+
+def _expire(profiler):
+    # A later enable() may have replaced the profile this timer was set for
+    if active is profiler:
+        disable()
+
+
+def report(n=20, order="total_ms"):
+    profiler = active
+    if profiler is None:
+        return {"enabled": False}
+    return profiler.report(n, order)
+
+
+class Cursor(sqlite3.Cursor):
+    """Cursor that times its statement until its rows are used up."""
+
+    _trace = None  # [profiler, sql, parameters, parameter count, rows, ms]
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        profiler = active
+        if profiler is None:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        elapsed = (time.perf_counter() - start) * 1e3
+        self._trace = [profiler, sql, parameters, count_parameters(parameters), 0, elapsed]
+        if self.description is None:
+            # Not a query: the work is done, count the rows it changed
+            self._trace[4] = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        profiler = active
+        if profiler is None:
+            return super().executemany(sql, seq_of_parameters)
+        counted = [0, None]  # bound values, first parameter set (for EXPLAIN)
+
+        def counting(rows):
+            for parameters in rows:
+                if counted[1] is None:
+                    counted[1] = parameters
+                counted[0] += count_parameters(parameters)
+                yield parameters
+
+        start = time.perf_counter()
+        super().executemany(sql, counting(seq_of_parameters))
+        elapsed = (time.perf_counter() - start) * 1e3
+        profiler.record(self.connection, sql, counted[1], counted[0], max(self.rowcount, 0), elapsed)
+        return self
+
+    def __next__(self):
+        trace = self._trace
+        if trace is None:
+            return super().__next__()
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            trace[5] += (time.perf_counter() - start) * 1e3
+            self._finish()
+            raise
+        trace[5] += (time.perf_counter() - start) * 1e3
+        trace[4] += 1
+        return row
+
+    # The C fetch methods skip __next__, so they are rebuilt on top of it
+    def fetchone(self):
+        return next(self, None)
+
+    def fetchmany(self, size=None):
+        return [row for _, row in zip(range(self.arraysize if size is None else size), self)]
+
+    def fetchall(self):
+        return list(self)
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+    def _finish(self):
+        """Records the statement; called once its rows are exhausted or abandoned."""
+        trace, self._trace = self._trace, None
+        if trace is not None:
+            profiler, sql, parameters, param_count, rows, elapsed = trace
+            profiler.record(self.connection, sql, parameters, param_count, rows, elapsed)
+
+
+class Connection(sqlite3.Connection):
+    """sqlite3.Connection whose statements are profiled while a Profiler is active."""
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = sqlite3.Cursor if active is None else Cursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if active is None:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if active is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,98 @@
+# Unit Tests for the SQL profiler and its admin endpoint
+
+import os
+import time
+import unittest
+from unittest import mock
+import api
+import cache
+import movies
+import profiler
+import storage
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        """Pointing movies at a fresh database with caching off, so every call reaches SQLite."""
+        self.saved = movies.DATABASE
+        movies.DATABASE = 'test_profiler_movies.db'
+        cache.configure(backend=cache.NullCache())
+        movies.add_movie("Heat", "Crime")
+        movies.add_movie("Alien", "Sci-Fi")
+        movies.add_review(1, 5, "Great")
+        movies.add_review(1, 4, "Good")
+        self.client = api.app.test_client()
+
+    def tearDown(self):
+        profiler.disable()
+        storage.close_all()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(movies.DATABASE + suffix):
+                os.remove(movies.DATABASE + suffix)
+        movies.DATABASE = self.saved
+        cache.configure()
+
+    def test_normalize(self):
+        """Testing that literals become ? and IN lists and whitespace collapse."""
+        self.assertEqual(profiler.normalize("SELECT *\n  FROM t WHERE a = 'x''y' AND b IN (?, ?,?) LIMIT 10"),
+                         "SELECT * FROM t WHERE a = ? AND b IN (?, ...) LIMIT ?")
+        self.assertEqual(profiler.normalize("SELECT c2 FROM t2"), "SELECT c2 FROM t2")
+
+    def test_off_by_default(self):
+        """Testing that nothing is recorded and queries behave normally while profiling is off."""
+        self.assertEqual(profiler.report(), {"enabled": False})
+        cursor = movies.get_connection().cursor()
+        cursor.execute("SELECT id FROM movies ORDER BY id")
+        self.assertEqual(cursor.fetchmany(1), [(1,)])
+        self.assertEqual(cursor.fetchall(), [(2,)])
+
+    def test_statements_aggregated(self):
+        """Testing that statements are counted with their rows, parameters and fetch time."""
+        profiler.enable(threshold_ms=1e9)
+        movies.search_reviews(1)
+        movies.search_reviews(2)
+        cursor = movies.get_connection().cursor()
+        cursor.execute("SELECT id FROM movies ORDER BY id")
+        self.assertEqual(cursor.fetchmany(1), [(1,)])
+        self.assertEqual(cursor.fetchall(), [(2,)])
+        top = {row["sql"]: row for row in profiler.active.top(50)}
+        reviews = top["SELECT * FROM reviews WHERE movie_id = ?"]
+        self.assertEqual((reviews["calls"], reviews["rows"], reviews["params"]), (2, 2, 1))
+        self.assertEqual(top["SELECT id FROM movies ORDER BY id"]["rows"], 2)
+        self.assertEqual(profiler.report()["slow"], [])
+
+    def test_slow_queries_logged_with_plan(self):
+        """Testing that statements over the threshold are logged with their query plan."""
+        profiler.enable(threshold_ms=0)
+        with self.assertLogs("slow_queries", "WARNING") as logged:
+            movies.search_reviews(1)
+        slow = {entry["sql"]: entry for entry in profiler.report()["slow"]}
+        plan = slow["SELECT * FROM reviews WHERE movie_id = ?"]["plan"]
+        self.assertRegex(plan, r"SEARCH reviews USING (COVERING )?INDEX")
+        self.assertTrue(any("movie_id" in line for line in logged.output))
+
+    def test_duration_turns_it_off(self):
+        """Testing that a profile started with a duration stops by itself."""
+        profiler.enable(duration=0.05)
+        time.sleep(0.2)
+        self.assertIsNone(profiler.active)
+
+    def test_admin_endpoint(self):
+        """Testing that the endpoint switches profiling on and off and honours ADMIN_TOKEN."""
+        response = self.client.post("/admin/profiler", json={"enabled": True, "threshold_ms": 1e9})
+        self.assertTrue(response.get_json()["enabled"])
+        self.client.get("/movies/1/reviews")
+        report = self.client.get("/admin/profiler?order=calls&limit=5").get_json()
+        self.assertTrue(report["top"])
+        self.assertLessEqual(len(report["top"]), 5)
+        self.assertEqual(self.client.get("/admin/profiler?order=nope").status_code, 400)
+        stopped = self.client.post("/admin/profiler", json={"enabled": False}).get_json()
+        self.assertFalse(stopped["enabled"])
+        self.assertTrue(stopped["top"])
+        self.assertIsNone(profiler.active)
+        with mock.patch.dict(os.environ, {"ADMIN_TOKEN": "secret"}):
+            self.assertEqual(self.client.get("/admin/profiler").status_code, 403)
+            self.assertEqual(self.client.get("/admin/profiler", headers={"X-Admin-Token": "secret"}).status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
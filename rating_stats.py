@@ -0,0 +1,80 @@
+# Consistency checker for the rating_stats tables kept by the review triggers
+# Usage: python rating_stats.py [--rebuild]
+# Compares each database's rating_stats rows against aggregates computed from
+# the reviews table and, with --rebuild, recomputes the table from scratch.
+
+import argparse
+import books
+import cache
+import movies
+import tv_shows
+
+# category -> (module, item id column in reviews and rating_stats)
+CATEGORIES = {
+    "movies": (movies, "movie_id"),
+    "tv_shows": (tv_shows, "tv_show_id"),
+    "books": (books, "book_id"),
+}
+
+# Averages maintained incrementally can differ from AVG() in the last bits
+TOLERANCE = 1e-9
+
+
+def expected_stats(connection, item_column):
+    """Returns {item id: (count, sum, min, max, avg)} computed from the reviews table."""
+    cursor = connection.execute(
+        f"SELECT {item_column}, COUNT(rating), SUM(rating), MIN(rating), MAX(rating), AVG(rating) "
+        f"FROM reviews WHERE rating IS NOT NULL GROUP BY {item_column}")
+    return {row[0]: row[1:] for row in cursor}
+
+
+def stored_stats(connection, item_column):
+    """Returns {item id: (count, sum, min, max, avg)} as stored in rating_stats."""
+    cursor = connection.execute(
+        f"SELECT {item_column}, review_count, rating_sum, rating_min, rating_max, rating_avg FROM rating_stats")
+    return {row[0]: row[1:] for row in cursor}
+
+
+def find_mismatches(connection, item_column):
+    """Returns the sorted ids of items whose stored stats are missing, stale or orphaned."""
+    expected = expected_stats(connection, item_column)
+    stored = stored_stats(connection, item_column)
+    mismatches = []
+    for item_id in expected.keys() | stored.keys():
+        want, have = expected.get(item_id), stored.get(item_id)
+        if want is None or have is None or any(abs(a - b) > TOLERANCE for a, b in zip(want, have)):
+            mismatches.append(item_id)
+    return sorted(mismatches)
+
+
+def rebuild(connection, item_column):
+    """Recomputes rating_stats from the reviews table in a single transaction."""
+    with connection:
+        connection.execute("DELETE FROM rating_stats")
+        connection.execute(
+            f"INSERT INTO rating_stats "
+            f"SELECT {item_column}, COUNT(rating), SUM(rating), MIN(rating), MAX(rating), AVG(rating) "
+            f"FROM reviews WHERE rating IS NOT NULL GROUP BY {item_column}")
+
+
+def check_all(repair=False):
+    """Checks every category and returns {category: mismatched item ids}, rebuilding if `repair`."""
+    report = {}
+    for category, (module, item_column) in CATEGORIES.items():
+        connection = module.get_connection()
+        report[category] = find_mismatches(connection, item_column)
+        if repair and report[category]:
+            rebuild(connection, item_column)
+            cache.invalidate(category)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the rating_stats tables against the reviews")
+    parser.add_argument("--rebuild", action="store_true", help="recompute tables that are out of sync")
+    args = parser.parse_args()
+    for category, mismatches in check_all(repair=args.rebuild).items():
+        status = "ok" if not mismatches else f"{len(mismatches)} mismatched items"
+        if mismatches and args.rebuild:
+            status += ", rebuilt"
+        print(f"{category}: {status}")
@@ -0,0 +1,75 @@
+# Unit Tests for the trigger-maintained rating_stats tables and their checker
+
+import os
+import unittest
+import books
+import movies
+import rating_stats
+import storage
+import tv_shows
+
+class TestRatingStats(unittest.TestCase):
+
+    def setUp(self):
+        """Pointing each module at a fresh database migrated by the storage layer."""
+        self.saved = {module: module.DATABASE for module in (movies, tv_shows, books)}
+        for module in self.saved:
+            module.DATABASE = f"test_stats_{module.__name__}.db"
+
+    def tearDown(self):
+        storage.close_all()
+        for module, database in self.saved.items():
+            if os.path.exists(module.DATABASE):
+                os.remove(module.DATABASE)
+            module.DATABASE = database
+
+    def test_stats_follow_review_writes(self):
+        """Testing that adding, editing and deleting reviews keeps the aggregates current."""
+        movies.add_movie("Inception", "Science Fiction")
+        movies.add_review(1, 3, "Confusing")
+        movies.add_review(1, 5, "Amazing movie!")
+        stats = movies.view_rating_stats(1)
+        self.assertEqual((stats["review_count"], stats["rating_sum"]), (2, 8))
+        self.assertEqual((stats["rating_min"], stats["rating_max"], stats["average_rating"]), (3, 5, 4.0))
+        movies.edit_review(1, 1, rating=4)
+        self.assertEqual(movies.view_rating_stats(1)["rating_min"], 4)
+        movies.delete_review(1, 2)
+        stats = movies.view_rating_stats(1)
+        self.assertEqual((stats["review_count"], stats["rating_max"], stats["average_rating"]), (1, 4, 4.0))
+        movies.delete_movie(1)
+        self.assertEqual(movies.view_rating_stats(1)["review_count"], 0)
+
+    def test_top_rated(self):
+        """Testing that top-N reads come back ordered by average rating."""
+        for title in ("Breaking Bad", "The Office", "Lost"):
+            tv_shows.add_show(title, "Drama")
+        tv_shows.add_review(1, 5, "Gripping")
+        tv_shows.add_review(2, 4, "Funny")
+        tv_shows.add_review(3, 2, "Confusing")
+        tv_shows.add_review(3, 3, "Got better")
+        top = tv_shows.view_top_rated(2)
+        self.assertEqual([show["tv_show_id"] for show in top], [1, 2])
+        self.assertEqual(tv_shows.view_top_rated(5)[2]["average_rating"], 2.5)
+        books.add_book("1984", "Dystopian")
+        books.add_book("Dune", "Science Fiction")
+        books.add_review(1, 3, "Bleak")
+        books.add_review(2, 5, "Epic")
+        self.assertEqual([book["book_id"] for book in books.view_top_books()], [2, 1])
+
+    def test_checker_detects_and_rebuilds(self):
+        """Testing that the checker finds drifted rows and rebuild repairs them."""
+        books.add_book("1984", "Dystopian")
+        books.add_review(1, 4, "Chilling")
+        connection = books.get_connection()
+        self.assertEqual(rating_stats.find_mismatches(connection, "book_id"), [])
+        with connection:
+            connection.execute("UPDATE rating_stats SET review_count = 7")
+            connection.execute("INSERT INTO rating_stats VALUES (99, 1, 1, 1, 1, 1.0)")
+        self.assertEqual(rating_stats.find_mismatches(connection, "book_id"), [1, 99])
+        report = rating_stats.check_all(repair=True)
+        self.assertEqual(report["books"], [1, 99])
+        self.assertEqual(rating_stats.find_mismatches(connection, "book_id"), [])
+        self.assertEqual(books.view_rating_stats(1)["review_count"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+# Unit Tests for full-text search across movies, TV shows and books
+
+import os
+import unittest
+import books
+import movies
+import storage
+import tv_shows
+from api import app
+
+class TestFullTextSearch(unittest.TestCase):
+
+    def setUp(self):
+        """Pointing each module at a fresh database migrated by the storage layer."""
+        self.saved = {module: module.DATABASE for module in (movies, tv_shows, books)}
+        for module in self.saved:
+            module.DATABASE = f"test_search_{module.__name__}.db"
+        self.app = app.test_client()
+
+    def tearDown(self):
+        storage.close_all()
+        for module, database in self.saved.items():
+            if os.path.exists(module.DATABASE):
+                os.remove(module.DATABASE)
+            module.DATABASE = database
+
+    def test_search_matches_titles_genres_and_notes(self):
+        """Testing that a word in a title, genre or review note finds the movie."""
+        movies.add_movie("Inception", "Science Fiction")
+        movies.add_movie("Up", "Animation")
+        movies.add_review(2, 5, "Balloons and a flying house")
+        self.assertEqual([m["name"] for m in movies.search("inception")], ["Inception"])
+        self.assertEqual([m["name"] for m in movies.search("fiction")], ["Inception"])
+        self.assertEqual([m["name"] for m in movies.search("balloons")], ["Up"])
+        self.assertEqual(movies.search("nothing matches this"), [])
+
+    def test_search_ranks_by_bm25(self):
+        """Testing that more relevant matches come first."""
+        books.add_book("Dune", "Science Fiction")
+        books.add_book("Dune Messiah", "Science Fiction")
+        books.add_review(2, 4, "More dune politics, dune everywhere")
+        results = books.search("dune")
+        self.assertEqual([b["title"] for b in results], ["Dune Messiah", "Dune"])
+        self.assertLessEqual(results[0]["score"], results[1]["score"])
+
+    def test_search_follows_edits_and_deletes(self):
+        """Testing that the triggers keep the index in sync with the tables."""
+        tv_shows.add_show("Breaking Bad", "Drama")
+        tv_shows.add_review(1, 5, "Chemistry teacher")
+        tv_shows.edit_review(1, 1, note="Desert crime saga")
+        self.assertEqual(tv_shows.search("chemistry"), [])
+        self.assertEqual(len(tv_shows.search("desert")), 1)
+        tv_shows.delete_show(1)
+        self.assertEqual(tv_shows.search("breaking"), [])
+        self.assertEqual(tv_shows.search("desert"), [])
+
+    def test_search_ignores_query_syntax(self):
+        """Testing that FTS5 operators in user input don't raise errors."""
+        movies.add_movie("Inception", "Science Fiction")
+        self.assertEqual(movies.search('"'), [])
+        self.assertEqual(len(movies.search('inception -"(')), 1)
+
+    def test_search_endpoint(self):
+        """Testing the GET /search endpoint across categories."""
+        movies.add_movie("Dream Team", "Comedy")
+        tv_shows.add_show("Dream On", "Comedy")
+        books.add_book("The Interpretation of Dreams", "Psychology")
+        books.add_review(1, 5, "A dream of a book")
+        response = self.app.get('/search?q=dream')
+        self.assertEqual(response.status_code, 200)
+        categories = sorted(hit["category"] for hit in response.get_json())
+        self.assertEqual(categories, ["books", "movies", "tv_shows"])
+        response = self.app.get('/search?q=dream&category=movies')
+        self.assertEqual([hit["name"] for hit in response.get_json()], ["Dream Team"])
+        self.assertEqual(self.app.get('/search').status_code, 400)
+        self.assertEqual(self.app.get('/search?q=dream&category=music').status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+# Production launcher: runs the API under gunicorn's pre-fork server, each
+# worker serving asgi.py's app on uvicorn's event loop
+# Usage: python server.py [--bind 0.0.0.0:8000] [--workers N] [--threads N]
+#
+# The master process only manages workers; it never imports the app or opens
+# a database, so no SQLite handle is shared across fork(). Schema migrations
+# run once, in a separate process the master starts before it forks any
+# worker (and again on reload), so workers never race to migrate at boot.
+# Each worker imports the app and runs api.warm_up() (connection pool, cache
+# prefill) before it accepts its first connection, so traffic only reaches
+# warm workers; the load balancer can also poll GET /ready. Workers publish
+# change events through a shared event log (events.SharedBroker), so a client
+# of GET /events sees the writes of every worker, not only its own.
+#
+# kill -HUP <master pid> reloads with no downtime: gunicorn starts a fresh set
+# of workers on the new code, which warm up and start accepting, then stops
+# the old ones gracefully, letting their in-flight requests finish.
+#
+# Workers are uvicorn workers rather than gthread ones because of GET /events:
+# under gthread every open event stream held a handler thread until a
+# heartbeat failed to reach a gone client, so a few dozen clients could
+# starve the API. The ASGI app streams events on the loop and runs the other
+# routes on a pool of THREADS threads per worker.
+
+import argparse
+import multiprocessing
+import os
+from gunicorn.app.base import BaseApplication
+from uvicorn_worker import UvicornWorker
+
+DEFAULT_BIND = "0.0.0.0:8000"
+# Threads per worker running route handlers; requests mostly wait on SQLite, not the CPU
+THREADS = 4
+# Seconds a worker may take on one request, and to finish its requests on reload
+TIMEOUT = 30
+
+
+def worker_count(cpus=None):
+    """Returns WEB_CONCURRENCY if set, else gunicorn's (2 x CPUs) + 1 rule."""
+    if os.environ.get("WEB_CONCURRENCY"):
+        return int(os.environ["WEB_CONCURRENCY"])
+    return 2 * (cpus or multiprocessing.cpu_count()) + 1
+
+
+def migrate_databases():
+    """Applies pending schema migrations to every database the workers open."""
+    import books
+    import events
+    import movies
+    import storage
+    import tv_shows
+    for module in (movies, tv_shows, books):
+        module.get_connection()
+    events.SharedBroker(events.shared_database()).get_connection()
+    storage.close_all()
+
+
+def run_migrations(server):
+    """Gunicorn on_starting/on_reload hook: migrates in a fresh interpreter,
+    which loads the current code and leaves no database open in the master."""
+    process = multiprocessing.get_context("spawn").Process(target=migrate_databases)
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"Schema migrations failed (exit code {process.exitcode})")
+
+
+def post_worker_init(worker):
+    """Gunicorn hook: warms up a new worker before it starts accepting."""
+    import api
+    import events
+    events.configure(database=events.shared_database())
+    api.warm_up()
+    worker.log.info("Worker %s warm", worker.pid)
+
+
+class Worker(UvicornWorker):
+    """Uvicorn worker without ASGI lifespan events: post_worker_init has warmed it up already."""
+
+    CONFIG_KWARGS = {**UvicornWorker.CONFIG_KWARGS, "lifespan": "off"}
+
+
+class Server(BaseApplication):
+    """Gunicorn application serving asgi.py's app with the given settings."""
+
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Imported in the worker, after fork, so reloads pick up new code
+        import api
+        import asgi
+        return asgi.AsgiApp(api.app, max_workers=self.cfg.threads)
+
+
+def options(bind=DEFAULT_BIND, workers=None, threads=THREADS):
+    return {
+        "bind": bind,
+        "workers": workers or worker_count(),
+        "worker_class": Worker,
+        "threads": threads,
+        "timeout": TIMEOUT,
+        "graceful_timeout": TIMEOUT,
+        "keepalive": 5,
+        "preload_app": False,
+        "on_starting": run_migrations,
+        "on_reload": run_migrations,
+        "post_worker_init": post_worker_init,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the review API under gunicorn")
+    parser.add_argument("--bind", default=DEFAULT_BIND)
+    parser.add_argument("--workers", type=int, default=None, help="default: WEB_CONCURRENCY or 2 x CPUs + 1")
+    parser.add_argument("--threads", type=int, default=THREADS)
+    args = parser.parse_args()
+    Server(options(args.bind, args.workers, args.threads)).run()
+
+
+if __name__ == "__main__":
+    main()
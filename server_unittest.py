@@ -0,0 +1,117 @@
+# Unit Tests for the production launcher settings and the health endpoints
+
+import contextlib
+import os
+import sqlite3
+import unittest
+from unittest import mock
+from uvicorn_worker import UvicornWorker
+import api
+import asgi
+import books
+import cache
+import events
+import migrations
+import movies
+import server
+import storage
+import tv_shows
+
+TEST_DATABASES = {movies: 'test_server_movies.db', tv_shows: 'test_server_tv_shows.db', books: 'test_server_books.db'}
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        """Pointing every module at a fresh database and starting cold."""
+        self.saved = {module: module.DATABASE for module in TEST_DATABASES}
+        for module, path in TEST_DATABASES.items():
+            module.DATABASE = path
+        self.was_ready = api.ready.is_set()
+        api.ready.clear()
+        cache.configure(maxsize=100, ttl=60)
+        self.client = api.app.test_client()
+
+    def tearDown(self):
+        storage.close_all()
+        for module, path in TEST_DATABASES.items():
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            module.DATABASE = self.saved[module]
+        if self.was_ready:
+            api.ready.set()
+        cache.configure()
+
+    def test_worker_count(self):
+        """Testing that workers follow the CPU count unless WEB_CONCURRENCY is set."""
+        with mock.patch.dict(os.environ, {"WEB_CONCURRENCY": ""}):
+            self.assertEqual(server.worker_count(cpus=4), 9)
+        with mock.patch.dict(os.environ, {"WEB_CONCURRENCY": "3"}):
+            self.assertEqual(server.worker_count(cpus=4), 3)
+            self.assertEqual(server.options()["workers"], 3)
+
+    def test_ready_only_after_warm_up(self):
+        """Testing that /ready turns 200 once the worker is warm, while /health always is."""
+        self.assertEqual(self.client.get("/health").status_code, 200)
+        self.assertEqual(self.client.get("/ready").status_code, 503)
+        api.warm_up()
+        self.assertEqual(self.client.get("/ready").get_json(), {"status": "ready"})
+        for path in TEST_DATABASES.values():
+            self.assertTrue(os.path.exists(path))
+
+    def test_warm_up_fills_the_cache(self):
+        """Testing that the first catalog pages are served from the cache after warm-up."""
+        api.warm_up()
+        hits = cache.stats()["hits"]
+        self.client.get("/movies?limit=100")
+        self.assertEqual(cache.stats()["hits"], hits + 1)
+
+    def test_workers_serve_the_asgi_app(self):
+        """Testing that workers run the ASGI app on uvicorn, with --threads handler threads."""
+        settings = server.options(threads=6)
+        self.assertTrue(issubclass(settings["worker_class"], UvicornWorker))
+        self.assertEqual(settings["worker_class"].CONFIG_KWARGS["lifespan"], "off")
+        application = server.Server(settings).load()
+        self.assertIsInstance(application, asgi.AsgiApp)
+        self.assertEqual(application.max_workers, 6)
+        application.executor.shutdown()
+
+    def test_master_migrates_before_forking(self):
+        """Testing that the master's start and reload hooks migrate every database, workers' included."""
+        settings = server.options()
+        self.assertIs(settings["on_starting"], server.run_migrations)
+        self.assertIs(settings["on_reload"], server.run_migrations)
+        try:
+            with mock.patch.dict(os.environ, {"EVENTS_DATABASE": "test_server_events.db"}):
+                server.migrate_databases()
+            for module, upgrades in ((movies, migrations.MOVIES), (tv_shows, migrations.TV_SHOWS),
+                                     (books, migrations.BOOKS)):
+                with contextlib.closing(sqlite3.connect(module.DATABASE)) as conn:
+                    self.assertEqual(migrations.schema_version(conn), len(upgrades))
+            with contextlib.closing(sqlite3.connect("test_server_events.db")) as conn:
+                self.assertEqual(migrations.schema_version(conn), len(migrations.EVENTS))
+        finally:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists("test_server_events.db" + suffix):
+                    os.remove("test_server_events.db" + suffix)
+
+    def test_workers_share_the_event_log(self):
+        """Testing that a warmed-up worker publishes change events through the shared log."""
+        saved = events.broker
+        events.broker = events.Broker()
+        try:
+            with mock.patch.dict(os.environ, {"EVENTS_DATABASE": "test_server_events.db"}):
+                server.post_worker_init(mock.Mock())
+            self.assertIsInstance(events.broker, events.SharedBroker)
+            movies.add_movie("Heat", "Crime")
+            self.assertEqual(events.broker.subscribe(last_id=0).wait(1)[0].type, "movie_added")
+        finally:
+            events.broker.close()
+            events.broker = saved
+            storage.close_all()
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists("test_server_events.db" + suffix):
+                    os.remove("test_server_events.db" + suffix)
+
+if __name__ == '__main__':
+    unittest.main()
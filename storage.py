@@ -0,0 +1,400 @@
+# Shared SQLite connection layer for the movies, tv_shows and books modules
+# Keeps one open connection per (thread, database file) instead of connecting
+# and closing around every statement, and runs schema bootstrap once per file.
+# Every new connection gets the settings in PROFILE, and writes can optionally
+# be funnelled through a group-commit writer that shares one transaction
+# between many concurrent callers.
+
+import queue
+import re
+import sqlite3
+import threading
+from concurrent.futures import Future
+import profiler
+
+# SQLite settings applied to every new pooled connection, see configure().
+# WAL lets readers run while a write is in progress; with synchronous=normal
+# a WAL commit is not fsynced until the next checkpoint, so a power cut can
+# lose the last few commits but cannot corrupt the file. busy_timeout is how
+# long (ms) a writer waits for the lock before "database is locked".
+PROFILE = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "busy_timeout": 5000,
+    "cache_size": -16384,  # negative means KiB, so 16 MB per connection
+    "mmap_size": 128 * 1024 * 1024,
+}
+
+# SQLite's defaults, which connections used before PROFILE existed
+ROLLBACK_PROFILE = {
+    "journal_mode": "delete",
+    "synchronous": "full",
+    "busy_timeout": 5000,
+    "cache_size": -2000,
+    "mmap_size": 0,
+}
+
+
+def configure(profile=None, **settings):
+    """Replaces PROFILE with `profile` (if given) and updates it with `settings`.
+
+    Only connections opened afterwards are affected; call close_all() to
+    reopen the pooled ones.
+    """
+    unknown = set(settings) - set(PROFILE)
+    if unknown:
+        raise ValueError(f"Unknown storage settings: {', '.join(sorted(unknown))}")
+    if profile is not None:
+        PROFILE.clear()
+        PROFILE.update(profile)
+    PROFILE.update(settings)
+
+
+def apply_profile(connection, profile=None):
+    """Sets the PRAGMAs in `profile` (default PROFILE) on `connection`."""
+    for name, value in (profile or PROFILE).items():
+        connection.execute(f"PRAGMA {name} = {value}")
+
+
+class ConnectionPool:
+    """Thread-aware pool of SQLite connections keyed by database path."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = {}
+        self._bootstrapped = set()
+
+    def get_connection(self, database, bootstrap=None):
+        """Returns the calling thread's connection to `database`.
+
+        `bootstrap` is called with the connection the first time `database`
+        is opened by this process, so schema setup runs once instead of on
+        every call.
+        """
+        # Keyed by the Thread object rather than its ident: idents are reused
+        # by new threads, which could then pick up a connection being pruned.
+        key = (threading.current_thread(), database)
+        connection = self._connections.get(key)
+        if connection is None:
+            # Connections never leave their owning thread; check_same_thread
+            # is only relaxed so that dead threads' connections can be closed.
+            # profiler.Connection only adds work while profiling is enabled.
+            connection = sqlite3.connect(database, check_same_thread=False, factory=profiler.Connection)
+            apply_profile(connection)
+            with self._lock:
+                self._prune()
+                self._connections[key] = connection
+        if bootstrap is not None and database not in self._bootstrapped:
+            with self._lock:
+                if database not in self._bootstrapped:
+                    bootstrap(connection)
+                    connection.commit()
+                    self._bootstrapped.add(database)
+        return connection
+
+    def _prune(self):
+        """Closes connections owned by threads that have exited."""
+        for key in [key for key in self._connections if not key[0].is_alive()]:
+            self._connections.pop(key).close()
+
+    def close_all(self):
+        """Closes every pooled connection and forgets bootstrapped databases."""
+        with self._lock:
+            for connection in self._connections.values():
+                connection.close()
+            self._connections.clear()
+            self._bootstrapped.clear()
+
+
+class GroupCommitWriter:
+    """Background thread that commits queued writes to one database in batches.
+
+    Whatever is queued while a commit is running goes into the next
+    transaction, so N concurrent writers cost about one commit instead of N.
+    submit() returns only after the transaction holding the statement has
+    committed, and a statement that fails (say, a constraint) fails on its
+    own without taking the rest of its batch down with it.
+    """
+
+    def __init__(self, connect, max_batch=256):
+        # Called on the writer thread, so it gets that thread's pooled connection
+        self._connect = connect
+        self.max_batch = max_batch
+        self.batches = 0
+        self.writes = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, sql, params=()):
+        """Runs `sql` in the next batch and returns its lastrowid once committed."""
+        future = Future()
+        self._queue.put((sql, params, future))
+        return future.result()
+
+    def close(self):
+        """Commits what is already queued and stops the thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        connection = self._connect()
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                batch.remove(None)
+                stopping = True
+            if batch:
+                self._commit(connection, batch)
+
+    def _commit(self, connection, batch):
+        results = []
+        try:
+            with connection:
+                for sql, params, future in batch:
+                    try:
+                        results.append((future, connection.execute(sql, params).lastrowid, None))
+                    except sqlite3.Error as error:
+                        if not connection.in_transaction:
+                            # SQLite rolled back the whole transaction, not just the statement
+                            raise
+                        results.append((future, None, error))
+        except sqlite3.Error as error:
+            for _, _, future in batch:
+                future.set_exception(error)
+            return
+        self.batches += 1
+        self.writes += len(batch)
+        for future, rowid, error in results:
+            if error is None:
+                future.set_result(rowid)
+            else:
+                future.set_exception(error)
+
+
+_pool = ConnectionPool()
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_connection(database, bootstrap=None):
+    return _pool.get_connection(database, bootstrap)
+
+
+def start_group_commit(database, connect, max_batch=256):
+    """Sends write() calls for `database` through a GroupCommitWriter.
+
+    `connect` is the owning module's get_connection, e.g.
+    start_group_commit(movies.DATABASE, movies.get_connection).
+    """
+    with _writers_lock:
+        if database not in _writers:
+            _writers[database] = GroupCommitWriter(connect, max_batch)
+        return _writers[database]
+
+
+def stop_group_commit(database=None):
+    """Stops the writer for `database`, or every writer if it is None."""
+    with _writers_lock:
+        databases = list(_writers) if database is None else [database]
+        writers = [_writers.pop(name) for name in databases if name in _writers]
+    for writer in writers:
+        writer.close()
+
+
+def write(database, connect, sql, params=()):
+    """Runs one write statement against `database` and returns its lastrowid.
+
+    Goes through the group-commit writer when one was started for
+    `database`, otherwise commits on its own on `connect()`'s connection.
+    """
+    writer = _writers.get(database)
+    if writer is not None:
+        return writer.submit(sql, params)
+    connection = connect()
+    with connection:
+        return connection.execute(sql, params).lastrowid
+
+
+def close_all():
+    stop_group_commit()
+    _pool.close_all()
+
+
+def iter_nested_reviews(rows, title_key):
+    """Groups joined (id, title, genre, review_id, rating, note) rows by title.
+
+    Rows must be ordered by title id. Titles without reviews come from a
+    LEFT JOIN with NULL review columns and get an empty reviews list. Each
+    title is yielded as soon as its last row is read, so callers can stream
+    from the cursor without holding the whole result.
+    """
+    current = None
+    for row in rows:
+        if current is None or current["id"] != row[0]:
+            if current is not None:
+                yield current
+            current = {"id": row[0], title_key: row[1], "genre": row[2], "reviews": []}
+        if row[3] is not None:
+            current["reviews"].append({"review_id": row[3], "rating": row[4], "note": row[5]})
+    if current is not None:
+        yield current
+
+
+# Ids bound per "IN (...)" query. SQLite builds before 3.32 allow only 999
+# bound variables per statement; 500 leaves room for the other parameters.
+IN_CHUNK = 500
+
+
+def chunked(items, size=None):
+    """Splits a sequence into lists of at most `size` (default IN_CHUNK) items."""
+    size = size or IN_CHUNK
+    return [list(items[start:start + size]) for start in range(0, len(items), size)]
+
+
+def placeholders(count):
+    return ", ".join("?" * count)
+
+
+# Orders for catalog_page; "rating" is by average rating, titles without
+# rated reviews last
+CATALOG_SORTS = ("id", "title", "genre", "rating")
+
+
+def catalog_page(connection, table, title_column, item_column, sort="id", descending=False, limit=20,
+                 after=None, scope=()):
+    """Returns one page of (id, title, genre, review count, average rating) rows
+    from `table` and its rating_stats, and the `after` of the next page (or None).
+
+    Pages are keyset paged: `after` is the (sort value, id) of the previous
+    page's last row, so every page is an index range scan however deep it
+    is. Ties are broken by id in the direction the sort's index runs.
+    `scope` holds (column, value) pairs both tables are filtered on, such
+    as the unified database's category.
+    """
+    scope_where = [f"t.{column} = ?" for column, _ in scope]
+    scope_params = [value for _, value in scope]
+    join = " AND ".join([f"s.{item_column} = t.id"] + [f"s.{column} = t.{column}" for column, _ in scope])
+    if sort == "rating":
+        rows = _rated_page(connection, table, title_column, item_column, join, scope, descending, limit, after)
+    else:
+        key = {"id": "t.id", "title": f"t.{title_column}", "genre": "t.genre"}[sort]
+        where, params = list(scope_where), list(scope_params)
+        direction, compare = ("DESC", "<") if descending else ("ASC", ">")
+        if after is not None:
+            if sort == "id":
+                where.append(f"t.id {compare} ?")
+                params.append(after[1])
+            else:
+                where.append(f"({key}, t.id) {compare} (?, ?)")
+                params.extend(after)
+        order = f"t.id {direction}" if sort == "id" else f"{key} {direction}, t.id {direction}"
+        rows = connection.execute(f'''
+            SELECT t.id, t.{title_column}, t.genre, s.review_count, s.rating_avg
+            FROM {table} t
+            LEFT JOIN rating_stats s ON {join}
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY {order}
+            LIMIT ?
+        ''', params + [limit]).fetchall()
+    if len(rows) < limit:
+        return rows, None
+    last = rows[-1]
+    return rows, ({"id": last[0], "title": last[1], "genre": last[2], "rating": last[4]}[sort], last[0])
+
+
+def _rated_page(connection, table, title_column, item_column, join, scope, descending, limit, after):
+    # Rated titles come from the rating_stats index (rating_avg DESC, id), walked
+    # forwards for the best first and backwards for the worst first; then the
+    # unrated titles by id, which is where an `after` without a rating points
+    rows = []
+    scope_params = [value for _, value in scope]
+    if after is None or after[0] is not None:
+        where = [f"s.{column} = ?" for column, _ in scope]
+        params = list(scope_params)
+        if after is not None:
+            lower, compare, id_compare = ("<=", "<", ">") if descending else (">=", ">", "<")
+            where.append(f"s.rating_avg {lower} ? AND (s.rating_avg {compare} ? OR s.{item_column} {id_compare} ?)")
+            params += [after[0], after[0], after[1]]
+        order = f"s.rating_avg DESC, s.{item_column}" if descending else f"s.rating_avg, s.{item_column} DESC"
+        rows = connection.execute(f'''
+            SELECT t.id, t.{title_column}, t.genre, s.review_count, s.rating_avg
+            FROM rating_stats s
+            JOIN {table} t ON {join}
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY {order}
+            LIMIT ?
+        ''', params + [limit]).fetchall()
+        after = None
+    if len(rows) < limit:
+        where = ["t.id > ?"] + [f"t.{column} = ?" for column, _ in scope]
+        rows += connection.execute(f'''
+            SELECT t.id, t.{title_column}, t.genre, NULL, NULL
+            FROM {table} t
+            WHERE {" AND ".join(where)} AND NOT EXISTS (SELECT 1 FROM rating_stats s WHERE {join})
+            ORDER BY t.id
+            LIMIT ?
+        ''', [after[1] if after else 0] + scope_params + [limit - len(rows)]).fetchall()
+    return rows
+
+
+def changes_json(connection, sources, since, limit, scope=()):
+    """Returns up to `limit` (version, JSON text) rows, oldest first, for the
+    changes after version `since` (see migrations.row_versions): the current
+    values of each row inserted or updated since, and a tombstone for each row
+    deleted since.
+
+    `sources` maps each table to its change type and its {JSON key: column}
+    fields. Every part of the query is a range scan of a version index, so it
+    costs as much as there are changes, not as there are rows.
+    """
+    scope_where = "".join(f" AND {column} = ?" for column, _ in scope)
+    scope_params = [value for _, value in scope]
+    selects, params = [], []
+    for table, (change_type, fields) in sources.items():
+        data = ", ".join(f"'{key}', {column}" for key, column in sorted(fields.items()))
+        selects.append(f'''
+            SELECT version, json_object('data', json_object({data}), 'id', id, 'op', 'upsert',
+                                        'type', '{change_type}', 'version', version)
+            FROM {table} WHERE version > ?{scope_where}''')
+        params += [since] + scope_params
+    types = " ".join(f"WHEN '{table}' THEN '{change_type}'" for table, (change_type, _) in sources.items())
+    selects.append(f'''
+            SELECT version, json_object('data', NULL, 'id', id, 'op', 'delete',
+                                        'type', CASE table_name {types} END, 'version', version)
+            FROM tombstones WHERE version > ?{scope_where}''')
+    params += [since] + scope_params
+    return connection.execute(" UNION ALL ".join(selects) + " ORDER BY version LIMIT ?",
+                              params + [limit]).fetchall()
+
+
+def data_version(connection, names=None):
+    """Returns a token that changes with every write to a table counted in
+    table_versions (see migrations.change_counters), or only to the counters
+    in `names` plus the epoch if given."""
+    if names is None:
+        rows = connection.execute("SELECT version FROM table_versions ORDER BY name")
+    else:
+        names = ("epoch",) + tuple(names)
+        rows = connection.execute(
+            f"SELECT version FROM table_versions WHERE name IN ({', '.join('?' * len(names))}) ORDER BY name",
+            names)
+    return "-".join(f"{version:x}" for version, in rows)
+
+
+def fts_query(text):
+    """Turns free text into an FTS5 query matching every word, or None if it has no words.
+
+    Each word is quoted so punctuation and FTS5 operators in user input are
+    matched literally instead of being parsed as query syntax.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words)
@@ -0,0 +1,121 @@
+# Unit Tests for the shared SQLite connection pool
+
+import os
+import sqlite3
+import threading
+import unittest
+import storage
+
+TEST_DATABASE = 'test_storage.db'
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        """Using a fresh pool for each test."""
+        self.pool = storage.ConnectionPool()
+
+    def tearDown(self):
+        """Closing pooled connections and removing the test database."""
+        self.pool.close_all()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DATABASE + suffix):
+                os.remove(TEST_DATABASE + suffix)
+
+    def test_same_thread_reuses_connection(self):
+        """Testing that repeated calls on one thread share a connection."""
+        first = self.pool.get_connection(TEST_DATABASE)
+        second = self.pool.get_connection(TEST_DATABASE)
+        self.assertIs(first, second)
+
+    def test_threads_get_separate_connections(self):
+        """Testing that each thread receives its own connection."""
+        main = self.pool.get_connection(TEST_DATABASE)
+        seen = []
+        worker = threading.Thread(target=lambda: seen.append(self.pool.get_connection(TEST_DATABASE)))
+        worker.start()
+        worker.join()
+        self.assertIsNot(main, seen[0])
+
+    def test_bootstrap_runs_once(self):
+        """Testing that schema bootstrap runs once per database."""
+        calls = []
+        def bootstrap(connection):
+            calls.append(connection)
+            connection.execute('CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY)')
+        for _ in range(3):
+            self.pool.get_connection(TEST_DATABASE, bootstrap)
+        worker = threading.Thread(target=lambda: self.pool.get_connection(TEST_DATABASE, bootstrap))
+        worker.start()
+        worker.join()
+        self.assertEqual(len(calls), 1)
+        tables = self.pool.get_connection(TEST_DATABASE).execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'items'").fetchall()
+        self.assertEqual(len(tables), 1)
+
+    def test_dead_thread_connections_are_pruned(self):
+        """Testing that connections of exited threads are closed on the next checkout."""
+        worker = threading.Thread(target=lambda: self.pool.get_connection(TEST_DATABASE))
+        worker.start()
+        worker.join()
+        other = threading.Thread(target=lambda: self.pool.get_connection(TEST_DATABASE))
+        other.start()
+        other.join()
+        self.assertLessEqual(len(self.pool._connections), 1)
+
+    def test_profile_is_applied_to_new_connections(self):
+        """Testing that pooled connections run in WAL mode with the configured settings."""
+        connection = self.pool.get_connection(TEST_DATABASE)
+        self.assertEqual(connection.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(connection.execute("PRAGMA synchronous").fetchone()[0], 1)
+        self.assertEqual(connection.execute("PRAGMA busy_timeout").fetchone()[0], 5000)
+
+    def test_configure_rejects_unknown_settings(self):
+        """Testing that a misspelt setting is an error rather than ignored."""
+        with self.assertRaises(ValueError):
+            storage.configure(busy_timout=100)
+
+class TestGroupCommit(unittest.TestCase):
+
+    def setUp(self):
+        """Starting a writer on a fresh database with a NOT NULL column."""
+        def connect():
+            return storage.get_connection(TEST_DATABASE, lambda connection: connection.execute(
+                'CREATE TABLE items (id INTEGER PRIMARY KEY, note TEXT NOT NULL)'))
+        self.connect = connect
+        self.writer = storage.start_group_commit(TEST_DATABASE, connect)
+
+    def tearDown(self):
+        storage.close_all()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DATABASE + suffix):
+                os.remove(TEST_DATABASE + suffix)
+
+    def test_concurrent_writes_share_commits(self):
+        """Testing that concurrent writes are all committed, in fewer transactions."""
+        ids = []
+        def insert(n):
+            for i in range(50):
+                ids.append(storage.write(TEST_DATABASE, self.connect, 'INSERT INTO items (note) VALUES (?)', (f"{n}-{i}",)))
+        threads = [threading.Thread(target=insert, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(ids), list(range(1, 401)))
+        self.assertEqual(self.connect().execute('SELECT COUNT(*) FROM items').fetchone()[0], 400)
+        self.assertEqual(self.writer.writes, 400)
+        self.assertLess(self.writer.batches, 400)
+
+    def test_failed_statement_does_not_fail_its_batch(self):
+        """Testing that a constraint error is raised to its caller only."""
+        with self.assertRaises(sqlite3.IntegrityError):
+            storage.write(TEST_DATABASE, self.connect, 'INSERT INTO items (note) VALUES (?)', (None,))
+        self.assertEqual(storage.write(TEST_DATABASE, self.connect, 'INSERT INTO items (note) VALUES (?)', ("ok",)), 1)
+
+    def test_stopped_writer_falls_back_to_direct_commits(self):
+        """Testing that write() commits on its own once the writer is stopped."""
+        storage.stop_group_commit(TEST_DATABASE)
+        self.assertEqual(storage.write(TEST_DATABASE, self.connect, 'INSERT INTO items (note) VALUES (?)', ("ok",)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+# Materialized home page: one document with every category's counts, genres
+# and best-rated titles, kept in memory and served by GET /home
+# The document is rebuilt in a background thread, never while a request waits
+# for it: soon after a write through the domain modules (cache.py notifies us
+# on every invalidation), and otherwise every REFRESH_INTERVAL seconds, which
+# also catches writes made behind the app's back. A rebuild only happens when
+# a category's data_version() moved, so an idle catalog costs three tiny
+# queries per interval. If the thread falls behind and the document has not
+# been checked for MAX_STALENESS seconds, the next request checks it inline.
+
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import cache
+
+# Seconds between version checks when nothing is written
+REFRESH_INTERVAL = 5.0
+# A document older than this (seconds since its versions were last checked) is never served
+MAX_STALENESS = 30.0
+# Seconds to wait after a write notification, so that a burst of writes costs one rebuild
+DEBOUNCE = 0.5
+# Best-rated titles per category
+TOP_N = 5
+
+log = logging.getLogger("summary")
+
+
+class Summary:
+    """The home document for `categories` ({name: module or unified.Category})."""
+
+    def __init__(self, categories, top_n=TOP_N, interval=REFRESH_INTERVAL, max_staleness=MAX_STALENESS,
+                 debounce=DEBOUNCE, clock=time.monotonic):
+        self.categories = categories
+        self.top_n = top_n
+        self.interval = interval
+        self.max_staleness = max_staleness
+        self.debounce = debounce
+        self.clock = clock
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._changed = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._versions = None
+        # (JSON body, ETag, clock() when its versions were last checked), replaced
+        # whole so a reader never pairs one build's body with another's ETag
+        self._state = None
+
+    def versions(self):
+        # The path is part of the version, as two databases can share a counter value
+        return tuple((name, getattr(module, "DATABASE", None), module.data_version())
+                     for name, module in self.categories.items())
+
+    def refresh(self, force=False):
+        """Rebuilds the document if any category was written since the last build;
+        returns whether it did."""
+        with self._lock:
+            versions = self.versions()
+            if versions == self._versions and not force:
+                body, etag, _ = self._state
+                self._state = (body, etag, self.clock())
+                return False
+            document = {name: module.view_summary(self.top_n) for name, module in self.categories.items()}
+            # Read again after the build: a write in between leaves the old versions
+            # in place, so the next check rebuilds
+            if self.versions() != versions:
+                versions = None
+            # The ETag covers the content only, so a rebuild that changed nothing
+            # visible still answers If-None-Match with 304
+            etag = hashlib.sha1(json.dumps(document, sort_keys=True).encode()).hexdigest()[:20]
+            document["generated_at"] = time.time()
+            document["max_staleness"] = self.max_staleness
+            body = json.dumps(document, sort_keys=True, separators=(",", ":"))
+            self._versions = versions
+            self._state = (body, etag, self.clock())
+            self.refreshes += 1
+            return True
+
+    def get(self):
+        """Returns (JSON body, ETag, age in seconds), checking inline only if the
+        document is missing or older than max_staleness."""
+        state = self._state
+        if state is None or self.clock() - state[2] > self.max_staleness:
+            self.refresh()
+            state = self._state
+        body, etag, checked = state
+        return body, etag, self.clock() - checked
+
+    def notify(self, namespace):
+        """cache.subscribe() listener: schedules a refresh after a write to a category."""
+        if namespace in self.categories:
+            self._changed.set()
+
+    def start(self):
+        """Builds the document and starts the refresh thread, unless it is running."""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self.refresh()
+            self._stopping.clear()
+            cache.subscribe(self.notify)
+            self._thread = threading.Thread(target=self._run, name="summary-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._start_lock:
+            cache.unsubscribe(self.notify)
+            self._stopping.set()
+            self._changed.set()
+            if self._thread is not None:
+                self._thread.join()
+                self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            if self._changed.wait(self.interval):
+                self._stopping.wait(self.debounce)
+                self._changed.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.refresh()
+            except Exception:
+                log.exception("home summary refresh failed")
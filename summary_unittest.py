@@ -0,0 +1,155 @@
+# Unit Tests for the materialized home page summary and GET /home
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unittest
+import json
+import api
+import books
+import cache
+import movies
+import storage
+import summary
+import tv_shows
+
+TEST_DATABASES = {movies: 'test_summary_movies.db', tv_shows: 'test_summary_tv_shows.db',
+                  books: 'test_summary_books.db'}
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestSummary(unittest.TestCase):
+
+    def setUp(self):
+        """Adding three titles per category; the second is the best rated."""
+        self.saved = {module: module.DATABASE for module in TEST_DATABASES}
+        for module, path in TEST_DATABASES.items():
+            module.DATABASE = path
+        cache.configure()
+        for add_title, module in ((movies.add_movie, movies), (tv_shows.add_show, tv_shows), (books.add_book, books)):
+            add_title("First", "Drama")
+            add_title("Second", "Comedy")
+            add_title("Third", "Drama")
+            module.add_review(1, 3, "Fine")
+            module.add_review(2, 5, "Great")
+        self.categories = {"movies": movies, "tv_shows": tv_shows, "books": books}
+
+    def tearDown(self):
+        api.home.stop()
+        storage.close_all()
+        for module, path in TEST_DATABASES.items():
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            module.DATABASE = self.saved[module]
+        cache.configure()
+
+    def test_document(self):
+        """Testing the counts, genres and top titles of each category."""
+        home = summary.Summary(self.categories, top_n=1)
+        body, etag, age = home.get()
+        document = json.loads(body)
+        self.assertEqual(document["movies"], {
+            "titles": 3, "reviews": 2,
+            "genres": [{"genre": "Comedy", "titles": 1}, {"genre": "Drama", "titles": 2}],
+            "top_rated": [{"id": 2, "name": "Second", "genre": "Comedy", "average_rating": 5.0, "review_count": 1}]})
+        self.assertEqual(document["books"]["top_rated"][0]["title"], "Second")
+        self.assertEqual(document["max_staleness"], summary.MAX_STALENESS)
+
+    def test_rebuilds_only_after_writes(self):
+        """Testing that a refresh without writes keeps the document and a write rebuilds it."""
+        home = summary.Summary(self.categories)
+        home.refresh()
+        body, etag, _ = home.get()
+        self.assertFalse(home.refresh())
+        movies.add_movie("Fourth", "Horror")
+        self.assertTrue(home.refresh())
+        self.assertNotEqual(home.get()[1], etag)
+        self.assertEqual(json.loads(home.get()[0])["movies"]["titles"], 4)
+
+    def test_write_notification_refreshes(self):
+        """Testing that the background thread rebuilds soon after a write, well before the interval."""
+        home = summary.Summary(self.categories, interval=60, debounce=0.01)
+        home.start()
+        try:
+            refreshes = home.refreshes
+            books.add_book("Fourth", "Horror")
+            deadline = time.time() + 5
+            while home.refreshes == refreshes and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(json.loads(home.get()[0])["books"]["titles"], 4)
+        finally:
+            home.stop()
+
+    def test_staleness_bound(self):
+        """Testing that a write the app never saw is served once the document is past max_staleness."""
+        clock = FakeClock()
+        home = summary.Summary(self.categories, max_staleness=30, clock=clock)
+        home.get()
+        connection = sqlite3.connect(tv_shows.DATABASE)
+        with connection:
+            connection.execute("INSERT INTO tv_shows (title, genre) VALUES ('Behind', 'Drama')")
+        connection.close()
+        clock.now = 29
+        self.assertEqual(json.loads(home.get()[0])["tv_shows"]["titles"], 3)
+        clock.now = 31
+        body, _, age = home.get()
+        self.assertEqual(json.loads(body)["tv_shows"]["titles"], 4)
+        self.assertEqual(age, 0)
+
+    def test_body_and_etag_come_from_one_build(self):
+        """Testing that get() never pairs a body with another build's ETag while rebuilds run."""
+        home = summary.Summary(self.categories)
+        home.refresh()
+        mismatches, stop = [], threading.Event()
+
+        def read():
+            while not stop.is_set():
+                body, etag, _ = home.get()
+                document = json.loads(body)
+                del document["generated_at"], document["max_staleness"]
+                if hashlib.sha1(json.dumps(document, sort_keys=True).encode()).hexdigest()[:20] != etag:
+                    mismatches.append(etag)
+        reader = threading.Thread(target=read)
+        reader.start()
+        try:
+            for number in range(30):
+                movies.add_movie(f"Extra {number}", "Drama")
+                home.refresh()
+        finally:
+            stop.set()
+            reader.join()
+        self.assertEqual(mismatches, [])
+
+    def test_start_skips_the_lock_once_running(self):
+        """Testing that start() on a running summary returns without taking its start lock."""
+        home = summary.Summary(self.categories, interval=60)
+        home.start()
+        try:
+            with home._start_lock:
+                starter = threading.Thread(target=home.start)
+                starter.start()
+                starter.join(1)
+                self.assertFalse(starter.is_alive())
+        finally:
+            home.stop()
+
+    def test_endpoint(self):
+        """Testing GET /home and its ETag revalidation."""
+        client = api.app.test_client()
+        response = client.get("/home")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["tv_shows"]["titles"], 3)
+        self.assertIn("Age", response.headers)
+        self.assertEqual(client.get("/home", headers={"If-None-Match": response.headers["ETag"]}).status_code, 304)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,74 +1,151 @@
 #Author: Mastewal
 
 
-import sqlite3
+import cache
+import events
+import migrations
+import storage
 
 DATABASE = 'tv_shows_reviews.db'
 
+def get_connection():
+    """Returns this thread's pooled connection to the TV shows database."""
+    return storage.get_connection(DATABASE, migrations.upgrade_tv_shows)
+
+def data_version():
+    """Returns a token that changes whenever a TV show or review is written, after
+    dropping cached reads made before a write from outside this process."""
+    return cache.revalidate("tv_shows")
+
+cache.track_version("tv_shows", lambda: storage.data_version(get_connection()))
+
+# Cache tags: "list" covers the listing pages, "item:<id>" one title's reviews
+# and rating stats, "genre:<genre>" the genre queries, "ratings"
+# the top-rated queries and "search" full-text results.
+def _review_tags(tv_show_id, *args, **kwargs):
+    """Tags a review write affects: the title's own entries plus every listing."""
+    return ["list", f"item:{tv_show_id}", "ratings", "search"]
+
+@cache.invalidates("tv_shows", lambda title, genre: ["list", f"genre:{genre}", "search"])
 def add_show(title, genre):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO tv_shows (title, genre) VALUES (?, ?)', (title, genre))
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:
+        tv_show_id = conn.execute('INSERT INTO tv_shows (title, genre) VALUES (?, ?)', (title, genre)).lastrowid
+    events.publish("tv_shows", "show_added", {"tv_show_id": tv_show_id, "title": title, "genre": genre})
     return {"message": f"TV Show '{title}' added successfully."}
 
+@cache.invalidates("tv_shows", _review_tags)
 def add_review(tv_show_id, rating, note):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO reviews (tv_show_id, rating, note) VALUES (?, ?, ?)', (tv_show_id, rating, note))
-    conn.commit()
-    conn.close()
+    review_id = storage.write(DATABASE, get_connection,
+                              'INSERT INTO reviews (tv_show_id, rating, note) VALUES (?, ?, ?)',
+                              (tv_show_id, rating, note))
+    events.publish("tv_shows", "review_added",
+                   {"tv_show_id": tv_show_id, "review_id": review_id, "rating": rating, "note": note})
     return {"message": f"Review added to TV Show ID {tv_show_id}."}
 
+@cache.invalidates("tv_shows", _review_tags)
 def edit_review(tv_show_id, review_id, rating=None, note=None):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    if rating:
-        cursor.execute('UPDATE reviews SET rating = ? WHERE id = ? AND tv_show_id = ?', (rating, review_id, tv_show_id))
-    if note:
-        cursor.execute('UPDATE reviews SET note = ? WHERE id = ? AND tv_show_id = ?', (note, review_id, tv_show_id))
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    updated = 0
+    with conn:
+        if rating:
+            updated += conn.execute('UPDATE reviews SET rating = ? WHERE id = ? AND tv_show_id = ?',
+                                    (rating, review_id, tv_show_id)).rowcount
+        if note:
+            updated += conn.execute('UPDATE reviews SET note = ? WHERE id = ? AND tv_show_id = ?',
+                                    (note, review_id, tv_show_id)).rowcount
+    if updated:
+        events.publish("tv_shows", "review_edited",
+                       {"tv_show_id": tv_show_id, "review_id": review_id, "rating": rating, "note": note})
     return {"message": f"Review ID {review_id} for TV Show ID {tv_show_id} updated."}
 
+@cache.invalidates("tv_shows", _review_tags)
 def delete_review(tv_show_id, review_id):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM reviews WHERE id = ? AND tv_show_id = ?', (review_id, tv_show_id))
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:
+        deleted = conn.execute('DELETE FROM reviews WHERE id = ? AND tv_show_id = ?',
+                               (review_id, tv_show_id)).rowcount
+    if deleted:
+        events.publish("tv_shows", "review_deleted", {"tv_show_id": tv_show_id, "review_id": review_id})
     return {"message": f"Review ID {review_id} deleted from TV Show ID {tv_show_id}."}
 
+@cache.invalidates("tv_shows", lambda tv_show_id: _review_tags(tv_show_id) + ["genre"])
 def delete_show(tv_show_id):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM reviews WHERE tv_show_id = ?', (tv_show_id,))
-    cursor.execute('DELETE FROM tv_shows WHERE id = ?', (tv_show_id,))
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:
+        reviews = conn.execute('DELETE FROM reviews WHERE tv_show_id = ?', (tv_show_id,)).rowcount
+        deleted = conn.execute('DELETE FROM tv_shows WHERE id = ?', (tv_show_id,)).rowcount
+    if deleted:
+        events.publish("tv_shows", "show_deleted", {"tv_show_id": tv_show_id, "reviews_deleted": reviews})
     return {"message": f"TV Show ID {tv_show_id} and its reviews have been deleted."}
 
+@cache.cached("tv_shows", lambda: ["list"])
 def view_reviews():
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM tv_shows')
-    tv_shows = cursor.fetchall()
-    result = []
-    for tv_show in tv_shows:
-        cursor.execute('SELECT * FROM reviews WHERE tv_show_id = ?', (tv_show[0],))
-        reviews = cursor.fetchall()
-        result.append({
-            "id": tv_show[0],
-            "title": tv_show[1],
-            "genre": tv_show[2],
-            "reviews": [{"review_id": r[0], "rating": r[2], "note": r[3]} for r in reviews]
-        })
-    conn.close()
-    return result
+    return list(iter_reviews())
+
+@cache.cached("tv_shows", lambda limit, after=0: ["list"])
+def view_reviews_page(limit, after=0):
+    """Returns up to `limit` TV shows with id greater than `after`, with their reviews."""
+    return list(iter_reviews(after, limit))
+
+def iter_reviews(after=0, limit=-1):
+    """Yields TV shows with their reviews one at a time in id order (limit -1 means no limit)."""
+    conn = get_connection()
+    cursor = conn.execute('''
+        SELECT t.id, t.title, t.genre, r.id, r.rating, r.note
+        FROM tv_shows t
+        LEFT JOIN reviews r ON r.tv_show_id = t.id
+        WHERE t.id > ?
+          AND t.id <= (SELECT MAX(id) FROM (SELECT id FROM tv_shows WHERE id > ? ORDER BY id LIMIT ?))
+        ORDER BY t.id, r.id
+    ''', (after, after, limit))
+    return storage.iter_nested_reviews(cursor, "title")
 
+@cache.cached("tv_shows", lambda limit=-1, after=0: ["list"])
+def view_reviews_json(limit=-1, after=0):
+    """Returns view_reviews_page's TV shows as (id, JSON text) rows; see iter_reviews_json."""
+    return list(iter_reviews_json(after, limit))
+
+def iter_reviews_json(after=0, limit=-1):
+    """Yields (id, JSON text) for TV shows with their reviews in id order.
+
+    SQLite builds the JSON, with the same content as iter_reviews' dicts and
+    sorted keys, so list responses skip building and encoding dicts in Python.
+    """
+    conn = get_connection()
+    return conn.execute('''
+        SELECT t.id, json_object(
+            'genre', t.genre, 'id', t.id,
+            'reviews', json((
+                SELECT json_group_array(json_object('note', r.note, 'rating', r.rating, 'review_id', r.id))
+                FROM (SELECT id, rating, note FROM reviews WHERE tv_show_id = t.id ORDER BY id) r)),
+            'title', t.title)
+        FROM tv_shows t
+        WHERE t.id > ?
+        ORDER BY t.id
+        LIMIT ?
+    ''', (after, limit))
+
+@cache.cached("tv_shows", lambda sort="id", descending=False, limit=20, after=None: ["list"])
+def view_catalog_page(sort="id", descending=False, limit=20, after=None):
+    """Returns a page of TV shows with their review count and average rating, sorted
+    by `sort` (one of storage.CATALOG_SORTS), and the `after` of the next page."""
+    rows, next_after = storage.catalog_page(get_connection(), "tv_shows", "title", "tv_show_id",
+                                            sort, descending, limit, after)
+    return [{"id": row[0], "title": row[1], "genre": row[2], "review_count": row[3] or 0,
+             "average_rating": row[4]} for row in rows], next_after
+
+def view_changes_json(since, limit):
+    """Returns up to `limit` (version, JSON text) rows for the TV shows and reviews
+    inserted, updated or deleted after version `since`, oldest first."""
+    return storage.changes_json(get_connection(), {
+        "tv_shows": ("show", {"title": "title", "genre": "genre"}),
+        "reviews": ("review", {"tv_show_id": "tv_show_id", "rating": "rating", "note": "note"}),
+    }, since, limit)
+
+@cache.cached("tv_shows", lambda tv_show_id: [f"item:{tv_show_id}"])
 def search_reviews(tv_show_id):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM tv_shows WHERE id = ?', (tv_show_id,))
     tv_show = cursor.fetchone()
@@ -76,7 +153,6 @@ def search_reviews(tv_show_id):
         return {"error": "TV Show not found."}
     cursor.execute('SELECT * FROM reviews WHERE tv_show_id = ?', (tv_show_id,))
     reviews = cursor.fetchall()
-    conn.close()
     return {
         "id": tv_show[0],
         "title": tv_show[1],
@@ -84,10 +160,96 @@ def search_reviews(tv_show_id):
         "reviews": [{"review_id": r[0], "rating": r[2], "note": r[3]} for r in reviews]
     }
 
+@cache.cached_many("tv_shows", lambda tv_show_id: [f"item:{tv_show_id}"], search_reviews)
+def search_reviews_many(tv_show_ids):
+    """search_reviews() for many TV shows at once, in the order given: one query
+    per storage.IN_CHUNK ids instead of two per show."""
+    conn = get_connection()
+    found = {}
+    for chunk in storage.chunked(tv_show_ids):
+        cursor = conn.execute(f'''
+            SELECT t.id, t.title, t.genre, r.id, r.rating, r.note
+            FROM tv_shows t
+            LEFT JOIN reviews r ON r.tv_show_id = t.id
+            WHERE t.id IN ({storage.placeholders(len(chunk))})
+            ORDER BY t.id, r.id
+        ''', chunk)
+        found.update((item["id"], item) for item in storage.iter_nested_reviews(cursor, "title"))
+    return [found.get(tv_show_id, {"error": "TV Show not found."}) for tv_show_id in tv_show_ids]
+
+@cache.cached("tv_shows", lambda text, limit=20: ["search"])
+def search(text, limit=20):
+    """Full-text search over TV show titles, genres and review notes, best bm25 match first."""
+    query = storage.fts_query(text)
+    if query is None:
+        return []
+    conn = get_connection()
+    cursor = conn.execute('''
+        SELECT t.id, t.title, t.genre, MIN(hits.score) AS score
+        FROM (
+            SELECT rowid AS tv_show_id, bm25(tv_shows_fts) AS score
+            FROM tv_shows_fts WHERE tv_shows_fts MATCH ?
+            UNION ALL
+            SELECT r.tv_show_id, bm25(reviews_fts)
+            FROM reviews_fts JOIN reviews r ON r.id = reviews_fts.rowid
+            WHERE reviews_fts MATCH ?
+        ) hits
+        JOIN tv_shows t ON t.id = hits.tv_show_id
+        GROUP BY t.id
+        ORDER BY score
+        LIMIT ?
+    ''', (query, query, limit))
+    return [{"id": row[0], "title": row[1], "genre": row[2], "score": row[3]} for row in cursor]
+
+@cache.cached("tv_shows", lambda genre: ["genre", f"genre:{genre}"])
 def search_by_genre(genre):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM tv_shows WHERE genre = ?', (genre,))
     tv_shows = cursor.fetchall()
-    conn.close()
     return [{"id": tv_show[0], "title": tv_show[1], "genre": tv_show[2]} for tv_show in tv_shows]
+
+@cache.cached("tv_shows", lambda limit=3: ["ratings"])
+def view_top_rated(limit=3):
+    """Returns the TV shows with the highest average rating, read from rating_stats."""
+    conn = get_connection()
+    cursor = conn.execute(
+        'SELECT tv_show_id, rating_avg, review_count FROM rating_stats ORDER BY rating_avg DESC, tv_show_id LIMIT ?',
+        (limit,))
+    return [{"tv_show_id": row[0], "average_rating": row[1], "review_count": row[2]} for row in cursor]
+
+@cache.cached("tv_shows", lambda tv_show_id: [f"item:{tv_show_id}"])
+def view_rating_stats(tv_show_id):
+    """Returns review count, rating sum, min, max and average for one TV show."""
+    conn = get_connection()
+    row = conn.execute(
+        'SELECT review_count, rating_sum, rating_min, rating_max, rating_avg FROM rating_stats WHERE tv_show_id = ?',
+        (tv_show_id,)).fetchone()
+    if not row:
+        return {"tv_show_id": tv_show_id, "review_count": 0, "rating_sum": 0,
+                "rating_min": None, "rating_max": None, "average_rating": None}
+    return {"tv_show_id": tv_show_id, "review_count": row[0], "rating_sum": row[1],
+            "rating_min": row[2], "rating_max": row[3], "average_rating": row[4]}
+
+
+def view_summary(limit=5):
+    """Returns TV show and review counts, genres with their TV show counts and the
+    `limit` best-rated TV shows, as summary.py puts them on the home page."""
+    conn = get_connection()
+    titles, reviews = conn.execute(
+        'SELECT (SELECT COUNT(*) FROM tv_shows), (SELECT COUNT(*) FROM reviews)').fetchone()
+    genres = conn.execute('SELECT genre, COUNT(*) FROM tv_shows GROUP BY genre ORDER BY genre')
+    top = conn.execute('''
+        SELECT t.id, t.title, t.genre, s.rating_avg, s.review_count
+        FROM rating_stats s
+        JOIN tv_shows t ON t.id = s.tv_show_id
+        ORDER BY s.rating_avg DESC, s.tv_show_id
+        LIMIT ?
+    ''', (limit,))
+    return {
+        "titles": titles,
+        "reviews": reviews,
+        "genres": [{"genre": row[0], "titles": row[1]} for row in genres],
+        "top_rated": [{"id": row[0], "title": row[1], "genre": row[2], "average_rating": row[3],
+                       "review_count": row[4]} for row in top],
+    }
@@ -0,0 +1,477 @@
+# Optional single-database store for movies, TV shows and books
+# All titles live in one `items` table and all reviews in one `reviews` table,
+# each with a category column (schema in migrations.UNIFIED). Category objects
+# offer the same functions, with the same return values, as the movies,
+# tv_shows and books modules, so api.py can serve from either layout; on top
+# of that, queries across categories are a single indexed query instead of
+# three connections and a merge in Python.
+# Usage: python unified.py [--target reviews.db] copies the three existing
+# databases into the unified one (see migrate_files).
+
+import argparse
+import os
+import sqlite3
+import books as books_module
+import events
+import migrations
+import movies as movies_module
+import storage
+import tv_shows as tv_shows_module
+
+DATABASE = "reviews.db"
+
+# category -> how the per-category module names things: the noun in
+# messages, the title key in results, the item key in rating results, and
+# the module function names that map onto Category methods
+CATEGORIES = {
+    "movies": {
+        "noun": "movie", "label": "Movie", "title_key": "name", "item_key": "movie_id",
+        "aliases": {"add_movie": "add_title", "delete_movie": "delete_title",
+                    "view_movie_genre": "view_genres", "view_top_movies": "view_top_reviews"},
+    },
+    "tv_shows": {
+        "noun": "TV Show", "label": "TV Show", "title_key": "title", "item_key": "tv_show_id",
+        "aliases": {"add_show": "add_title", "delete_show": "delete_title"},
+    },
+    "books": {
+        "noun": "book", "label": "Book", "title_key": "title", "item_key": "book_id",
+        "aliases": {"add_book": "add_title", "delete_book": "delete_title",
+                    "view_books": "view_counts", "view_books_page": "view_counts_page",
+                    "iter_books": "iter_counts", "view_books_with_reviews": "view_reviews",
+                    "view_books_json": "view_counts_json", "iter_books_json": "iter_counts_json",
+                    "view_book_genres": "view_genres", "view_top_books": "view_top_averages"},
+        # Books match genres by substring and return new ids from add calls
+        "genre_substring": True, "returns_ids": True,
+    },
+}
+
+# category -> source module, catalog table, title column and review item column
+SOURCES = {
+    "movies": (movies_module, "movies", "name", "movie_id"),
+    "tv_shows": (tv_shows_module, "tv_shows", "title", "tv_show_id"),
+    "books": (books_module, "books", "title", "book_id"),
+}
+
+
+def get_connection():
+    """Returns this thread's pooled connection to the unified database."""
+    return storage.get_connection(DATABASE, migrations.upgrade_unified)
+
+
+class Category:
+    """One category of the unified database behind its module's function names.
+
+    New ids are one more than the category's highest id, so unlike the
+    AUTOINCREMENT tables the id of a deleted last title or review can be
+    handed out again.
+    """
+
+    def __init__(self, name):
+        spec = CATEGORIES[name]
+        self.name = name
+        self.noun = spec["noun"]
+        self.label = spec["label"]
+        self.title_key = spec["title_key"]
+        self.item_key = spec["item_key"]
+        self.genre_substring = spec.get("genre_substring", False)
+        self.returns_ids = spec.get("returns_ids", False)
+        for alias, method in spec["aliases"].items():
+            setattr(self, alias, getattr(self, method))
+
+    def get_connection(self):
+        return get_connection()
+
+    def data_version(self):
+        """Returns a token that changes whenever this category is written."""
+        return storage.data_version(get_connection(), [self.name])
+
+    def add_title(self, title, genre):
+        conn = get_connection()
+        with conn:
+            cursor = conn.execute(
+                'INSERT INTO items (category, id, title, genre) '
+                'SELECT ?, IFNULL(MAX(id), 0) + 1, ?, ? FROM items WHERE category = ?',
+                (self.name, title, genre, self.name))
+            item_id = conn.execute('SELECT id FROM items WHERE key = ?', (cursor.lastrowid,)).fetchone()[0]
+        events.publish(self.name, f"{events.TITLE_EVENTS[self.name]}_added",
+                       {self.item_key: item_id, self.title_key: title, "genre": genre})
+        result = {"message": f"{self.label} '{title}' added successfully."}
+        if self.returns_ids:
+            result[self.noun] = {"id": item_id, "title": title, "genre": genre}
+        return result
+
+    def add_review(self, item_id, rating, note):
+        key = storage.write(
+            DATABASE, get_connection,
+            'INSERT INTO reviews (category, id, item_id, rating, note) '
+            'SELECT ?, IFNULL(MAX(id), 0) + 1, ?, ?, ? FROM reviews WHERE category = ?',
+            (self.name, item_id, rating, note, self.name))
+        review_id = get_connection().execute('SELECT id FROM reviews WHERE key = ?', (key,)).fetchone()[0]
+        events.publish(self.name, "review_added",
+                       {self.item_key: item_id, "review_id": review_id, "rating": rating, "note": note})
+        result = {"message": f"Review added to {self.noun} ID {item_id}."}
+        if self.returns_ids:
+            result["review_id"] = review_id
+        return result
+
+    def edit_review(self, item_id, review_id, rating=None, note=None):
+        conn = get_connection()
+        where = 'WHERE category = ? AND id = ? AND item_id = ?'
+        updated = 0
+        with conn:
+            if rating is not None:
+                updated += conn.execute(f'UPDATE reviews SET rating = ? {where}',
+                                        (rating, self.name, review_id, item_id)).rowcount
+            if note is not None:
+                updated += conn.execute(f'UPDATE reviews SET note = ? {where}',
+                                        (note, self.name, review_id, item_id)).rowcount
+        if updated:
+            events.publish(self.name, "review_edited",
+                           {self.item_key: item_id, "review_id": review_id, "rating": rating, "note": note})
+        return {"message": f"Review ID {review_id} for {self.noun} ID {item_id} updated."}
+
+    def delete_review(self, item_id, review_id):
+        conn = get_connection()
+        with conn:
+            deleted = conn.execute('DELETE FROM reviews WHERE category = ? AND id = ? AND item_id = ?',
+                                   (self.name, review_id, item_id)).rowcount
+        if deleted:
+            events.publish(self.name, "review_deleted", {self.item_key: item_id, "review_id": review_id})
+        return {"message": f"Review ID {review_id} deleted from {self.noun} ID {item_id}."}
+
+    def delete_title(self, item_id):
+        conn = get_connection()
+        with conn:
+            reviews = conn.execute('DELETE FROM reviews WHERE category = ? AND item_id = ?',
+                                   (self.name, item_id)).rowcount
+            deleted = conn.execute('DELETE FROM items WHERE category = ? AND id = ?', (self.name, item_id)).rowcount
+        if deleted:
+            events.publish(self.name, f"{events.TITLE_EVENTS[self.name]}_deleted",
+                           {self.item_key: item_id, "reviews_deleted": reviews})
+        return {"message": f"{self.label} ID {item_id} and its reviews have been deleted."}
+
+    def view_reviews(self):
+        return list(self.iter_reviews())
+
+    def view_reviews_page(self, limit, after=0):
+        """Returns up to `limit` titles with id greater than `after`, with their reviews."""
+        return list(self.iter_reviews(after, limit))
+
+    def iter_reviews(self, after=0, limit=-1):
+        """Yields titles with their reviews one at a time in id order (limit -1 means no limit)."""
+        cursor = get_connection().execute('''
+            SELECT i.id, i.title, i.genre, r.id, r.rating, r.note
+            FROM items i
+            LEFT JOIN reviews r ON r.category = i.category AND r.item_id = i.id
+            WHERE i.category = ? AND i.id > ?
+              AND i.id <= (SELECT MAX(id) FROM (
+                  SELECT id FROM items WHERE category = ? AND id > ? ORDER BY id LIMIT ?))
+            ORDER BY i.id, r.id
+        ''', (self.name, after, self.name, after, limit))
+        return storage.iter_nested_reviews(cursor, self.title_key)
+
+    def view_reviews_json(self, limit=-1, after=0):
+        return list(self.iter_reviews_json(after, limit))
+
+    def iter_reviews_json(self, after=0, limit=-1):
+        """Yields (id, JSON text) for titles with their reviews, as the modules' iter_reviews_json do."""
+        reviews = '''json((
+            SELECT json_group_array(json_object('note', r.note, 'rating', r.rating, 'review_id', r.id))
+            FROM (SELECT id, rating, note FROM reviews WHERE category = i.category AND item_id = i.id ORDER BY id) r))'''
+        return self._json_rows({"genre": "i.genre", "id": "i.id", "reviews": reviews, self.title_key: "i.title"},
+                               after, limit)
+
+    def view_counts_json(self, limit=-1, after=0):
+        return list(self.iter_counts_json(after, limit))
+
+    def iter_counts_json(self, after=0, limit=-1):
+        """Yields (id, JSON text) for titles with their review counts, as books.iter_books_json does."""
+        count = 'SELECT COUNT(*) FROM reviews WHERE category = i.category AND item_id = i.id'
+        return self._json_rows({"genre": "i.genre", "id": "i.id", "reviews": "json('[]')",
+                                "reviews_count": f"({count})", self.title_key: "i.title"}, after, limit)
+
+    def _json_rows(self, fields, after, limit):
+        # Keys in sorted order, as Flask's encoder writes them
+        pairs = ", ".join(f"'{key}', {fields[key]}" for key in sorted(fields))
+        return get_connection().execute(f'''
+            SELECT i.id, json_object({pairs})
+            FROM items i
+            WHERE i.category = ? AND i.id > ?
+            ORDER BY i.id
+            LIMIT ?
+        ''', (self.name, after, limit))
+
+    def view_catalog_page(self, sort="id", descending=False, limit=20, after=None):
+        """Returns a page of titles with their review count and average rating, as
+        the modules' view_catalog_page does."""
+        rows, next_after = storage.catalog_page(get_connection(), "items", "title", "item_id", sort, descending,
+                                                limit, after, scope=(("category", self.name),))
+        return [{"id": row[0], self.title_key: row[1], "genre": row[2], "review_count": row[3] or 0,
+                 "average_rating": row[4]} for row in rows], next_after
+
+    def view_changes_json(self, since, limit):
+        """Returns up to `limit` (version, JSON text) rows for the titles and reviews
+        inserted, updated or deleted after version `since`, as the modules'
+        view_changes_json does."""
+        return storage.changes_json(get_connection(), {
+            "items": (events.TITLE_EVENTS[self.name], {self.title_key: "title", "genre": "genre"}),
+            "reviews": ("review", {self.item_key: "item_id", "rating": "rating", "note": "note"}),
+        }, since, limit, scope=(("category", self.name),))
+
+    def view_counts(self):
+        return list(self.iter_counts())
+
+    def view_counts_page(self, limit, after=0):
+        """Returns up to `limit` titles with id greater than `after`, with review counts."""
+        return list(self.iter_counts(after, limit))
+
+    def iter_counts(self, after=0, limit=-1):
+        """Yields titles with their review counts one at a time in id order, as books.iter_books does."""
+        cursor = get_connection().execute('''
+            SELECT i.id, i.title, i.genre, COUNT(r.id)
+            FROM items i
+            LEFT JOIN reviews r ON r.category = i.category AND r.item_id = i.id
+            WHERE i.category = ? AND i.id > ?
+              AND i.id <= (SELECT MAX(id) FROM (
+                  SELECT id FROM items WHERE category = ? AND id > ? ORDER BY id LIMIT ?))
+            GROUP BY i.id
+            ORDER BY i.id
+        ''', (self.name, after, self.name, after, limit))
+        return (
+            {"id": row[0], self.title_key: row[1], "genre": row[2], "reviews_count": row[3], "reviews": []}
+            for row in cursor
+        )
+
+    def search_reviews(self, item_id):
+        conn = get_connection()
+        item = conn.execute('SELECT id, title, genre FROM items WHERE category = ? AND id = ?',
+                            (self.name, item_id)).fetchone()
+        if not item:
+            return {"error": f"{self.label} not found."}
+        reviews = conn.execute('SELECT id, rating, note FROM reviews WHERE category = ? AND item_id = ? ORDER BY id',
+                               (self.name, item_id))
+        return {
+            "id": item[0],
+            self.title_key: item[1],
+            "genre": item[2],
+            "reviews": [{"review_id": r[0], "rating": r[1], "note": r[2]} for r in reviews]
+        }
+
+    def search_reviews_many(self, item_ids):
+        """search_reviews() for many titles at once, in the order given: one
+        query per storage.IN_CHUNK ids."""
+        conn = get_connection()
+        found = {}
+        for chunk in storage.chunked(item_ids):
+            cursor = conn.execute(f'''
+                SELECT i.id, i.title, i.genre, r.id, r.rating, r.note
+                FROM items i
+                LEFT JOIN reviews r ON r.category = i.category AND r.item_id = i.id
+                WHERE i.category = ? AND i.id IN ({storage.placeholders(len(chunk))})
+                ORDER BY i.id, r.id
+            ''', [self.name] + chunk)
+            found.update((item["id"], item) for item in storage.iter_nested_reviews(cursor, self.title_key))
+        return [found.get(item_id, {"error": f"{self.label} not found."}) for item_id in item_ids]
+
+    def search(self, text, limit=20):
+        """Full-text search over titles, genres and review notes, best bm25 match first."""
+        query = storage.fts_query(text)
+        if query is None:
+            return []
+        cursor = get_connection().execute('''
+            SELECT i.id, i.title, i.genre, MIN(hits.score) AS score
+            FROM (
+                SELECT rowid AS key, bm25(items_fts) AS score
+                FROM items_fts WHERE items_fts MATCH ?
+                UNION ALL
+                SELECT i.key, bm25(reviews_fts)
+                FROM reviews_fts
+                JOIN reviews r ON r.key = reviews_fts.rowid
+                JOIN items i ON i.category = r.category AND i.id = r.item_id
+                WHERE reviews_fts MATCH ?
+            ) hits
+            JOIN items i ON i.key = hits.key
+            WHERE i.category = ?
+            GROUP BY i.key
+            ORDER BY score
+            LIMIT ?
+        ''', (query, query, self.name, limit))
+        return [{"id": row[0], self.title_key: row[1], "genre": row[2], "score": row[3]} for row in cursor]
+
+    def search_by_genre(self, genre):
+        conn = get_connection()
+        if self.genre_substring:
+            cursor = conn.execute('SELECT id, title, genre FROM items WHERE category = ? AND LOWER(genre) LIKE ?',
+                                  (self.name, f"%{genre.lower()}%"))
+        else:
+            cursor = conn.execute('SELECT id, title, genre FROM items WHERE category = ? AND genre = ?',
+                                  (self.name, genre))
+        return [{"id": row[0], self.title_key: row[1], "genre": row[2]} for row in cursor]
+
+    def view_genres(self):
+        cursor = get_connection().execute('SELECT DISTINCT genre FROM items WHERE category = ?', (self.name,))
+        return [row[0] for row in cursor]
+
+    def view_top_reviews(self, limit=3):
+        """Returns the ids of the highest-rated reviews, as movies.view_top_movies does."""
+        cursor = get_connection().execute(
+            'SELECT id FROM reviews WHERE category = ? ORDER BY rating DESC LIMIT ?', (self.name, limit))
+        return [row[0] for row in cursor]
+
+    def view_top_rated(self, limit=3):
+        """Returns the titles with the highest average rating, read from rating_stats."""
+        cursor = get_connection().execute(
+            'SELECT item_id, rating_avg, review_count FROM rating_stats WHERE category = ? '
+            'ORDER BY rating_avg DESC, item_id LIMIT ?', (self.name, limit))
+        return [{self.item_key: row[0], "average_rating": row[1], "review_count": row[2]} for row in cursor]
+
+    def view_top_averages(self):
+        """Returns the top three titles without review counts, as books.view_top_books does."""
+        return [{self.item_key: row[self.item_key], "average_rating": row["average_rating"]}
+                for row in self.view_top_rated(3)]
+
+    def view_summary(self, limit=5):
+        """Returns title and review counts, genres with their title counts and the
+        `limit` best-rated titles, as the modules' view_summary does."""
+        conn = get_connection()
+        titles, reviews = conn.execute(
+            'SELECT (SELECT COUNT(*) FROM items WHERE category = ?), (SELECT COUNT(*) FROM reviews WHERE category = ?)',
+            (self.name, self.name)).fetchone()
+        genres = conn.execute('SELECT genre, COUNT(*) FROM items WHERE category = ? GROUP BY genre ORDER BY genre',
+                              (self.name,))
+        top = conn.execute('''
+            SELECT i.id, i.title, i.genre, s.rating_avg, s.review_count
+            FROM rating_stats s
+            JOIN items i ON i.category = s.category AND i.id = s.item_id
+            WHERE s.category = ?
+            ORDER BY s.rating_avg DESC, s.item_id
+            LIMIT ?
+        ''', (self.name, limit))
+        return {
+            "titles": titles,
+            "reviews": reviews,
+            "genres": [{"genre": row[0], "titles": row[1]} for row in genres],
+            "top_rated": [{"id": row[0], self.title_key: row[1], "genre": row[2], "average_rating": row[3],
+                           "review_count": row[4]} for row in top],
+        }
+
+    def view_rating_stats(self, item_id):
+        """Returns review count, rating sum, min, max and average for one title."""
+        row = get_connection().execute(
+            'SELECT review_count, rating_sum, rating_min, rating_max, rating_avg FROM rating_stats '
+            'WHERE category = ? AND item_id = ?', (self.name, item_id)).fetchone()
+        if not row:
+            return {self.item_key: item_id, "review_count": 0, "rating_sum": 0,
+                    "rating_min": None, "rating_max": None, "average_rating": None}
+        return {self.item_key: item_id, "review_count": row[0], "rating_sum": row[1],
+                "rating_min": row[2], "rating_max": row[3], "average_rating": row[4]}
+
+
+movies = Category("movies")
+tv_shows = Category("tv_shows")
+books = Category("books")
+
+
+# Cross-category queries
+
+def top_rated(limit=10, min_reviews=1):
+    """Returns the best-rated titles of any category, walking the rating_stats
+    average index in order rather than sorting."""
+    cursor = get_connection().execute('''
+        SELECT s.category, s.item_id, i.title, i.genre, s.rating_avg, s.review_count
+        FROM rating_stats s
+        JOIN items i ON i.category = s.category AND i.id = s.item_id
+        WHERE s.review_count >= ?
+        ORDER BY s.rating_avg DESC, s.category, s.item_id
+        LIMIT ?
+    ''', (min_reviews, limit))
+    return [{"category": row[0], "id": row[1], "title": row[2], "genre": row[3],
+             "average_rating": row[4], "review_count": row[5]} for row in cursor]
+
+
+def reviews_by_genre(genre, limit=100):
+    """Returns reviews of titles in `genre` across all categories, grouped by title."""
+    cursor = get_connection().execute('''
+        SELECT i.category, i.id, i.title, r.id, r.rating, r.note
+        FROM items i
+        JOIN reviews r ON r.category = i.category AND r.item_id = i.id
+        WHERE i.genre = ?
+        ORDER BY i.category, i.id, r.id
+        LIMIT ?
+    ''', (genre, limit))
+    return [{"category": row[0], "id": row[1], "title": row[2],
+             "review_id": row[3], "rating": row[4], "note": row[5]} for row in cursor]
+
+
+def genre_summary(limit=-1):
+    """Returns per-genre title and review counts and average rating across all categories."""
+    cursor = get_connection().execute('''
+        SELECT i.genre, COUNT(*), IFNULL(SUM(s.review_count), 0),
+               SUM(s.rating_sum) * 1.0 / SUM(s.review_count)
+        FROM items i
+        LEFT JOIN rating_stats s ON s.category = i.category AND s.item_id = i.id
+        GROUP BY i.genre
+        ORDER BY i.genre
+        LIMIT ?
+    ''', (limit,))
+    return [{"genre": row[0], "titles": row[1], "review_count": row[2], "average_rating": row[3]}
+            for row in cursor]
+
+
+# Migration from the per-category databases
+
+def migrate_files(target=None, sources=None):
+    """Copies titles and reviews, keeping their ids, from the per-category
+    database files into the unified database at `target` (default DATABASE).
+
+    `sources` maps category to database path and defaults to the modules'
+    DATABASE paths; missing files are skipped. Everything is copied in one
+    transaction, and a category the target already holds is refused so the
+    copy can't run twice. Returns {category: {"titles": n, "reviews": n}}.
+    """
+    target = target or DATABASE
+    if sources is None:
+        sources = {category: spec[0].DATABASE for category, spec in SOURCES.items()}
+    sources = {category: path for category, path in sources.items() if os.path.exists(path)}
+    connection = sqlite3.connect(target)
+    try:
+        migrations.upgrade_unified(connection)
+        for category in sources:
+            if connection.execute('SELECT 1 FROM items WHERE category = ? LIMIT 1', (category,)).fetchone():
+                raise ValueError(f"{target} already holds {category}")
+        # ATTACH is not allowed inside a transaction, so attach every source first
+        for category, path in sources.items():
+            connection.execute(f'ATTACH DATABASE ? AS source_{category}', (path,))
+        counts = {}
+        with connection:
+            for category in sources:
+                _, table, title_column, item_column = SOURCES[category]
+                titles = connection.execute(
+                    f'INSERT INTO main.items (category, id, title, genre) '
+                    f'SELECT ?, id, {title_column}, genre FROM source_{category}.{table} ORDER BY id',
+                    (category,)).rowcount
+                reviews = connection.execute(
+                    f'INSERT INTO main.reviews (category, id, item_id, rating, note) '
+                    f'SELECT ?, id, {item_column}, rating, note FROM source_{category}.reviews ORDER BY id',
+                    (category,)).rowcount
+                counts[category] = {"titles": titles, "reviews": reviews}
+        for category in sources:
+            connection.execute(f'DETACH DATABASE source_{category}')
+        return counts
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy the movies, TV shows and books databases into one database")
+    parser.add_argument("--target", default=DATABASE)
+    for category, spec in SOURCES.items():
+        parser.add_argument(f"--{category.replace('_', '-')}", dest=category, default=spec[0].DATABASE)
+    args = parser.parse_args()
+    counts = migrate_files(args.target, {category: getattr(args, category) for category in SOURCES})
+    for category, copied in counts.items():
+        print(f"{category}: {copied['titles']} titles, {copied['reviews']} reviews")
+
+
+if __name__ == "__main__":
+    main()
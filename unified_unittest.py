@@ -0,0 +1,113 @@
+# Unit Tests for the unified single-database store and its migration tool
+
+import os
+import unittest
+import books
+import cache
+import movies
+import storage
+import tv_shows
+import unified
+
+TEST_DATABASE = 'test_unified.db'
+SOURCE_DATABASES = {"movies": 'test_unified_movies.db', "tv_shows": 'test_unified_tv_shows.db',
+                    "books": 'test_unified_books.db'}
+
+class TestUnified(unittest.TestCase):
+
+    def setUp(self):
+        """Pointing every store at fresh test databases."""
+        cache.configure(backend=cache.NullCache())
+        self.saved = (unified.DATABASE, movies.DATABASE, tv_shows.DATABASE, books.DATABASE)
+        unified.DATABASE = TEST_DATABASE
+        movies.DATABASE = SOURCE_DATABASES["movies"]
+        tv_shows.DATABASE = SOURCE_DATABASES["tv_shows"]
+        books.DATABASE = SOURCE_DATABASES["books"]
+
+    def tearDown(self):
+        storage.close_all()
+        for path in [TEST_DATABASE, *SOURCE_DATABASES.values()]:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+        unified.DATABASE, movies.DATABASE, tv_shows.DATABASE, books.DATABASE = self.saved
+        cache.configure()
+
+    def exercise(self, module, add_title, delete_title):
+        """Runs the same writes through a module and returns what its reads see."""
+        add_title("Inception", "Sci-Fi")
+        add_title("Heat", "Crime")
+        add_title("Alien", "Sci-Fi")
+        module.add_review(1, 5, "Mind-bending")
+        module.add_review(1, 3, "Confusing")
+        module.add_review(2, 4, "Tense")
+        module.add_review(3, 2, "Scary")
+        module.edit_review(1, 2, rating=4)
+        module.delete_review(3, 4)
+        delete_title(2)
+        return [module.search_reviews(1), module.search_reviews(2), module.view_reviews_page(1, 0),
+                module.search("mind"), module.search_by_genre("Sci-Fi"),
+                module.view_top_rated(), module.view_rating_stats(1)]
+
+    def test_categories_match_their_modules(self):
+        """Testing that each category returns what the per-file module returns."""
+        self.assertEqual(self.exercise(movies, movies.add_movie, movies.delete_movie),
+                         self.exercise(unified.movies, unified.movies.add_movie, unified.movies.delete_movie))
+        self.assertEqual(self.exercise(tv_shows, tv_shows.add_show, tv_shows.delete_show),
+                         self.exercise(unified.tv_shows, unified.tv_shows.add_show, unified.tv_shows.delete_show))
+
+    def test_books_return_new_ids(self):
+        """Testing that the books category keeps books.py's return values."""
+        self.assertEqual(unified.books.add_book("Dune", "Science Fiction")["book"]["id"], 1)
+        self.assertEqual(unified.books.add_review(1, 5, "Epic")["review_id"], 1)
+        self.assertEqual(unified.books.view_books()[0]["reviews_count"], 1)
+        self.assertEqual([b["title"] for b in unified.books.search_by_genre("fiction")], ["Dune"])
+
+    def test_categories_have_separate_ids_and_versions(self):
+        """Testing that ids and change counters are kept per category."""
+        unified.movies.add_movie("Inception", "Sci-Fi")
+        books_version = unified.books.data_version()
+        movies_version = unified.movies.data_version()
+        unified.books.add_book("Dune", "Sci-Fi")
+        self.assertEqual(unified.books.search_reviews(1)["title"], "Dune")
+        self.assertEqual(unified.movies.search_reviews(1)["name"], "Inception")
+        self.assertNotEqual(unified.books.data_version(), books_version)
+        self.assertEqual(unified.movies.data_version(), movies_version)
+
+    def test_cross_category_queries(self):
+        """Testing top-rated and by-genre queries across all categories."""
+        unified.movies.add_movie("Inception", "Sci-Fi")
+        unified.tv_shows.add_show("Dark", "Sci-Fi")
+        unified.books.add_book("Dune", "Sci-Fi")
+        unified.movies.add_review(1, 3, "Fine")
+        unified.tv_shows.add_review(1, 5, "Brilliant")
+        unified.books.add_review(1, 4, "Epic")
+        self.assertEqual([(t["category"], t["title"]) for t in unified.top_rated(2)],
+                         [("tv_shows", "Dark"), ("books", "Dune")])
+        self.assertEqual([r["note"] for r in unified.reviews_by_genre("Sci-Fi")], ["Epic", "Fine", "Brilliant"])
+        self.assertEqual(unified.genre_summary(),
+                         [{"genre": "Sci-Fi", "titles": 3, "review_count": 3, "average_rating": 4.0}])
+        plan = " ".join(row[3] for row in unified.get_connection().execute(
+            "EXPLAIN QUERY PLAN SELECT category, item_id FROM rating_stats ORDER BY rating_avg DESC, category, item_id"))
+        self.assertIn("idx_rating_stats_avg", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_migrate_files_copies_with_ids(self):
+        """Testing that the migration tool moves every file across once, keeping ids."""
+        movies.add_movie("Inception", "Sci-Fi")
+        movies.add_movie("Heat", "Crime")
+        movies.delete_movie(1)
+        movies.add_review(2, 4, "Tense")
+        tv_shows.add_show("Dark", "Sci-Fi")
+        storage.close_all()
+        counts = unified.migrate_files(TEST_DATABASE, SOURCE_DATABASES)
+        self.assertEqual(counts, {"movies": {"titles": 1, "reviews": 1}, "tv_shows": {"titles": 1, "reviews": 0}})
+        self.assertEqual(unified.movies.search_reviews(2)["reviews"][0]["note"], "Tense")
+        self.assertEqual(unified.movies.view_rating_stats(2)["average_rating"], 4.0)
+        self.assertEqual(unified.movies.search("tense")[0]["id"], 2)
+        storage.close_all()
+        with self.assertRaises(ValueError):
+            unified.migrate_files(TEST_DATABASE, SOURCE_DATABASES)
+
+if __name__ == '__main__':
+    unittest.main()